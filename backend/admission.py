@@ -0,0 +1,184 @@
+# backend/admission.py
+"""
+Admission control for inference endpoints
+Each client (X-Client-ID header, else the study's patient, else the remote
+address) draws from its own token bucket, so one client backfilling studies
+is throttled with 429 before it can crowd out everyone else. Buckets live
+in memory for a single worker or in a shared SQLite table when several
+workers must enforce one limit. Admitted requests carry the client's
+fair-share weight into the inference scheduler.
+"""
+
+import os
+import time
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from store import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+# Sustained analyses per second and burst size for a client of weight 1 (rate 0 disables limiting)
+RATE_LIMIT_RATE = float(os.environ.get("RAD_ETHIX_RATE_LIMIT_RATE", "1.0"))
+RATE_LIMIT_BURST = float(os.environ.get("RAD_ETHIX_RATE_LIMIT_BURST", "20"))
+# "memory" (per worker) or "sqlite" (shared by every worker on the host)
+RATE_LIMIT_BACKEND = os.environ.get("RAD_ETHIX_RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_DB_PATH = os.environ.get("RAD_ETHIX_RATE_LIMIT_DB_PATH", os.path.join(DATA_DIR, "rate_limits.sqlite3"))
+# Fair-share weights by client ID, e.g. "dashboard=4,backfill=0.5"; others weigh 1
+CLIENT_WEIGHTS = os.environ.get("RAD_ETHIX_CLIENT_WEIGHTS", "")
+
+MAX_TRACKED_CLIENTS = 10000
+
+
+def parse_weights(spec):
+    """{client_id: weight} from "a=2,b=0.5"; raises ValueError on malformed or non-positive weights"""
+    weights = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        client, _, value = item.partition("=")
+        weight = float(value)
+        if not client.strip() or weight <= 0:
+            raise ValueError(f"Invalid client weight {item!r}")
+        weights[client.strip()] = weight
+    return weights
+
+
+def client_key(client_id=None, patient_id=None, remote_addr=None):
+    """Bucket / fair-share key of a request, most specific identity first"""
+    if client_id:
+        return f"client:{client_id.strip()}"
+    if patient_id:
+        return f"patient:{patient_id}"
+    return f"addr:{remote_addr or 'unknown'}"
+
+
+def _refill(tokens, updated, now, rate, burst):
+    return min(burst, tokens + max(0.0, now - updated) * rate)
+
+
+class MemoryBuckets:
+    """Token buckets in this process; the least recently seen client is evicted when the table is full"""
+
+    def __init__(self, max_clients=MAX_TRACKED_CLIENTS):
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()   # key -> [tokens, updated]
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost=1.0, now=None):
+        """(admitted, seconds until `cost` tokens are available)"""
+        now = time.time() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = _refill(tokens, updated, now, rate, burst)
+            admitted = tokens >= cost
+            if admitted:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)   # least recently seen
+        return admitted, 0.0 if admitted else (cost - tokens) / rate
+
+
+class SQLiteBuckets:
+    """Token buckets in a SQLite table, so every worker on the host draws from the same buckets"""
+
+    def __init__(self, db_path=RATE_LIMIT_DB_PATH):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def take(self, key, rate, burst, cost=1.0, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens = _refill(*row, now, rate, burst) if row else burst
+                admitted = tokens >= cost
+                if admitted:
+                    tokens -= cost
+                self._conn.execute(
+                    "INSERT INTO buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                    "ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                    (key, tokens, now)
+                )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return admitted, 0.0 if admitted else (cost - tokens) / rate
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class AdmissionController:
+    """Per-client rate limits and fair-share weights, with admitted/throttled counts"""
+
+    def __init__(self, rate=RATE_LIMIT_RATE, burst=RATE_LIMIT_BURST, backend=None, weights=None):
+        self.rate = rate
+        self.burst = burst
+        self.backend = backend or MemoryBuckets()
+        self.weights = parse_weights(CLIENT_WEIGHTS) if weights is None else dict(weights)
+        self.admitted = 0
+        self.throttled = 0
+        self.by_client = OrderedDict()   # key -> {"admitted", "throttled"}, most recent last
+        self._lock = threading.Lock()
+
+    def weight(self, key):
+        """Fair-share weight of a client key (only X-Client-ID clients can be weighted)"""
+        kind, _, name = key.partition(":")
+        return self.weights.get(name, 1.0) if kind == "client" else 1.0
+
+    def admit(self, key, cost=1.0):
+        """(admitted, retry_after seconds); the bucket's rate and size scale with the client's weight"""
+        if self.rate <= 0:
+            admitted, retry_after = True, 0.0
+        else:
+            weight = self.weight(key)
+            admitted, retry_after = self.backend.take(key, self.rate * weight, max(self.burst * weight, cost), cost)
+        with self._lock:
+            counts = self.by_client.pop(key, None) or {"admitted": 0, "throttled": 0}
+            counts["admitted" if admitted else "throttled"] += 1
+            self.by_client[key] = counts
+            while len(self.by_client) > MAX_TRACKED_CLIENTS:
+                self.by_client.popitem(last=False)
+            if admitted:
+                self.admitted += 1
+            else:
+                self.throttled += 1
+        return admitted, retry_after
+
+    def stats(self, top=20):
+        with self._lock:
+            clients = sorted(self.by_client.items(), key=lambda kv: -(kv[1]["admitted"] + kv[1]["throttled"]))[:top]
+            return {
+                "rate_per_second": self.rate,
+                "burst": self.burst,
+                "backend": type(self.backend).__name__,
+                "admitted": self.admitted,
+                "throttled": self.throttled,
+                "weights": dict(self.weights),
+                "clients": {key: {**counts, "weight": self.weight(key)} for key, counts in clients}
+            }
+
+
+def create_admission_controller():
+    """Controller for the configured backend (RAD_ETHIX_RATE_LIMIT_BACKEND)"""
+    if RATE_LIMIT_BACKEND == "sqlite":
+        backend = SQLiteBuckets()
+        logger.info(f"🚦 Rate limits shared through {backend.db_path}")
+    elif RATE_LIMIT_BACKEND == "memory":
+        backend = MemoryBuckets()
+    else:
+        raise ValueError(f"Unknown rate limit backend {RATE_LIMIT_BACKEND!r}; use 'memory' or 'sqlite'")
+    return AdmissionController(backend=backend)
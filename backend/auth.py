@@ -1,27 +1,22 @@
 # backend/auth.py
 """
-Simple authentication system (hardcoded for demo)
-In production, use proper database and password hashing
+Simple patient-ID authentication backed by the clinical store
+In production, add proper credentials and password hashing
 """
 
-from fastapi import APIRouter, HTTPException
+import os
+import hmac
+from fastapi import APIRouter, HTTPException, Header
 from pydantic import BaseModel
 from typing import Optional
+from starlette.concurrency import run_in_threadpool
 
-router = APIRouter()
+from store import get_store
 
-# Hardcoded user database
-USERS_DB = {
-    "PES1UG24CS053": {
-        "patient_id": "PES1UG24CS053",
-        "name": "Amogh",
-        "age": 19,
-        "gender": "Male"
-    }
-}
+router = APIRouter()
 
-# Store additional registered users (in-memory for demo)
-registered_users = {}
+# Token guarding operational (/admin) endpoints; admin endpoints are disabled when unset
+ADMIN_TOKEN = os.environ.get("RAD_ETHIX_ADMIN_TOKEN")
 
 
 class SignupRequest(BaseModel):
@@ -45,22 +40,8 @@ class UserResponse(BaseModel):
 async def signup(request: SignupRequest):
     """Register a new patient"""
     
-    # Generate new patient ID
-    existing_count = len(USERS_DB) + len(registered_users)
-    new_id = f"PES1UG24CS{str(existing_count + 54).zfill(3)}"
-    
-    # Create new user
-    new_user = {
-        "patient_id": new_id,
-        "name": request.name,
-        "age": request.age,
-        "gender": request.gender
-    }
-    
-    # Store in registered users
-    registered_users[new_id] = new_user
-    
-    return new_user
+    # The ID comes from a sequence in the shared store, so workers never collide
+    return await run_in_threadpool(get_store().create_patient, request.name, request.age, request.gender)
 
 
 @router.post("/login", response_model=UserResponse)
@@ -69,13 +50,9 @@ async def login(request: LoginRequest):
     
     patient_id = request.patient_id.upper().strip()
     
-    # Check in main DB
-    if patient_id in USERS_DB:
-        return USERS_DB[patient_id]
-    
-    # Check in registered users
-    if patient_id in registered_users:
-        return registered_users[patient_id]
+    user = await run_in_threadpool(get_store().get_patient, patient_id)
+    if user:
+        return user
     
     # User not found
     raise HTTPException(status_code=404, detail="Patient ID not found")
@@ -87,10 +64,18 @@ async def verify_patient(patient_id: str):
     
     patient_id = patient_id.upper().strip()
     
-    if patient_id in USERS_DB:
-        return USERS_DB[patient_id]
+    user = await run_in_threadpool(get_store().get_patient, patient_id)
+    if user:
+        return user
+    
+    raise HTTPException(status_code=404, detail="Patient ID not found")
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Dependency guarding admin endpoints with the X-Admin-Token header"""
     
-    if patient_id in registered_users:
-        return registered_users[patient_id]
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
     
-    raise HTTPException(status_code=404, detail="Patient ID not found")
\ No newline at end of file
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
@@ -0,0 +1,5 @@
+# backend/benchmarks/__init__.py
+"""
+Offline benchmarks for RAD-ETHIX
+Run from the backend directory, e.g. `python -m benchmarks.run_benchmarks`
+"""
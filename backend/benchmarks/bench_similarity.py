@@ -0,0 +1,117 @@
+# backend/benchmarks/bench_similarity.py
+"""
+Similar-case index benchmark
+
+Bulk-loads clustered synthetic embeddings into a throwaway SimilarityIndex,
+then measures query latency and recall@k against exact search for several
+nprobe values:
+
+    python -m benchmarks.bench_similarity --vectors 1000000 --nprobe 4 8 16 32
+"""
+
+import sys
+import json
+import time
+import argparse
+import logging
+import tempfile
+
+import numpy as np
+
+from similarity import SimilarityIndex, normalize
+from benchmarks.common import summarize, environment_info
+
+logger = logging.getLogger("bench_similarity")
+
+
+def synthetic_embeddings(count, dim, clusters, seed=0, chunk=100000):
+    """Yield (ids, vectors) chunks of clustered unit vectors, like embeddings of similar-looking studies"""
+    rng = np.random.default_rng(seed)
+    centers = normalize(rng.normal(size=(clusters, dim)))
+    for start in range(0, count, chunk):
+        n = min(chunk, count - start)
+        vectors = centers[rng.integers(0, clusters, n)] + rng.normal(scale=0.5 / np.sqrt(dim), size=(n, dim))
+        yield [f"{i:032x}" for i in range(start, start + n)], normalize(vectors)
+
+
+def exact_search(index, query, k, chunk=262144):
+    """Brute-force top-k row numbers over every stored vector"""
+    best_rows, best_scores = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    for start in range(0, index.count, chunk):
+        block = np.asarray(index._vectors[start:start + chunk], dtype=np.float32) @ query
+        rows = np.concatenate([best_rows, np.arange(start, start + len(block))])
+        scores = np.concatenate([best_scores, block])
+        top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+        best_rows, best_scores = rows[top], scores[top]
+    return {index._ids[row].decode() for row in best_rows}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="RAD-ETHIX similar-case index benchmark")
+    parser.add_argument("--vectors", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--clusters", type=int, default=500, help="Synthetic embedding clusters")
+    parser.add_argument("--nprobe", nargs="+", type=int, default=[4, 8, 16, 32])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--recall-queries", type=int, default=20, help="Queries checked against exact search")
+    parser.add_argument("--output", default="bench_similarity_output.json")
+    return parser.parse_args(argv)
+
+
+def main_cli(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args(argv)
+    rng = np.random.default_rng(1)
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = SimilarityIndex(tmp, args.dim, min_train=args.vectors + 1)
+
+        start = time.perf_counter()
+        for ids, vectors in synthetic_embeddings(args.vectors, args.dim, args.clusters):
+            index.add_batch(ids, vectors)
+        load_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index.train()
+        train_time = time.perf_counter() - start
+        logger.info(f"🧭 Loaded {args.vectors} vectors in {load_time:.1f}s, trained in {train_time:.1f}s")
+
+        rows = rng.choice(index.count, args.queries, replace=False)
+        queries = [np.asarray(index._vectors[row], dtype=np.float32) for row in rows]
+        truth = [exact_search(index, q, args.k) for q in queries[:args.recall_queries]]
+
+        for nprobe in args.nprobe:
+            latencies, hits = [], 0
+            for i, query in enumerate(queries):
+                t0 = time.perf_counter()
+                found = index.search(query, args.k, nprobe=nprobe)
+                latencies.append(time.perf_counter() - t0)
+                if i < len(truth):
+                    hits += len({study_id for study_id, _ in found} & truth[i])
+            stats = summarize(latencies)
+            stats["recall_at_k"] = hits / (len(truth) * args.k) if truth else None
+            results.append({"name": "similarity.search", "params": {"nprobe": nprobe, "k": args.k}, **stats})
+            logger.info(
+                f"nprobe={nprobe:3d} p50={stats['p50'] * 1000:.2f}ms p95={stats['p95'] * 1000:.2f}ms "
+                f"recall@{args.k}={stats['recall_at_k']:.3f}"
+            )
+
+        build = {"vectors": args.vectors, "dim": args.dim, "load_s": load_time, "train_s": train_time,
+                 "index": index.status()}
+
+    report = {
+        "environment": environment_info(),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "build": build,
+        "results": results
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"✅ Wrote similarity benchmark results to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,142 @@
+# backend/benchmarks/bench_startup.py
+"""
+Cold-start benchmark for the API processes
+
+Every measurement runs in a fresh interpreter: the import time and peak RSS
+of each module, the slowest top-level imports under it (python -X importtime),
+and the time from launching uvicorn until /health answers:
+
+    python -m benchmarks.bench_startup --modules light_main main --apps light_main:app --repeat 5
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import logging
+import tempfile
+import subprocess
+import urllib.request
+
+from benchmarks.common import summarize, environment_info
+
+logger = logging.getLogger("bench_startup")
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_PROBE = (
+    "import time, resource; start = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+)
+
+
+def _env(data_dir):
+    # A throwaway data dir, so probes never touch (or wait on) the real runtime state
+    return {**os.environ, "RAD_ETHIX_DATA_DIR": data_dir, "PYTHONDONTWRITEBYTECODE": "1"}
+
+
+def import_cost(module, repeat, data_dir):
+    """(seconds samples, peak RSS MB samples) of `import module` in fresh interpreters"""
+    seconds, rss = [], []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE.format(module=module)], cwd=BACKEND_DIR, env=_env(data_dir),
+            capture_output=True, text=True, check=True
+        ).stdout.split()
+        seconds.append(float(out[-2]))
+        rss.append(int(out[-1]) / 1024.0)  # ru_maxrss is in KB on Linux
+    return seconds, rss
+
+
+def import_breakdown(module, data_dir, top=10):
+    """Slowest direct imports of `module` (cumulative seconds), from python -X importtime"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=BACKEND_DIR, env=_env(data_dir),
+        capture_output=True, text=True, check=True
+    ).stderr
+    children = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Direct children are indented by exactly two spaces
+        if name.startswith("   ") and not name.startswith("    "):
+            children.append((name.strip(), int(cumulative) / 1e6))
+    return dict(sorted(children, key=lambda kv: -kv[1])[:top])
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def time_to_ready(app, data_dir, timeout=300.0):
+    """Seconds from launching `uvicorn app` until GET /health returns 200"""
+    port = _free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=_env(data_dir), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"{app} exited with status {server.returncode} before becoming ready")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as resp:
+                    if resp.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.02)
+        raise TimeoutError(f"{app} not ready after {timeout:.0f}s")
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def run_startup(modules, apps, repeat):
+    """Result entries in the run_benchmarks format"""
+    results = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        for module in modules:
+            seconds, rss = import_cost(module, repeat, data_dir)
+            results.append({
+                "name": "startup.import", "params": {"module": module}, **summarize(seconds),
+                "peak_rss_mb": round(max(rss), 1), "slowest_imports_s": import_breakdown(module, data_dir)
+            })
+            logger.info(f"📦 import {module}: {summarize(seconds)['p50']:.2f}s, {max(rss):.0f} MB")
+        for app in apps:
+            samples = [time_to_ready(app, data_dir) for _ in range(repeat)]
+            results.append({"name": "startup.ready", "params": {"app": app}, **summarize(samples)})
+            logger.info(f"🚀 {app} ready in {summarize(samples)['p50']:.2f}s")
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="RAD-ETHIX cold-start benchmark")
+    parser.add_argument("--modules", nargs="+", default=["light_main", "main"], help="Modules to import")
+    parser.add_argument("--apps", nargs="+", default=["light_main:app"],
+                        help="uvicorn apps to time until /health answers (main:app also loads the models)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default="bench_startup_output.json")
+    return parser.parse_args(argv)
+
+
+def main_cli(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args(argv)
+    report = {"environment": environment_info(), "results": run_startup(args.modules, args.apps, args.repeat)}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"✅ Wrote startup benchmark results to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
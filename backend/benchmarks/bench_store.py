@@ -0,0 +1,141 @@
+# backend/benchmarks/bench_store.py
+"""
+Concurrent load benchmark for the clinical store
+
+Seeds a throwaway database with patients and study histories, then runs a
+mix of login/verify lookups, study-history queries and study inserts from a
+thread pool at each concurrency level:
+
+    python -m benchmarks.bench_store --patients 2000 --studies 20 --threads 1 4 16
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import logging
+import tempfile
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from store import ClinicalStore
+from benchmarks.common import summarize, environment_info
+
+logger = logging.getLogger("bench_store")
+
+DAY = 86400.0
+
+
+def seed_store(store, patients, studies_per_patient, seed=0):
+    """Register patients and give each a history of studies with random probability vectors"""
+    rng = random.Random(seed)
+    patient_ids = []
+    now = time.time()
+    for i in range(patients):
+        patient = store.create_patient(f"Patient {i}", rng.randint(18, 90), "Female" if i % 2 else "Male")
+        patient_ids.append(patient["patient_id"])
+        for j in range(studies_per_patient):
+            store.record_study(
+                patient["patient_id"], f"study_{j}.png", None, [rng.random() for _ in range(18)],
+                overall_confidence=rng.random(), created_at=now - (studies_per_patient - j) * DAY
+            )
+    return patient_ids
+
+
+def run_level(store, patient_ids, threads, operations, mix, history_limit):
+    """Run `operations` store calls from `threads` workers; returns per-operation latency stats"""
+    latencies = defaultdict(list)
+    lock = threading.Lock()
+    names, weights = zip(*mix.items())
+    rng = random.Random(threads)
+    plan = [(rng.choices(names, weights)[0], rng.choice(patient_ids)) for _ in range(operations)]
+    vector = [0.1] * 18
+
+    def one(op, patient_id):
+        start = time.perf_counter()
+        if op == "login":
+            store.get_patient(patient_id)
+        elif op == "history":
+            store.study_history(patient_id, limit=history_limit)
+        else:
+            store.record_study(patient_id, "bench.png", None, vector)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies[op].append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda item: one(*item), plan))
+    wall = time.perf_counter() - start
+
+    results = {}
+    for op, samples in latencies.items():
+        stats = summarize(samples)
+        stats["throughput"] = len(samples) / wall
+        results[op] = stats
+    return results, operations / wall
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, weight = part.split("=")
+        if name not in ("login", "history", "insert"):
+            raise ValueError(f"Unknown operation: {name}")
+        mix[name] = float(weight)
+    return mix
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="RAD-ETHIX clinical store benchmark")
+    parser.add_argument("--patients", type=int, default=1000)
+    parser.add_argument("--studies", type=int, default=20, help="Studies per seeded patient")
+    parser.add_argument("--threads", nargs="+", type=int, default=[1, 4, 8, 16])
+    parser.add_argument("--operations", type=int, default=5000, help="Store calls per concurrency level")
+    parser.add_argument("--mix", default="login=6,history=3,insert=1", help="Operation weights")
+    parser.add_argument("--history-limit", type=int, default=20)
+    parser.add_argument("--pool-size", type=int, default=8)
+    parser.add_argument("--db", help="Database path (default: a temporary file)")
+    parser.add_argument("--output", default="bench_store_output.json")
+    return parser.parse_args(argv)
+
+
+def main_cli(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args(argv)
+    mix = parse_mix(args.mix)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ClinicalStore(args.db or os.path.join(tmp, "bench.sqlite3"), pool_size=args.pool_size)
+        logger.info(f"🗄️ Seeding {args.patients} patients x {args.studies} studies...")
+        patient_ids = seed_store(store, args.patients, args.studies)
+
+        levels = []
+        for threads in args.threads:
+            operations, total_throughput = run_level(
+                store, patient_ids, threads, args.operations, mix, args.history_limit
+            )
+            levels.append({"threads": threads, "throughput": total_throughput, "operations": operations})
+            logger.info(
+                f"threads={threads:3d} {total_throughput:8.0f} ops/s  " + "  ".join(
+                    f"{op} p95={stats['p95'] * 1000:.2f}ms" for op, stats in sorted(operations.items())
+                )
+            )
+        store.close()
+
+    report = {
+        "environment": environment_info(),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "levels": levels
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"✅ Wrote store benchmark results to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
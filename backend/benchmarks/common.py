@@ -0,0 +1,159 @@
+# backend/benchmarks/common.py
+"""
+Shared helpers for the benchmark suite: synthetic radiographs,
+random-weight backbones, timing and result files
+"""
+
+import io
+import json
+import time
+import platform
+import statistics
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+import torchvision
+import torchxrayvision as xrv
+from PIL import Image
+
+
+# ==================== SYNTHETIC DATA ====================
+def synthetic_radiograph(size=1024, seed=0):
+    """Chest-like grayscale image: bright mediastinum and ribs, dark lung fields, noise"""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:size, 0:size].astype(np.float32) / size
+
+    img = np.full((size, size), 0.75, dtype=np.float32)
+
+    # Two dark lung fields
+    for cx in (0.3, 0.7):
+        lung = ((xx - cx) / 0.17) ** 2 + ((yy - 0.5) / 0.32) ** 2 < 1.0
+        img[lung] = 0.25
+
+    # Mediastinum / spine and rib shadows
+    img += 0.35 * np.exp(-((xx - 0.5) / 0.06) ** 2)
+    img += 0.08 * (np.sin(yy * 40 * np.pi) > 0.6)
+
+    img += rng.normal(0, 0.04, size=img.shape).astype(np.float32)
+    return (np.clip(img, 0, 1) * 255).astype(np.uint8)
+
+
+def synthetic_png_bytes(size=1024, seed=0):
+    buffer = io.BytesIO()
+    Image.fromarray(synthetic_radiograph(size, seed)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def synthetic_predictions(seed=0, key="disease"):
+    """Random prediction dicts in the shape the report generators consume"""
+    rng = np.random.default_rng(seed)
+    confidences = rng.uniform(0, 1, size=len(xrv.datasets.default_pathologies))
+    return [
+        {
+            key: disease,
+            "confidence": float(conf),
+            "severity": "High" if conf >= 0.7 else "Moderate" if conf >= 0.5 else "Low",
+            "agreement": float(rng.uniform(0.7, 1.0))
+        }
+        for disease, conf in zip(xrv.datasets.default_pathologies, confidences)
+    ]
+
+
+# ==================== RANDOM-WEIGHT BACKBONES ====================
+class RandomResNet50(torch.nn.Module):
+    """Random-weight stand-in for xrv.models.ResNet(weights="resnet50-res512-all")"""
+
+    def __init__(self, resolution=512):
+        super().__init__()
+        self.resolution = resolution
+        self.model = torchvision.models.resnet50(num_classes=len(xrv.datasets.default_pathologies))
+
+    def forward(self, x):
+        x = x.repeat(1, 3, 1, 1)
+        if x.shape[-1] != self.resolution:
+            x = F.interpolate(x, size=(self.resolution, self.resolution), mode="bilinear", align_corners=False)
+        return self.model(x)
+
+
+def random_weight_models():
+    """The three ensemble members with the production architectures but random weights"""
+    torch.manual_seed(0)
+    return {
+        "densenet121": xrv.models.DenseNet(weights=None),
+        "resnet50": RandomResNet50(),
+        "efficientnet": xrv.models.DenseNet(weights=None)
+    }
+
+
+# ==================== TIMING ====================
+def summarize(samples, unit="s", items_per_call=1):
+    samples = sorted(samples)
+    mean = statistics.fmean(samples)
+    return {
+        "unit": unit,
+        "runs": len(samples),
+        "mean": mean,
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "min": samples[0],
+        "p50": percentile(samples, 50),
+        "p95": percentile(samples, 95),
+        "throughput": items_per_call / mean if mean > 0 else None
+    }
+
+
+def percentile(sorted_samples, pct):
+    if not sorted_samples:
+        return None
+    k = (len(sorted_samples) - 1) * pct / 100.0
+    lo, hi = int(np.floor(k)), int(np.ceil(k))
+    return sorted_samples[lo] + (sorted_samples[hi] - sorted_samples[lo]) * (k - lo)
+
+
+def measure(fn, repeat=10, warmup=2, items_per_call=1):
+    """Time fn() repeat times after warmup calls"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples, items_per_call=items_per_call)
+
+
+# ==================== RESULT FILES ====================
+def environment_info():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "torch": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "cuda": torch.cuda.is_available(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")
+    }
+
+
+def result_key(result):
+    return result["name"] + json.dumps(result.get("params", {}), sort_keys=True)
+
+
+def compare_results(current, baseline, tolerance=0.1):
+    """Compare mean timings against a baseline file, returning regressions"""
+    baseline_by_key = {result_key(r): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in current.get("results", []):
+        previous = baseline_by_key.get(result_key(result))
+        if not previous or not previous.get("mean"):
+            continue
+        change = (result["mean"] - previous["mean"]) / previous["mean"]
+        if change > tolerance:
+            regressions.append({
+                "name": result["name"],
+                "params": result.get("params", {}),
+                "baseline_mean": previous["mean"],
+                "current_mean": result["mean"],
+                "change": change
+            })
+    return regressions
@@ -0,0 +1,315 @@
+# backend/benchmarks/loadtest.py
+"""
+Load generator for the FastAPI app
+
+Replays a directory of X-rays against /predict mixed with /auth/login and
+/generate-report traffic, sweeping concurrency (closed loop) or request
+rate (open loop). Drives the ASGI app in-process by default, or a running
+server with --url.
+
+    python -m benchmarks.loadtest --concurrency 1 2 4 8 --duration 30
+    python -m benchmarks.loadtest --url http://127.0.0.1:8000 --rps 0.5 1 2 --images ./xrays
+
+Start a target server with RAD_ETHIX_RESULT_CACHE_SIZE=0 so replayed images are not served from cache.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import logging
+from collections import defaultdict
+
+from benchmarks.common import synthetic_png_bytes, synthetic_predictions, percentile, environment_info
+
+logger = logging.getLogger("loadtest")
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+LOOP_LAG_INTERVAL = 0.01
+
+
+def load_images(directory):
+    """Read every X-ray in a directory once, falling back to synthetic images"""
+    if directory:
+        images = []
+        for name in sorted(os.listdir(directory)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                with open(os.path.join(directory, name), "rb") as f:
+                    images.append((name, f.read()))
+        if images:
+            return images
+        logger.warning(f"No images found in {directory}, using synthetic radiographs")
+    return [(f"synthetic_{i}.png", synthetic_png_bytes(1024, seed=i)) for i in range(4)]
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(","):
+        endpoint, _, weight = part.partition("=")
+        weights[endpoint.strip()] = float(weight or 1)
+    unknown = set(weights) - {"predict", "login", "report"}
+    if unknown:
+        raise ValueError(f"Unknown endpoints in mix: {sorted(unknown)}")
+    return weights
+
+
+class LoadRecorder:
+    """Per-endpoint latencies and errors for one load level"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.status_codes = defaultdict(lambda: defaultdict(int))
+        self.loop_lag = []
+
+    def record(self, endpoint, latency, status):
+        self.status_codes[endpoint][status] += 1
+        if isinstance(status, int) and 200 <= status < 300:
+            self.latencies[endpoint].append(latency)
+        else:
+            self.errors[endpoint] += 1
+
+    def summary(self, wall_time):
+        endpoints = {}
+        for endpoint in set(self.latencies) | set(self.errors):
+            samples = sorted(self.latencies[endpoint])
+            total = len(samples) + self.errors[endpoint]
+            endpoints[endpoint] = {
+                "requests": total,
+                "errors": self.errors[endpoint],
+                "error_rate": self.errors[endpoint] / total if total else 0.0,
+                "throughput": len(samples) / wall_time if wall_time else 0.0,
+                "p50": percentile(samples, 50),
+                "p95": percentile(samples, 95),
+                "p99": percentile(samples, 99),
+                "status_codes": {str(k): v for k, v in self.status_codes[endpoint].items()}
+            }
+        lag = sorted(self.loop_lag)
+        return {
+            "wall_time": wall_time,
+            "endpoints": endpoints,
+            "event_loop_lag": {
+                "samples": len(lag),
+                "mean": sum(lag) / len(lag) if lag else None,
+                "p95": percentile(lag, 95),
+                "p99": percentile(lag, 99),
+                "max": lag[-1] if lag else None
+            }
+        }
+
+
+async def monitor_loop_lag(recorder, stop):
+    """Measure how late the event loop wakes a sleeping task"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + LOOP_LAG_INTERVAL
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        recorder.loop_lag.append(max(0.0, loop.time() - expected))
+
+
+class TrafficMix:
+    """Builds requests for each endpoint according to the configured weights"""
+
+    def __init__(self, client, images, weights, patient_id):
+        self.client = client
+        self.images = images
+        self.endpoints = list(weights)
+        self.weights = [weights[e] for e in self.endpoints]
+        self.patient_id = patient_id
+        self.rng = random.Random(0)
+        self.report_payload = {
+            "patient_name": "Load Test",
+            "patient_id": patient_id,
+            "age": 50,
+            "gender": "Male",
+            "predictions": [
+                {**{k: p[k] for k in ("disease", "confidence", "severity")}, "description": ""}
+                for p in synthetic_predictions(key="disease")[:5]
+            ]
+        }
+
+    async def send(self, recorder):
+        endpoint = self.rng.choices(self.endpoints, self.weights)[0]
+        start = time.perf_counter()
+        try:
+            if endpoint == "predict":
+                name, data = self.rng.choice(self.images)
+                resp = await self.client.post("/predict", files={"file": (name, data, "image/png")})
+            elif endpoint == "login":
+                resp = await self.client.post("/auth/login", json={"patient_id": self.patient_id})
+            else:
+                resp = await self.client.post("/generate-report", json=self.report_payload)
+            status = resp.status_code
+        except Exception as e:
+            status = type(e).__name__
+        recorder.record(endpoint, time.perf_counter() - start, status)
+
+
+async def run_closed_loop(mix, concurrency, duration):
+    """`concurrency` workers each issue requests back to back"""
+    recorder = LoadRecorder()
+    stop = asyncio.Event()
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            await mix.send(recorder)
+
+    lag_task = asyncio.create_task(monitor_loop_lag(recorder, stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    stop.set()
+    await lag_task
+    return recorder.summary(wall)
+
+
+async def run_open_loop(mix, rps, duration, max_outstanding):
+    """Start requests at a fixed rate regardless of completions"""
+    recorder = LoadRecorder()
+    stop = asyncio.Event()
+    outstanding = set()
+    dropped = 0
+
+    lag_task = asyncio.create_task(monitor_loop_lag(recorder, stop))
+    start = time.perf_counter()
+    sent = 0
+    while time.perf_counter() - start < duration:
+        target = start + sent / rps
+        delay = target - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        sent += 1
+        if len(outstanding) >= max_outstanding:
+            dropped += 1
+            continue
+        task = asyncio.create_task(mix.send(recorder))
+        outstanding.add(task)
+        task.add_done_callback(outstanding.discard)
+
+    if outstanding:
+        await asyncio.gather(*outstanding)
+    wall = time.perf_counter() - start
+    stop.set()
+    await lag_task
+
+    summary = recorder.summary(wall)
+    summary["offered_rps"] = rps
+    summary["dropped_by_client"] = dropped
+    return summary
+
+
+def build_client(args):
+    import httpx
+
+    if args.url:
+        return httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+
+    import main
+    from benchmarks.run_benchmarks import build_ensemble
+
+    if args.real_models:
+        main.ensemble_model = main.MultiModelEnsemble(device=main.device)
+    else:
+        main.ensemble_model = build_ensemble()
+    # Replayed images repeat, so keep the upload-hash result cache out of the numbers
+    main.result_cache.max_entries = 0
+    # One in-process client drives all the load; per-client rate limits would cap it
+    main.admission.rate = 0
+    transport = httpx.ASGITransport(app=main.app)
+    return httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=args.timeout)
+
+
+async def run(args):
+    images = load_images(args.images)
+    weights = parse_mix(args.mix)
+    levels = []
+
+    if not args.url:
+        import main
+        # ASGITransport does not send lifespan events, so start the scheduler on this loop
+        await main.inference_scheduler.start()
+
+    async with build_client(args) as client:
+        mix = TrafficMix(client, images, weights, args.patient_id)
+        if args.rps:
+            for rps in args.rps:
+                logger.info(f"🚦 Open loop at {rps} req/s for {args.duration}s")
+                summary = await run_open_loop(mix, rps, args.duration, args.max_outstanding)
+                levels.append({"mode": "rps", "level": rps, **summary})
+        else:
+            for concurrency in args.concurrency:
+                logger.info(f"🚦 Closed loop with {concurrency} workers for {args.duration}s")
+                summary = await run_closed_loop(mix, concurrency, args.duration)
+                levels.append({"mode": "concurrency", "level": concurrency, **summary})
+
+    if not args.url:
+        await main.inference_scheduler.stop()
+    return levels
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="RAD-ETHIX load generator")
+    parser.add_argument("--url", help="Target a running server instead of the in-process ASGI app")
+    parser.add_argument("--real-models", action="store_true", help="Load the real ensemble for in-process runs")
+    parser.add_argument("--images", help="Directory of X-ray images to replay")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 2, 4, 8])
+    parser.add_argument("--rps", nargs="+", type=float, help="Open-loop request rates (overrides --concurrency)")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds per load level")
+    parser.add_argument("--mix", default="predict=1,login=2,report=1", help="Endpoint weights")
+    parser.add_argument("--patient-id", default="PES1UG24CS053")
+    parser.add_argument("--max-outstanding", type=int, default=256)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--max-error-rate", type=float, default=0.0,
+                        help="Fail the run when any endpoint's non-2xx rate exceeds this at any level")
+    parser.add_argument("--output", default="loadtest_output.json")
+    return parser.parse_args(argv)
+
+
+def failed_endpoints(levels, max_error_rate):
+    """(mode, level, endpoint, error rate) for every traffic class whose non-2xx rate is too high"""
+    return [
+        (level["mode"], level["level"], endpoint, stats["error_rate"])
+        for level in levels
+        for endpoint, stats in sorted(level["endpoints"].items())
+        if stats["error_rate"] > max_error_rate
+    ]
+
+
+def main_cli(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args(argv)
+    levels = asyncio.run(run(args))
+
+    for level in levels:
+        for endpoint, stats in sorted(level["endpoints"].items()):
+            p95 = stats["p95"]
+            logger.info(
+                f"{level['mode']}={level['level']} {endpoint:8s} "
+                f"{stats['throughput']:.2f} req/s  p95={p95 if p95 is None else f'{p95:.3f}s'}  "
+                f"errors={stats['error_rate']:.1%}"
+            )
+
+    # Latencies of a class that mostly errors measure the error path, not the endpoint
+    failures = failed_endpoints(levels, args.max_error_rate)
+    for mode, level, endpoint, error_rate in failures:
+        logger.error(f"❌ {mode}={level} {endpoint}: {error_rate:.1%} non-2xx responses "
+                     f"(allowed {args.max_error_rate:.1%}); see status_codes in the output")
+
+    report = {
+        "environment": environment_info(),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "passed": not failures,
+        "levels": levels
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"✅ Wrote load test results to {args.output}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
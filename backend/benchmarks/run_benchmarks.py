@@ -0,0 +1,420 @@
+# backend/benchmarks/run_benchmarks.py
+"""
+Benchmark suite for the inference and report paths
+
+Runs fully offline with synthetic radiographs and random-weight backbones.
+Results are written as JSON and can be compared against a previous run:
+
+    python -m benchmarks.run_benchmarks --output bench.json
+    python -m benchmarks.run_benchmarks --compare bench.json --fail-on-regression
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+import logging
+
+import cv2
+import numpy as np
+import torch
+
+import main
+import reports
+import uploads
+import rag_service
+from benchmarks.common import (
+    synthetic_png_bytes, synthetic_radiograph, synthetic_predictions, random_weight_models,
+    measure, summarize, environment_info, compare_results
+)
+
+logger = logging.getLogger("benchmarks")
+
+
+def build_ensemble():
+    return main.MultiModelEnsemble(device=main.device, models=random_weight_models())
+
+
+# ==================== BENCHMARKS ====================
+def bench_preprocess(args, ensemble):
+    results = []
+    for size in args.sizes:
+        image_bytes = synthetic_png_bytes(size)
+        stats = measure(lambda: main.preprocess_xray_image(image_bytes), repeat=args.repeat)
+        results.append({"name": "preprocess_xray_image", "params": {"size": size}, **stats})
+    return results
+
+
+def bench_ensemble(args, ensemble):
+    results = []
+    for batch_size in args.batch_sizes:
+        batch = torch.randn(batch_size, 1, 224, 224, device=main.device)
+        stats = measure(lambda: ensemble.predict_batch(batch), repeat=args.repeat, items_per_call=batch_size)
+        results.append({"name": "ensemble.predict_batch", "params": {"batch_size": batch_size}, **stats})
+    return results
+
+
+def bench_gradcam(args, ensemble):
+    results = []
+    img_tensor = torch.randn(1, 1, 224, 224, device=main.device).requires_grad_(True)
+    for model_name, model in ensemble.models.items():
+        grad_cam = main.TorchXRayVisionGradCAM(model)
+        try:
+            stats = measure(lambda: grad_cam.generate_cam(img_tensor, 0), repeat=args.repeat)
+        finally:
+            # The members are reused by later benchmarks; leave no hooks or activations behind
+            grad_cam.release()
+        results.append({"name": "gradcam.generate_cam", "params": {"model": model_name}, **stats})
+    return results
+
+
+def bench_cam(args, ensemble):
+    """Heatmap cost per DenseNet member once prediction has run: Grad-CAM (forward + backward, one class)
+    vs. CAM from the captured features (all classes)"""
+    from explain import class_activation_maps
+
+    results = []
+    img_tensor = torch.randn(1, 1, 224, 224, device=main.device)
+    for model_name, capture in ensemble.feature_captures.items():
+        model = ensemble.models[model_name]
+        gradcam = measure(lambda: main.compute_gradcam(model, img_tensor, 0), repeat=args.repeat)
+        results.append({"name": "heatmap.gradcam", "params": {"model": model_name, "classes": 1}, **gradcam})
+
+        ensemble.predict_member(model_name, img_tensor)
+        features = capture.pop()
+        cam = measure(lambda: class_activation_maps(features, model.classifier), repeat=args.repeat * 5)
+        results.append({
+            "name": "heatmap.cam", "params": {"model": model_name, "classes": model.classifier.out_features}, **cam
+        })
+    return results
+
+
+def bench_localization(args, ensemble):
+    """Location descriptors for a study's findings from their CAMs, with and without a lung mask"""
+    from localization import LungMask, describe_regions
+
+    results = []
+    rng = np.random.default_rng(0)
+    columns = np.arange(224)
+    rows = (np.arange(224) >= 20) & (np.arange(224) < 195)
+    lung_mask = LungMask(rows[:, None] & ((columns >= 20) & (columns < 105))[None, :],
+                         rows[:, None] & ((columns >= 120) & (columns < 205))[None, :])
+    for findings in (1, 3, 6):
+        maps = np.stack([cv2.resize(rng.random((7, 7)).astype(np.float32), (224, 224)) for _ in range(findings)])
+        for mask in (None, lung_mask):
+            stats = measure(lambda: describe_regions(maps, mask), repeat=args.repeat * 5)
+            results.append({
+                "name": "localization.describe", "params": {"findings": findings, "lung_mask": mask is not None}, **stats
+            })
+    return results
+
+
+def bench_drift(args, ensemble):
+    """Per-analysis cost of the drift sketches (input statistics + histogram update) and of a report"""
+    import torchxrayvision as xrv
+    from drift import DriftMonitor
+
+    results = []
+    rng = np.random.default_rng(0)
+    pathologies = main.DEFAULT_PATHOLOGIES
+    monitor = DriftMonitor(pathologies, reference_path="/nonexistent/drift_reference.npz")
+    probs = rng.random(len(pathologies)).astype(np.float32)
+    agreement = rng.random(len(pathologies)).astype(np.float32)
+    for size in args.sizes:
+        processed = xrv.datasets.normalize(synthetic_radiograph(size), 255)[None]
+        stats = measure(lambda: monitor.observe(probs, agreement, probs > 0.5, monitor.image_statistics(processed)),
+                        repeat=args.repeat * 5)
+        results.append({"name": "drift.observe", "params": {"size": size}, **stats})
+    stats = measure(lambda: monitor.report(), repeat=args.repeat)
+    results.append({"name": "drift.report", "params": {"buckets": monitor.buckets}, **stats})
+    return results
+
+
+def bench_startup(args, ensemble):
+    """Import time and peak RSS of the API modules, and time until the light API is ready (fresh processes)"""
+    from benchmarks.bench_startup import run_startup
+
+    return run_startup(["light_main", "main"], ["light_main:app"], max(args.repeat // 2, 1))
+
+
+def bench_tta(args, ensemble):
+    """Cost vs. number of augmented views: one batch per backbone vs. K sequential predicts"""
+    from tta import make_tta_views
+
+    results = []
+    img_tensor = torch.randn(1, 1, 224, 224, device=main.device)
+    for k in args.tta_views:
+        batched = measure(lambda: ensemble.predict_tta(make_tta_views(img_tensor, k)), repeat=args.repeat)
+        results.append({"name": "tta.batched", "params": {"views": k}, **batched})
+
+        views = make_tta_views(img_tensor, k)
+        sequential = measure(lambda: [ensemble.predict(views[i:i + 1]) for i in range(k)], repeat=args.repeat)
+        results.append({"name": "tta.sequential", "params": {"views": k}, **sequential})
+    return results
+
+
+def bench_overlay(args, ensemble):
+    results = []
+    cam = np.random.default_rng(0).random((7, 7)).astype(np.float32)
+    for size in args.sizes:
+        gray = cv2.resize(synthetic_radiograph(size), (224, 224))
+        base = cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB)
+
+        def render_and_encode():
+            overlay = main.create_heatmap_overlay(base, cv2.resize(cam, (224, 224)))
+            _, buffer = cv2.imencode('.png', overlay)
+            return buffer
+
+        stats = measure(render_and_encode, repeat=args.repeat * 5)
+        results.append({"name": "overlay.render_encode_png", "params": {"size": size}, **stats})
+    return results
+
+
+def bench_overlay_renderer(args, ensemble):
+    """Four heatmaps (three models + combined) over a shared base, batched blend + parallel encode"""
+    from overlays import OverlayOptions, OverlayRenderer, encode_overlays
+
+    results = []
+    rng = np.random.default_rng(0)
+    cams = [rng.random((7, 7)).astype(np.float32) for _ in range(4)]
+    for size in args.sizes:
+        image = synthetic_radiograph(size)
+        for resolution in ("224", "original"):
+            for fmt in ("png", "jpeg", "webp"):
+                options = OverlayOptions(format=fmt, resolution=resolution)
+
+                def render_and_encode():
+                    renderer = OverlayRenderer(image, size=None if resolution == "original" else (224, 224))
+                    return encode_overlays(renderer.render(cams), options)
+
+                stats = measure(render_and_encode, repeat=args.repeat * 2)
+                results.append({
+                    "name": "overlay.renderer",
+                    "params": {"size": size, "resolution": resolution, "format": fmt, "heatmaps": len(cams)},
+                    **stats
+                })
+    return results
+
+
+def bench_reports(args, ensemble):
+    import httpx
+
+    patient = {"name": "Benchmark Patient", "patient_id": "PES1UG24CS999", "age": 42, "gender": "Female"}
+    main_predictions = synthetic_predictions(key="disease")
+    rag_predictions = synthetic_predictions(key="pathology")
+    repeat = args.repeat * 20
+
+    def uncached():
+        reports.report_cache.clear()
+        return reports.generate_professional_report(patient, main_predictions)
+
+    results = [
+        {"name": "generate_professional_report", "params": {"cache": "miss"}, **measure(uncached, repeat=repeat)},
+        {"name": "generate_professional_report", "params": {"cache": "hit"},
+         **measure(lambda: reports.generate_professional_report(patient, main_predictions), repeat=repeat)},
+        {"name": "rag_service.generate_medical_report", "params": {},
+         **measure(lambda: rag_service.generate_medical_report(patient, rag_predictions), repeat=repeat)},
+    ]
+
+    # Distinct studies, so every report is rendered: one batch request vs. one request per report
+    batch_size = 100
+    items = [
+        {"patient_name": patient["name"], "patient_id": patient["patient_id"], "age": patient["age"],
+         "gender": patient["gender"],
+         "predictions": [{**p, "description": ""} for p in synthetic_predictions(seed=seed, key="disease")]}
+        for seed in range(batch_size)
+    ]
+
+    async def run(batched):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            samples = []
+            for _ in range(args.repeat):
+                reports.report_cache.clear()
+                start = time.perf_counter()
+                if batched:
+                    resp = await client.post("/generate-report/batch", json={"reports": items})
+                    resp.raise_for_status()
+                    assert len(resp.text.splitlines()) == batch_size
+                else:
+                    for item in items:
+                        (await client.post("/generate-report", json=item)).raise_for_status()
+                samples.append(time.perf_counter() - start)
+        return summarize(samples)
+
+    for batched in (False, True):
+        results.append({
+            "name": "endpoint./generate-report/batch" if batched else "endpoint./generate-report",
+            "params": {"reports": batch_size}, **asyncio.run(run(batched))
+        })
+    return results
+
+
+def bench_upload_limit(args, ensemble):
+    """Time to reject an oversized /predict upload, sent with Content-Length and streamed (chunked);
+    fails unless both are answered 413 before the whole body is read"""
+    import httpx
+
+    boundary = "benchboundary"
+    chunk = b"\0" * (1024 * 1024)
+    chunks = (main.MAX_UPLOAD_BYTES + uploads.MULTIPART_OVERHEAD) // len(chunk) + 2
+    head = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"big.png\"\r\n"
+            f"Content-Type: image/png\r\n\r\n").encode()
+    tail = f"\r\n--{boundary}--\r\n".encode()
+    headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+    async def run(streamed):
+        sent = 0
+
+        async def body():
+            nonlocal sent
+            yield head
+            for _ in range(chunks):
+                sent += 1
+                yield chunk
+            yield tail
+
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            samples = []
+            for _ in range(args.repeat):
+                sent = 0
+                content = body() if streamed else head + chunk * chunks + tail
+                start = time.perf_counter()
+                resp = await client.post("/predict", content=content, headers=headers)
+                samples.append(time.perf_counter() - start)
+                if resp.status_code != 413:
+                    raise RuntimeError(f"Oversized {'streamed' if streamed else 'sized'} upload got "
+                                       f"{resp.status_code}, expected 413: {resp.text[:200]}")
+                if streamed and sent >= chunks:
+                    raise RuntimeError("Oversized streamed upload was read to the end before being rejected")
+        return summarize(samples)
+
+    return [
+        {"name": "endpoint./predict.upload_limit", "params": {"body": "streamed" if streamed else "content-length"},
+         **asyncio.run(run(streamed))}
+        for streamed in (False, True)
+    ]
+
+
+def bench_predict_endpoint(args, ensemble):
+    import httpx
+
+    main.ensemble_model = ensemble
+    # Every request re-uploads the same image; measure inference, not the result cache
+    main.result_cache.clear()
+    main.result_cache.max_entries = 0
+    main.admission.rate = 0
+    image_bytes = synthetic_png_bytes(args.sizes[0])
+
+    async def run(concurrency):
+        # ASGITransport does not send lifespan events, so start the scheduler on this loop
+        await main.inference_scheduler.start()
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            latencies = []
+
+            async def one_request():
+                start = time.perf_counter()
+                resp = await client.post("/predict", files={"file": ("bench.png", image_bytes, "image/png")})
+                resp.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+            await one_request()  # warmup
+            latencies.clear()
+
+            total = max(args.requests, concurrency)
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def bounded():
+                async with semaphore:
+                    await one_request()
+
+            start = time.perf_counter()
+            await asyncio.gather(*(bounded() for _ in range(total)))
+            wall = time.perf_counter() - start
+
+        await main.inference_scheduler.stop()
+        stats = summarize(latencies)
+        stats["throughput"] = total / wall
+        return stats
+
+    results = []
+    for concurrency in args.concurrency:
+        stats = asyncio.run(run(concurrency))
+        results.append({"name": "endpoint./predict", "params": {"concurrency": concurrency, "size": args.sizes[0]}, **stats})
+    return results
+
+
+BENCHMARKS = {
+    "preprocess": bench_preprocess,
+    "ensemble": bench_ensemble,
+    "gradcam": bench_gradcam,
+    "cam": bench_cam,
+    "localization": bench_localization,
+    "drift": bench_drift,
+    "tta": bench_tta,
+    "overlay": bench_overlay,
+    "overlay_renderer": bench_overlay_renderer,
+    "reports": bench_reports,
+    "predict_endpoint": bench_predict_endpoint,
+    "upload_limit": bench_upload_limit,
+    "startup": bench_startup,
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="RAD-ETHIX benchmark suite")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="Run a subset of benchmarks")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[512, 1024, 2048], help="Synthetic radiograph sizes")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--tta-views", nargs="+", type=int, default=[1, 2, 4, 8, 16], help="TTA view counts")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 8])
+    parser.add_argument("--requests", type=int, default=16, help="Requests per /predict concurrency level")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threads", type=int, help="torch.set_num_threads value")
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--compare", help="Baseline results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative slowdown before flagging")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    return parser.parse_args(argv)
+
+
+def main_cli(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args(argv)
+
+    torch.manual_seed(0)
+    np.random.seed(0)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    ensemble = build_ensemble()
+    results = []
+    for name in args.only or BENCHMARKS:
+        logger.info(f"⏱️  Running {name}...")
+        results.extend(BENCHMARKS[name](args, ensemble))
+
+    report = {
+        "environment": environment_info(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "results": results
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"✅ Wrote {len(results)} results to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_results(report, baseline, args.tolerance)
+        for r in regressions:
+            logger.warning(f"⚠️ {r['name']} {r['params']}: {r['baseline_mean']:.4f}s -> {r['current_mean']:.4f}s (+{r['change']:.0%})")
+        if regressions and args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
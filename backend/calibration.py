@@ -0,0 +1,211 @@
+# backend/calibration.py
+"""
+Per-pathology probability calibration
+Temperature or isotonic scaling fitted offline on a labeled manifest. The
+fitted parameters compile into one (levels, pathologies) lookup table so
+calibrating a whole probability matrix is a single gather:
+
+    python -m calibration --manifest data/train/valid/valid.csv --output runtime/calibration.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LUT_LEVELS = 4096
+EPS = 1e-6
+
+# Fewer labeled positives (or negatives) than this and isotonic overfits; use a temperature
+MIN_ISOTONIC_CLASS = 50
+# Fewer than this and there is nothing to fit; the pathology stays uncalibrated
+MIN_TEMPERATURE_CLASS = 5
+
+TEMPERATURE_GRID = np.logspace(-1, 1, 201)
+
+
+def logit(p):
+    p = np.clip(np.asarray(p, dtype=np.float64), EPS, 1 - EPS)
+    return np.log(p) - np.log1p(-p)
+
+
+def sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+# ==================== FITTING ====================
+def fit_temperature(probs, labels, grid=TEMPERATURE_GRID):
+    """Temperature minimizing the log loss of sigmoid(logit(p) / T), searched over a log grid"""
+    z = logit(probs)[:, None] / grid[None, :]  # (samples, grid)
+    y = labels[:, None]
+    # -[y log s(z) + (1 - y) log(1 - s(z))] = softplus(z) - y z
+    nll = (np.logaddexp(0.0, z) - y * z).mean(axis=0)
+    return float(grid[int(np.argmin(nll))])
+
+
+def fit_isotonic(probs, labels):
+    """Pool-adjacent-violators fit; returns increasing (x, y) knots"""
+    order = np.argsort(probs, kind="stable")
+    x = np.asarray(probs, dtype=np.float64)[order]
+    y = np.asarray(labels, dtype=np.float64)[order]
+
+    # Blocks as (sum of y, count, sum of x); merge while the previous mean is not below the last
+    sums, counts, xsums = [], [], []
+    for xi, yi in zip(x, y):
+        sums.append(yi)
+        counts.append(1)
+        xsums.append(xi)
+        while len(sums) > 1 and sums[-2] * counts[-1] >= sums[-1] * counts[-2]:
+            s, c, xs = sums.pop(), counts.pop(), xsums.pop()
+            sums[-1] += s
+            counts[-1] += c
+            xsums[-1] += xs
+
+    counts = np.asarray(counts, dtype=np.float64)
+    return np.asarray(xsums) / counts, np.asarray(sums) / counts
+
+
+def fit_pathology(probs, labels, method="auto"):
+    """Calibration parameters for one pathology from its labeled (non-NaN) samples"""
+    known = ~np.isnan(labels)
+    probs, labels = probs[known], labels[known]
+    positives = int(labels.sum())
+    negatives = int(len(labels) - positives)
+    counts = {"positives": positives, "negatives": negatives}
+
+    if min(positives, negatives) < MIN_TEMPERATURE_CLASS:
+        return {"method": "identity", **counts}
+    if method == "auto":
+        method = "isotonic" if min(positives, negatives) >= MIN_ISOTONIC_CLASS else "temperature"
+    if method == "temperature":
+        return {"method": "temperature", "temperature": fit_temperature(probs, labels), **counts}
+    if method == "isotonic":
+        x, y = fit_isotonic(probs, labels)
+        return {"method": "isotonic", "x": [round(float(v), 6) for v in x], "y": [round(float(v), 6) for v in y],
+                **counts}
+    raise ValueError(f"Unknown calibration method: {method}")
+
+
+def fit_calibration(probs, labels, pathologies, method="auto"):
+    """Parameters for every pathology from (samples, pathologies) probabilities and labels"""
+    return {name: fit_pathology(probs[:, j], labels[:, j], method) for j, name in enumerate(pathologies)}
+
+
+# ==================== LOOKUP TABLES ====================
+def apply_params(params, p):
+    """Calibrated values of one pathology's parameters at probabilities `p`"""
+    method = params["method"]
+    if method == "temperature":
+        return sigmoid(logit(p) / params["temperature"])
+    if method == "isotonic":
+        return np.interp(p, params["x"], params["y"])
+    return np.asarray(p, dtype=np.float64)
+
+
+class CalibrationTable:
+    """(levels, pathologies) table of calibrated values at evenly spaced raw probabilities"""
+
+    def __init__(self, params, pathologies, levels=LUT_LEVELS):
+        self.pathologies = list(pathologies)
+        self.levels = levels
+        self.methods = {name: params.get(name, {"method": "identity"})["method"] for name in self.pathologies}
+        grid = np.linspace(0.0, 1.0, levels)
+        self.lut = np.stack(
+            [apply_params(params.get(name, {"method": "identity"}), grid) for name in self.pathologies], axis=1
+        ).astype(np.float32)
+        self._columns = np.arange(len(self.pathologies))
+
+    def apply(self, probs):
+        """Calibrate a (..., pathologies) probability array"""
+        probs = np.asarray(probs, dtype=np.float32)
+        idx = np.rint(np.clip(probs, 0.0, 1.0) * (self.levels - 1)).astype(np.intp)
+        return self.lut[idx, self._columns]
+
+
+def load_calibration(path, pathologies):
+    """CalibrationTable from a fitted parameters file"""
+    with open(path) as f:
+        document = json.load(f)
+    unknown = set(document.get("params", {})) - set(pathologies)
+    if unknown:
+        raise ValueError(f"{path}: unknown pathologies {sorted(unknown)}")
+    return CalibrationTable(document["params"], pathologies)
+
+
+def expected_calibration_error(probs, labels, bins=10):
+    """Equal-width-bin ECE over the labeled entries of one pathology"""
+    known = ~np.isnan(labels)
+    probs, labels = probs[known], labels[known]
+    if probs.size == 0:
+        return None
+    which = np.minimum((probs * bins).astype(int), bins - 1)
+    counts = np.bincount(which, minlength=bins)
+    gaps = np.abs(np.bincount(which, probs, bins) - np.bincount(which, labels, bins))
+    return float(gaps.sum() / counts.sum())
+
+
+# ==================== CLI ====================
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fit per-pathology calibration of the RAD-ETHIX ensemble")
+    parser.add_argument("--manifest", required=True, help="CSV with filename and label (or per-pathology) columns")
+    parser.add_argument("--image-dir", help="Directory the manifest filenames are relative to")
+    parser.add_argument("--method", choices=["auto", "temperature", "isotonic"], default="auto")
+    parser.add_argument("--cache-dir", help="Directory for cached member scores (default: next to the output)")
+    parser.add_argument("--output", required=True)
+    return parser.parse_args(argv)
+
+
+def main_cli(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args(argv)
+
+    # Heavy imports only for the offline job; the service just loads the output
+    import torchxrayvision as xrv
+    import main
+    from manifests import load_manifest, score_manifest, combine_members
+
+    pathologies = xrv.datasets.default_pathologies
+    manifest = load_manifest(args.manifest, pathologies, args.image_dir)
+    ensemble = main.MultiModelEnsemble(device=main.device, spec=main.model_registry.active_spec())
+    # Default weights from the version being scored, not the service's built-in ones
+    main.threshold_engine.set_base_weights(ensemble.weights)
+    cache_dir = args.cache_dir or os.path.join(os.path.dirname(os.path.abspath(args.output)), "scores")
+    scores, loaded = score_manifest(manifest, ensemble, main.preprocess_xray_image, cache_dir)
+
+    weights = main.threshold_engine.current.ensemble_weights
+    probs = combine_members(scores, weights)[loaded]
+    labels = manifest.labels[loaded]
+    params = fit_calibration(probs, labels, pathologies, args.method)
+
+    table = CalibrationTable(params, pathologies)
+    calibrated = table.apply(probs)
+    for j, name in enumerate(pathologies):
+        before = expected_calibration_error(probs[:, j], labels[:, j])
+        after = expected_calibration_error(calibrated[:, j], labels[:, j])
+        if before is not None:
+            logger.info(f"{name:28s} {params[name]['method']:12s} ECE {before:.4f} -> {after:.4f}")
+
+    document = {
+        "fitted_at": time.time(),
+        "manifest": os.path.abspath(args.manifest),
+        "manifest_sha256": manifest.digest,
+        "images": int(loaded.sum()),
+        "params": params
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    tmp = f"{args.output}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(document, f, indent=2)
+    os.replace(tmp, args.output)
+    logger.info(f"✅ Wrote calibration for {len(params)} pathologies to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,127 @@
+# backend/comparison.py
+"""
+Comparison with prior studies
+Each study keeps a compact CAM summary (the ensemble heatmap of its top
+pathology reduced to a small uint8 grid, tagged with that pathology) next to
+its probability vector, so a new study can be compared with its priors
+without re-running any model on the old images. Heatmaps are only compared
+when both are of the same pathology.
+"""
+
+import base64
+from datetime import datetime
+
+import numpy as np
+
+CAM_SUMMARY_SIZE = 16
+
+# Absolute probability change that counts as an interval change
+CHANGE_THRESHOLD = 0.1
+
+# Heatmap cells whose activation changed by more than this are counted in the change map
+CAM_CHANGE_THRESHOLD = 0.25
+
+
+def summarize_cam(cam, pathology, size=CAM_SUMMARY_SIZE):
+    """Reduce a [0, 1] heatmap of `pathology` to a size x size uint8 grid, base64 encoded"""
+    import cv2  # only the analysis path summarizes heatmaps; comparisons need no OpenCV
+
+    small = cv2.resize(np.asarray(cam, dtype=np.float32), (size, size), interpolation=cv2.INTER_AREA)
+    grid = np.clip(np.rint(small * 255), 0, 255).astype(np.uint8)
+    return {"shape": [size, size], "data": base64.b64encode(grid.tobytes()).decode(), "pathology": pathology}
+
+
+def decode_cam_summary(summary):
+    """CAM summary back to a float32 grid in [0, 1] (None if missing)"""
+    if not summary:
+        return None
+    grid = np.frombuffer(base64.b64decode(summary["data"]), dtype=np.uint8)
+    return grid.reshape(summary["shape"]).astype(np.float32) / 255.0
+
+
+def change_map(current_summary, prior_summary):
+    """Signed heatmap difference (current - prior) with the share of cells that rose or fell
+
+    None unless both summaries are heatmaps of the same pathology: maps of
+    different classes (or untagged ones, stored before summaries named
+    their pathology) say nothing about interval change.
+    """
+    pathology = (current_summary or {}).get("pathology")
+    if pathology is None or pathology != (prior_summary or {}).get("pathology"):
+        return None
+    current = decode_cam_summary(current_summary)
+    prior = decode_cam_summary(prior_summary)
+    if current is None or prior is None or current.shape != prior.shape:
+        return None
+
+    diff = current - prior
+    encoded = np.clip(np.rint(diff * 127), -127, 127).astype(np.int8)
+    return {
+        "pathology": pathology,
+        "shape": list(diff.shape),
+        "data": base64.b64encode(encoded.tobytes()).decode(),
+        "increased_fraction": float(np.mean(diff > CAM_CHANGE_THRESHOLD)),
+        "decreased_fraction": float(np.mean(diff < -CAM_CHANGE_THRESHOLD)),
+        "max_increase": float(diff.max()),
+        "max_decrease": float(-diff.min())
+    }
+
+
+def classify_changes(pathologies, current, prior, positive_threshold):
+    """Per-pathology interval status: new, resolved, increased, decreased or stable"""
+    delta = current - prior
+    current_pos = current >= positive_threshold
+    prior_pos = prior >= positive_threshold
+
+    status = np.full(len(pathologies), "", dtype=object)
+    status[current_pos & ~prior_pos] = "new"
+    status[~current_pos & prior_pos] = "resolved"
+    both = current_pos & prior_pos
+    status[both] = "stable"
+    status[both & (delta >= CHANGE_THRESHOLD)] = "increased"
+    status[both & (delta <= -CHANGE_THRESHOLD)] = "decreased"
+
+    changes = [
+        {
+            "disease": pathologies[i],
+            "status": status[i],
+            "prior": float(prior[i]),
+            "current": float(current[i]),
+            "delta": float(delta[i])
+        }
+        for i in np.flatnonzero(status != "")
+    ]
+    order = {"new": 0, "increased": 1, "resolved": 2, "decreased": 3, "stable": 4}
+    return sorted(changes, key=lambda c: (order[c["status"]], -abs(c["delta"])))
+
+
+def compare_with_priors(pathologies, current_probs, priors, current_cam_summary=None, positive_threshold=0.3,
+                        current_time=None):
+    """Compare a study with its priors (newest first, as stored by the clinical store)
+
+    Returns None when there is no prior with a probability vector.
+    """
+    priors = [p for p in priors if p.get("probabilities")]
+    if not priors:
+        return None
+
+    current = np.asarray(current_probs, dtype=np.float64)
+    history = np.asarray([p["probabilities"] for p in priors], dtype=np.float64)  # (priors, pathologies)
+    latest = priors[0]
+    current_time = current_time or datetime.now().timestamp()
+
+    changes = classify_changes(pathologies, current, history[0], positive_threshold)
+    tracked = sorted({c["disease"] for c in changes})
+    index = {name: i for i, name in enumerate(pathologies)}
+
+    return {
+        "prior_study_id": latest["study_id"],
+        "prior_date": datetime.fromtimestamp(latest["created_at"]).isoformat(),
+        "interval_days": round((current_time - latest["created_at"]) / 86400.0, 1),
+        "priors_considered": len(priors),
+        "deltas": {name: float(d) for name, d in zip(pathologies, current - history[0])},
+        "changes": changes,
+        # Oldest to newest, ending with the current study
+        "trends": {name: [float(v) for v in history[::-1, index[name]]] + [float(current[index[name]])] for name in tracked},
+        "change_map": change_map(current_cam_summary, latest.get("cam_summary"))
+    }
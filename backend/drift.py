@@ -0,0 +1,239 @@
+# backend/drift.py
+"""
+Drift monitoring
+Constant-memory streaming statistics of what the service sees and returns:
+per-pathology histograms of ensemble probabilities and model agreement,
+positive-finding rates, and input intensity statistics of the preprocessed
+image. Every series is a fixed-bin histogram kept in a ring of time
+buckets, so an observation is a handful of vectorized increments and a
+window is a sum over buckets. A window is compared with a saved reference
+snapshot by the population stability index (PSI) and histogram quantiles.
+"""
+
+import os
+import math
+import time
+import logging
+import threading
+
+import numpy as np
+
+from store import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REFERENCE_PATH = os.environ.get("RAD_ETHIX_DRIFT_REFERENCE_PATH", os.path.join(DATA_DIR, "drift_reference.npz"))
+BUCKET_SECONDS = int(os.environ.get("RAD_ETHIX_DRIFT_BUCKET_SECONDS", "3600"))
+BUCKETS = int(os.environ.get("RAD_ETHIX_DRIFT_BUCKETS", "168"))  # a week of hourly buckets
+
+# Input statistics are taken from at most this many pixels, whatever the image size
+MAX_SAMPLED_PIXELS = 65536
+# Conventional PSI bands: below 0.1 stable, 0.1-0.25 moderate shift, above 0.25 major shift
+PSI_MODERATE = 0.1
+PSI_MAJOR = 0.25
+PSI_EPSILON = 1e-4
+QUANTILES = (0.1, 0.5, 0.9)
+
+# Input intensities are xrv-normalized to [-1024, 1024]
+INTENSITY_RANGE = (-1024.0, 1024.0)
+
+
+def _series_specs(pathologies):
+    """name -> (rows, bins, low, high, row labels)"""
+    n = len(pathologies)
+    return {
+        "probability": (n, 50, 0.0, 1.0, pathologies),
+        "agreement": (n, 50, 0.0, 1.0, pathologies),
+        "intensity_mean": (1, 64, *INTENSITY_RANGE, ["image"]),
+        "intensity_std": (1, 64, 0.0, 1024.0, ["image"]),
+        "intensity_pixels": (1, 64, *INTENSITY_RANGE, ["image"])
+    }
+
+
+def population_stability_index(current, reference):
+    """PSI of each row of (rows, bins) count arrays; rows without data give NaN"""
+    current = current.astype(np.float64)
+    reference = reference.astype(np.float64)
+    current_total = current.sum(axis=1, keepdims=True)
+    reference_total = reference.sum(axis=1, keepdims=True)
+    p = (current + PSI_EPSILON) / (current_total + PSI_EPSILON * current.shape[1])
+    q = (reference + PSI_EPSILON) / (reference_total + PSI_EPSILON * reference.shape[1])
+    psi = ((p - q) * np.log(p / q)).sum(axis=1)
+    return np.where((current_total[:, 0] > 0) & (reference_total[:, 0] > 0), psi, np.nan)
+
+
+def histogram_quantiles(counts, low, high, quantiles=QUANTILES):
+    """(rows, quantiles) values interpolated within bins of (rows, bins) counts"""
+    counts = counts.astype(np.float64)
+    bins = counts.shape[1]
+    cumulative = np.cumsum(counts, axis=1)
+    total = cumulative[:, -1:]
+    out = np.full((counts.shape[0], len(quantiles)), np.nan)
+    width = (high - low) / bins
+    for k, q in enumerate(quantiles):
+        target = q * total
+        idx = np.minimum((cumulative < target).sum(axis=1), bins - 1)
+        below = np.where(idx > 0, np.take_along_axis(cumulative, np.maximum(idx - 1, 0)[:, None], axis=1)[:, 0], 0.0)
+        in_bin = np.take_along_axis(counts, idx[:, None], axis=1)[:, 0]
+        fraction = np.divide(target[:, 0] - below, in_bin, out=np.zeros_like(below), where=in_bin > 0)
+        out[:, k] = np.where(total[:, 0] > 0, low + (idx + fraction) * width, np.nan)
+    return out
+
+
+class DriftMonitor:
+    """Windowed streaming histograms of model inputs and outputs, with a reference to compare against"""
+
+    def __init__(self, pathologies, bucket_seconds=BUCKET_SECONDS, buckets=BUCKETS,
+                 reference_path=DEFAULT_REFERENCE_PATH):
+        self.pathologies = list(pathologies)
+        self.bucket_seconds = bucket_seconds
+        self.buckets = buckets
+        self.reference_path = reference_path
+        self.specs = _series_specs(self.pathologies)
+        self.counts = {
+            name: np.zeros((buckets, rows, bins), dtype=np.int64) for name, (rows, bins, *_) in self.specs.items()
+        }
+        self.positives = np.zeros((buckets, len(self.pathologies)), dtype=np.int64)
+        self.studies = np.zeros(buckets, dtype=np.int64)
+        self.bucket_ids = np.full(buckets, -1, dtype=np.int64)
+        self._rows = {name: np.arange(rows) for name, (rows, *_) in self.specs.items()}
+        self._lock = threading.Lock()
+        self.reference = self._load_reference()
+
+    def _bin(self, name, values):
+        _, bins, low, high, _ = self.specs[name]
+        return np.clip(((np.asarray(values, dtype=np.float64) - low) * (bins / (high - low))).astype(np.int64), 0, bins - 1)
+
+    def _slot(self, now):
+        bucket_id = int(now // self.bucket_seconds)
+        slot = bucket_id % self.buckets
+        if self.bucket_ids[slot] != bucket_id:
+            for counts in self.counts.values():
+                counts[slot] = 0
+            self.positives[slot] = 0
+            self.studies[slot] = 0
+            self.bucket_ids[slot] = bucket_id
+        return slot
+
+    @staticmethod
+    def image_statistics(image):
+        """(mean, std, pixel sample) of a preprocessed image, from a strided subsample of bounded size"""
+        image = np.asarray(image)
+        image = image.reshape(image.shape[-2], image.shape[-1])
+        stride = max(1, math.ceil(math.sqrt(image.size / MAX_SAMPLED_PIXELS)))
+        sample = image[::stride, ::stride]
+        return float(sample.mean()), float(sample.std()), sample
+
+    def observe(self, probabilities, agreement, positive, image_stats=None, now=None):
+        """Record one analysis: raw ensemble probabilities, agreement scores, served positive
+        decisions (all per pathology) and optional image_statistics() output"""
+        prob_bins = self._bin("probability", probabilities)
+        agreement_bins = self._bin("agreement", agreement)
+        if image_stats is not None:
+            mean, std, sample = image_stats
+            pixel_counts = np.bincount(self._bin("intensity_pixels", sample).ravel(),
+                                       minlength=self.specs["intensity_pixels"][1])
+        with self._lock:
+            slot = self._slot(time.time() if now is None else now)
+            self.counts["probability"][slot, self._rows["probability"], prob_bins] += 1
+            self.counts["agreement"][slot, self._rows["agreement"], agreement_bins] += 1
+            self.positives[slot] += np.asarray(positive, dtype=bool)
+            self.studies[slot] += 1
+            if image_stats is not None:
+                self.counts["intensity_mean"][slot, 0, self._bin("intensity_mean", mean)] += 1
+                self.counts["intensity_std"][slot, 0, self._bin("intensity_std", std)] += 1
+                self.counts["intensity_pixels"][slot, 0] += pixel_counts
+
+    def window(self, hours=None, now=None):
+        """Summed histograms of the last `hours` (default: every bucket kept)"""
+        now = time.time() if now is None else now
+        current_id = int(now // self.bucket_seconds)
+        span = self.buckets if hours is None else max(1, min(self.buckets, math.ceil(hours * 3600 / self.bucket_seconds)))
+        with self._lock:
+            live = (self.bucket_ids > current_id - span) & (self.bucket_ids <= current_id)
+            return {
+                "counts": {name: counts[live].sum(axis=0) for name, counts in self.counts.items()},
+                "positives": self.positives[live].sum(axis=0),
+                "studies": int(self.studies[live].sum()),
+                "hours": span * self.bucket_seconds / 3600
+            }
+
+    def _load_reference(self):
+        if not os.path.exists(self.reference_path):
+            return None
+        try:
+            with np.load(self.reference_path) as data:
+                reference = {
+                    "counts": {name: data[f"counts.{name}"] for name in self.specs},
+                    "positives": data["positives"],
+                    "studies": int(data["studies"]),
+                    "created_at": float(data["created_at"])
+                }
+            for name, (rows, bins, *_) in self.specs.items():
+                if reference["counts"][name].shape != (rows, bins):
+                    raise ValueError(f"{name} has shape {reference['counts'][name].shape}")
+            return reference
+        except (OSError, KeyError, ValueError) as e:
+            logger.error(f"❌ Ignoring drift reference {self.reference_path}: {e}")
+            return None
+
+    def save_reference(self, hours=None):
+        """Freeze the current window as the reference and persist it"""
+        window = self.window(hours)
+        if window["studies"] == 0:
+            raise ValueError("No analyses in the window to use as a reference")
+        created_at = time.time()
+        os.makedirs(os.path.dirname(os.path.abspath(self.reference_path)), exist_ok=True)
+        tmp = f"{self.reference_path}.tmp.npz"
+        np.savez(tmp, positives=window["positives"], studies=window["studies"], created_at=created_at,
+                 **{f"counts.{name}": counts for name, counts in window["counts"].items()})
+        os.replace(tmp, self.reference_path)
+        self.reference = {**window, "created_at": created_at}
+        logger.info(f"📐 Drift reference saved from {window['studies']} analyses")
+        return {"studies": window["studies"], "hours": window["hours"], "created_at": created_at}
+
+    def report(self, hours=None):
+        """Window statistics, and PSI / quantile / positive-rate shifts against the reference"""
+        window = self.window(hours)
+        reference = self.reference
+        report = {
+            "window_hours": window["hours"],
+            "studies": window["studies"],
+            "reference": {"studies": reference["studies"], "created_at": reference["created_at"]} if reference else None,
+            "series": {},
+            "alerts": []
+        }
+        for name, (rows, bins, low, high, labels) in self.specs.items():
+            counts = window["counts"][name]
+            quantiles = histogram_quantiles(counts, low, high)
+            psi = population_stability_index(counts, reference["counts"][name]) if reference else np.full(rows, np.nan)
+            reference_quantiles = histogram_quantiles(reference["counts"][name], low, high) if reference else None
+            series = {}
+            for i, label in enumerate(labels):
+                entry = {"quantiles": _rounded(dict(zip(map(str, QUANTILES), quantiles[i])))}
+                if reference:
+                    entry["reference_quantiles"] = _rounded(dict(zip(map(str, QUANTILES), reference_quantiles[i])))
+                    entry["psi"] = None if np.isnan(psi[i]) else round(float(psi[i]), 4)
+                    if not np.isnan(psi[i]) and psi[i] >= PSI_MODERATE:
+                        report["alerts"].append({
+                            "series": name, "label": label, "psi": round(float(psi[i]), 4),
+                            "level": "major" if psi[i] >= PSI_MAJOR else "moderate"
+                        })
+                series[label] = entry
+            report["series"][name] = series
+
+        studies = max(window["studies"], 1)
+        positive_rate = {name: round(float(window["positives"][j]) / studies, 4) for j, name in enumerate(self.pathologies)}
+        report["positive_rate"] = positive_rate
+        if reference:
+            reference_studies = max(reference["studies"], 1)
+            report["reference_positive_rate"] = {
+                name: round(float(reference["positives"][j]) / reference_studies, 4)
+                for j, name in enumerate(self.pathologies)
+            }
+        report["alerts"].sort(key=lambda alert: -alert["psi"])
+        return report
+
+
+def _rounded(values):
+    return {k: None if np.isnan(v) else round(float(v), 4) for k, v in values.items()}
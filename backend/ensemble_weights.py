@@ -0,0 +1,181 @@
+# backend/ensemble_weights.py
+"""
+Per-pathology ensemble weight search
+Scores a labeled manifest with every member once (cached by manifests.py),
+then evaluates every weight combination on a simplex grid for all
+pathologies at once and writes the best weights to a file the service
+loads at startup:
+
+    python -m ensemble_weights --manifest data/train/valid/valid.csv --output runtime/ensemble_weights.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Pathologies with fewer labeled positives (or negatives) keep the current weights
+MIN_CLASS_COUNT = 10
+
+
+def simplex_grid(members, step=0.05):
+    """(combinations, members) array of non-negative weights summing to one, in multiples of `step`"""
+    steps = int(round(1.0 / step))
+    rows = [c for c in itertools.product(range(steps + 1), repeat=members - 1) if sum(c) <= steps]
+    grid = np.array([list(c) + [steps - sum(c)] for c in rows], dtype=np.float32)
+    return grid / steps
+
+
+def average_ranks(scores):
+    """1-based ranks within each row of (rows, samples) scores; tied scores share the mean of their ranks"""
+    rows, n = scores.shape
+    order = np.argsort(scores, axis=1, kind="stable")
+    ordered = np.take_along_axis(scores, order, axis=1)
+    # Number the runs of equal scores across all rows, then average the positions within each run
+    starts = np.ones((rows, n), dtype=bool)
+    starts[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+    runs = np.cumsum(starts.ravel()) - 1
+    positions = np.tile(np.arange(1, n + 1, dtype=np.float64), rows)
+    mean_rank = np.bincount(runs, positions) / np.bincount(runs)
+    ranks = np.empty((rows, n), dtype=np.float64)
+    np.put_along_axis(ranks, order, mean_rank[runs].reshape(rows, n), axis=1)
+    return ranks
+
+
+def auroc(scores, labels):
+    """AUROC of each row of (candidates, samples) scores against binary labels (Mann-Whitney U)
+
+    Ties take their average rank, so a tie between a positive and a negative
+    counts one half whatever the sample order. Calibrated (isotonic) scores
+    are heavily tied.
+    """
+    positives = labels.astype(bool)
+    n_pos = int(positives.sum())
+    n_neg = labels.size - n_pos
+    ranks = average_ranks(scores)
+    rank_sum = ranks[:, positives].sum(axis=1)
+    return (rank_sum - n_pos * (n_pos + 1) / 2.0) / (n_pos * n_neg)
+
+
+def brier(scores, labels):
+    """Mean squared error of each row of (candidates, samples) scores"""
+    return np.mean((scores - labels[None, :]) ** 2, axis=1)
+
+
+# Metric functions and whether larger is better
+METRICS = {"auroc": (auroc, True), "brier": (brier, False)}
+
+
+def search_weights(scores, labels, pathologies, current, metric="auroc", step=0.05, min_gain=0.002):
+    """Best weights per pathology over a simplex grid
+
+    `scores` maps members to (samples, pathologies) probabilities and `current`
+    maps members to their weights (scalars or per-pathology vectors). A
+    pathology only moves off its current weights when the best candidate beats
+    them by `min_gain`, so small noisy improvements do not churn the weights.
+    Returns ({member: (pathologies,) weights}, per-pathology report).
+    """
+    members = list(scores)
+    fn, higher_is_better = METRICS[metric]
+    grid = simplex_grid(len(members), step)                        # (candidates, members)
+    stacked = np.stack([scores[m] for m in members], axis=0)       # (members, samples, pathologies)
+    current = np.stack([np.broadcast_to(np.asarray(current.get(m, 0.0), dtype=np.float32), (len(pathologies),))
+                        for m in members], axis=0)                 # (members, pathologies)
+    current = current / current.sum(axis=0, keepdims=True)
+
+    weights = current.copy()
+    report = {}
+    for j, name in enumerate(pathologies):
+        known = ~np.isnan(labels[:, j])
+        y = labels[known, j]
+        positives = int(y.sum())
+        if min(positives, len(y) - positives) < MIN_CLASS_COUNT:
+            report[name] = {"status": "skipped", "positives": positives, "negatives": int(len(y) - positives)}
+            continue
+
+        member_scores = stacked[:, known, j]                                   # (members, samples)
+        candidates = np.vstack([current[:, j][None, :], grid]) @ member_scores  # (1 + candidates, samples)
+        values = fn(candidates, y)
+        baseline = float(values[0])
+        best = int(np.argmax(values) if higher_is_better else np.argmin(values))
+        gain = (values[best] - baseline) if higher_is_better else (baseline - values[best])
+        if best > 0 and gain >= min_gain:
+            weights[:, j] = grid[best - 1]
+        report[name] = {
+            "status": "updated" if best > 0 and gain >= min_gain else "kept",
+            "positives": positives,
+            "negatives": int(len(y) - positives),
+            "before": round(baseline, 5),
+            "after": round(float(values[best]) if gain >= min_gain else baseline, 5)
+        }
+
+    return {m: weights[i] for i, m in enumerate(members)}, report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Search per-pathology RAD-ETHIX ensemble weights")
+    parser.add_argument("--manifest", required=True, help="CSV with filename and label (or per-pathology) columns")
+    parser.add_argument("--image-dir", help="Directory the manifest filenames are relative to")
+    parser.add_argument("--metric", choices=sorted(METRICS), default="auroc")
+    parser.add_argument("--step", type=float, default=0.05, help="Weight grid resolution")
+    parser.add_argument("--min-gain", type=float, default=0.002, help="Improvement needed to change a pathology")
+    parser.add_argument("--cache-dir", help="Directory for cached member scores (default: next to the output)")
+    parser.add_argument("--output", required=True)
+    return parser.parse_args(argv)
+
+
+def main_cli(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args(argv)
+
+    # Heavy imports only for the offline job; the service just loads the output
+    import torchxrayvision as xrv
+    import main
+    from manifests import load_manifest, score_manifest
+
+    pathologies = xrv.datasets.default_pathologies
+    manifest = load_manifest(args.manifest, pathologies, args.image_dir)
+    ensemble = main.MultiModelEnsemble(device=main.device, spec=main.model_registry.active_spec())
+    # Default weights from the version being scored, not the service's built-in ones
+    main.threshold_engine.set_base_weights(ensemble.weights)
+    cache_dir = args.cache_dir or os.path.join(os.path.dirname(os.path.abspath(args.output)), "scores")
+    scores, loaded = score_manifest(manifest, ensemble, main.preprocess_xray_image, cache_dir)
+
+    start = time.perf_counter()
+    weights, report = search_weights(
+        {name: probs[loaded] for name, probs in scores.items()}, manifest.labels[loaded], pathologies,
+        main.threshold_engine.current.ensemble_weights, args.metric, args.step, args.min_gain
+    )
+    logger.info(f"🔎 Searched {len(simplex_grid(len(weights), args.step))} weightings per pathology "
+                f"in {time.perf_counter() - start:.2f}s")
+    for name, row in report.items():
+        if row["status"] != "skipped":
+            logger.info(f"{name:28s} {args.metric} {row['before']:.4f} -> {row['after']:.4f} ({row['status']})")
+
+    document = {
+        "fitted_at": time.time(),
+        "manifest": os.path.abspath(args.manifest),
+        "manifest_sha256": manifest.digest,
+        "images": int(loaded.sum()),
+        "metric": args.metric,
+        "ensemble_weights": {name: [round(float(w), 4) for w in vector] for name, vector in weights.items()},
+        "report": report
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    tmp = f"{args.output}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(document, f, indent=2)
+    os.replace(tmp, args.output)
+    logger.info(f"✅ Wrote ensemble weights to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
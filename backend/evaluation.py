@@ -0,0 +1,237 @@
+# backend/evaluation.py
+"""
+Offline evaluation of an ensemble configuration on a labeled manifest
+Member probabilities are scored once per configuration (registry version,
+input size, test-time augmentation) and cached by manifests.py under a hash
+of it; metrics for every member, the raw weighted ensemble and the served
+(calibrated) ensemble are then computed for all pathologies at once, so
+comparing two configurations takes seconds once both are scored:
+
+    python -m evaluation --manifest data/train/valid/valid.csv --output runtime/eval/baseline.json
+    python -m evaluation --manifest data/train/valid/valid.csv --input-size 224 \\
+        --output runtime/eval/224.json --compare runtime/eval/baseline.json
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import logging
+
+import numpy as np
+
+from ensemble_weights import auroc
+
+logger = logging.getLogger(__name__)
+
+ECE_BINS = 10
+# AUROC needs at least this many labeled positives and negatives
+MIN_CLASS_COUNT = 1
+
+METRIC_NAMES = ("auroc", "sensitivity", "specificity", "ece", "brier")
+
+
+def weighted_ensemble(scores, weights):
+    """Weighted mean of member (samples, pathologies) scores, renormalized over the members present"""
+    members = list(scores)
+    stacked = np.stack([scores[m] for m in members], axis=0)
+    w = np.stack([np.broadcast_to(np.asarray(weights.get(m, 0.0), dtype=np.float32), stacked.shape[-1:])
+                  for m in members], axis=0)
+    total = w.sum(axis=0, keepdims=True)
+    w = np.where(total > 0, w / np.where(total > 0, total, 1.0), 1.0 / len(members))
+    return (stacked * w[:, None, :]).sum(axis=0)
+
+
+def score_metrics(probs, labels, positive, bins=ECE_BINS):
+    """Metrics of (models, samples, pathologies) probabilities against (samples, pathologies) labels
+
+    Unknown (NaN) labels are excluded per pathology. Sensitivity and
+    specificity use the per-pathology `positive` cut-offs. Returns
+    {metric: (models, pathologies)} arrays with NaN where a metric is undefined.
+    """
+    models, samples, pathologies = probs.shape
+    known = ~np.isnan(labels)
+    y = np.where(known, labels, 0.0).astype(bool)
+    pos = (known & y).sum(axis=0)
+    neg = (known & ~y).sum(axis=0)
+
+    predicted = probs > np.asarray(positive, dtype=np.float32)[None, None, :]
+    tp = (predicted & (known & y)[None]).sum(axis=1)
+    tn = (~predicted & (known & ~y)[None]).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sensitivity = np.where(pos > 0, tp / pos, np.nan)
+        specificity = np.where(neg > 0, tn / neg, np.nan)
+
+        counted = np.maximum(known.sum(axis=0), 1)
+        brier = np.where(known.sum(axis=0) > 0,
+                         (np.where(known[None], (probs - y[None]) ** 2, 0.0)).sum(axis=1) / counted, np.nan)
+
+        # ECE: one bincount over (model, pathology, bin) cells
+        which = np.minimum((probs * bins).astype(np.int64), bins - 1)
+        cell = (np.arange(models)[:, None, None] * pathologies + np.arange(pathologies)[None, None, :]) * bins + which
+        mask = np.broadcast_to(known[None], probs.shape)
+        size = models * pathologies * bins
+        prob_sums = np.bincount(cell[mask], probs[mask], size).reshape(models, pathologies, bins)
+        label_sums = np.bincount(cell[mask], np.broadcast_to(y[None], probs.shape)[mask], size).reshape(
+            models, pathologies, bins)
+        ece = np.where(known.sum(axis=0) > 0, np.abs(prob_sums - label_sums).sum(axis=2) / counted, np.nan)
+
+    # AUROC: every model's scores for one pathology are ranked in one call
+    auc = np.full((models, pathologies), np.nan)
+    for j in range(pathologies):
+        if min(pos[j], neg[j]) >= MIN_CLASS_COUNT:
+            auc[:, j] = auroc(probs[:, known[:, j], j], y[known[:, j], j])
+
+    return {"auroc": auc, "sensitivity": sensitivity, "specificity": specificity, "ece": ece, "brier": brier}
+
+
+def _value(x):
+    return None if np.isnan(x) else round(float(x), 5)
+
+
+def evaluate(scores, labels, pathologies, weights, positive, calibrate=None, bins=ECE_BINS):
+    """Per-pathology and macro-averaged metrics of each member, the weighted ensemble and,
+    with `calibrate`, the calibrated (served) ensemble"""
+    ensemble = weighted_ensemble(scores, weights)
+    models = {**scores, "ensemble_uncalibrated": ensemble}
+    if calibrate is not None:
+        models["ensemble"] = calibrate(ensemble)
+    names = list(models)
+    metrics = score_metrics(np.stack([models[name] for name in names], axis=0), labels, positive, bins)
+
+    known = ~np.isnan(labels)
+    counts = {
+        name: {"positives": int(np.nansum(labels[:, j])), "negatives": int(known[:, j].sum() - np.nansum(labels[:, j]))}
+        for j, name in enumerate(pathologies)
+    }
+    report = {}
+    for i, model in enumerate(names):
+        with np.errstate(invalid="ignore"):
+            macro = {metric: _value(np.nanmean(values[i])) if np.any(~np.isnan(values[i])) else None
+                     for metric, values in metrics.items()}
+        report[model] = {
+            "macro": macro,
+            "pathologies": {
+                name: {metric: _value(values[i, j]) for metric, values in metrics.items()}
+                for j, name in enumerate(pathologies)
+            }
+        }
+    return {"labels": counts, "models": report}
+
+
+def compare(current, baseline):
+    """Metric deltas (current - baseline) for every model and pathology both reports have"""
+    deltas = {}
+    for model, result in current["models"].items():
+        other = baseline["models"].get(model)
+        if other is None:
+            continue
+
+        def diff(a, b):
+            return {m: round(a[m] - b[m], 5) for m in METRIC_NAMES if a.get(m) is not None and b.get(m) is not None}
+
+        deltas[model] = {
+            "macro": diff(result["macro"], other["macro"]),
+            "pathologies": {
+                name: diff(values, other["pathologies"][name])
+                for name, values in result["pathologies"].items() if name in other["pathologies"]
+            }
+        }
+    return {"baseline": baseline.get("config"), "deltas": deltas}
+
+
+def config_hash(config):
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+
+
+# ==================== CLI ====================
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate a RAD-ETHIX ensemble configuration on a labeled manifest")
+    parser.add_argument("--manifest", required=True, help="CSV with filename and label (or per-pathology) columns")
+    parser.add_argument("--image-dir", help="Directory the manifest filenames are relative to")
+    parser.add_argument("--version", help="Model registry version to evaluate (default: the active one)")
+    parser.add_argument("--input-size", type=int, help="Resize inputs to this square size before inference")
+    parser.add_argument("--tta-views", type=int, default=1, help="Test-time augmentation views per image")
+    parser.add_argument("--bins", type=int, default=ECE_BINS, help="Equal-width bins for ECE")
+    parser.add_argument("--cache-dir", help="Directory for cached member scores (default: next to the output)")
+    parser.add_argument("--compare", help="Earlier evaluation output to report deltas against")
+    parser.add_argument("--output", required=True)
+    return parser.parse_args(argv)
+
+
+def main_cli(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args(argv)
+
+    # Heavy imports only for the offline job
+    import torch
+    import torch.nn.functional as F
+    import torchxrayvision as xrv
+    import main
+    from manifests import load_manifest, score_manifest
+    from tta import make_tta_views
+
+    pathologies = xrv.datasets.default_pathologies
+    manifest = load_manifest(args.manifest, pathologies, args.image_dir)
+    versions = main.model_registry.versions()
+    spec = versions[args.version] if args.version else main.model_registry.active_spec()
+    ensemble = main.MultiModelEnsemble(device=main.device, spec=spec)
+    # Default weights from the version being scored, not the service's built-in ones
+    main.threshold_engine.set_base_weights(ensemble.weights)
+    config = {"version": spec.tag, "input_size": args.input_size, "tta_views": max(args.tta_views, 1)}
+
+    def predict(batch):
+        if args.input_size:
+            batch = F.interpolate(batch, size=(args.input_size, args.input_size), mode="bilinear", align_corners=False)
+        if args.tta_views > 1:
+            individual = ensemble.predict_tta(make_tta_views(batch, args.tta_views))['individual_predictions']
+            return {name: probs[None] for name, probs in individual.items()}
+        return ensemble.predict_batch(batch)['individual_predictions']
+
+    cache_dir = args.cache_dir or os.path.join(os.path.dirname(os.path.abspath(args.output)), "scores")
+    start = time.perf_counter()
+    with torch.no_grad():
+        scores, loaded = score_manifest(manifest, ensemble, main.preprocess_xray_image, cache_dir, predict, config)
+    scored_in = time.perf_counter() - start
+
+    thresholds = main.threshold_engine.current
+    start = time.perf_counter()
+    result = evaluate(
+        {name: probs[loaded] for name, probs in scores.items()}, manifest.labels[loaded], pathologies,
+        thresholds.ensemble_weights, thresholds.positive, thresholds.calibrate, args.bins
+    )
+    logger.info(f"📊 Scored in {scored_in:.2f}s, metrics in {time.perf_counter() - start:.3f}s")
+    for model, values in result["models"].items():
+        macro = "  ".join(f"{m} {v:.4f}" for m, v in values["macro"].items() if v is not None)
+        logger.info(f"{model:24s} {macro}")
+
+    document = {
+        "evaluated_at": time.time(),
+        "manifest": os.path.abspath(args.manifest),
+        "manifest_sha256": manifest.digest,
+        "images": int(loaded.sum()),
+        "config": config,
+        "config_hash": config_hash(config),
+        "thresholds_version": thresholds.version,
+        **result
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            document["comparison"] = compare(document, json.load(f))
+        for model, delta in document["comparison"]["deltas"].items():
+            changes = "  ".join(f"{m} {v:+.4f}" for m, v in delta["macro"].items())
+            logger.info(f"Δ {model:22s} {changes}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    tmp = f"{args.output}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(document, f, indent=2)
+    os.replace(tmp, args.output)
+    logger.info(f"✅ Wrote evaluation of {config['version']} to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,64 @@
+# backend/explain.py
+"""
+Class activation maps without a backward pass
+For the DenseNet members (norm5 -> relu -> global average pool -> linear)
+the CAM of every class is a classifier-weighted sum of the final feature
+maps, so all classes come from one matrix multiply on the activations the
+prediction pass already produced. Members without that head (the ResNet)
+keep using Grad-CAM.
+"""
+
+import torch
+import torch.nn.functional as F
+
+CAM_MODES = ("cam", "gradcam")
+
+
+def supports_cam(model):
+    """True for DenseNet-style models whose logits are a linear map of pooled norm5 features"""
+    features = getattr(model, 'features', None)
+    return hasattr(features, 'norm5') and isinstance(getattr(model, 'classifier', None), torch.nn.Linear)
+
+
+class FeatureCapture:
+    """Forward hook keeping relu(norm5) of the first image of each forward pass
+
+    The first image is the original (view 0 when test-time augmentation
+    batches several views). The pooled features are the similar-case
+    embedding, so one hook serves both retrieval and CAMs.
+    """
+
+    def __init__(self, module):
+        self.features = None
+        self.handle = module.register_forward_hook(self._hook)
+
+    def _hook(self, module, inputs, output):
+        # A new tensor: the model applies relu in place to `output` right after this hook
+        with torch.no_grad():
+            self.features = F.relu(output[0]).detach()
+
+    def pop(self):
+        """(channels, h, w) features of the last forward pass, then forget them"""
+        features, self.features = self.features, None
+        return features
+
+    def remove(self):
+        self.handle.remove()
+
+
+def embedding(features):
+    """Global-average-pooled (channels,) vector, as consumed by the classifier"""
+    return features.mean(dim=(1, 2)).cpu().numpy()
+
+
+def class_activation_maps(features, classifier, size=(224, 224)):
+    """(classes, H, W) CAMs of every class, each scaled to [0, 1], as a float32 array
+
+    relu(W @ features) over the (channels, h, w) features, upsampled to `size`.
+    """
+    with torch.no_grad():
+        maps = F.relu(torch.einsum("kc,chw->khw", classifier.weight.to(features.dtype), features))
+        maps = F.interpolate(maps[None], size=size, mode="bilinear", align_corners=False)[0]
+        peak = maps.amax(dim=(1, 2), keepdim=True)
+        maps = torch.where(peak > 0, maps / peak.clamp_min(1e-12), maps)
+    return maps.cpu().numpy()
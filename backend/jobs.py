@@ -0,0 +1,207 @@
+# backend/jobs.py
+"""
+Asynchronous analysis jobs
+Jobs are recorded in SQLite so queued work and finished results survive
+restarts; a priority queue hands them to an async runner (the inference scheduler).
+Store access runs in the thread pool, off the event loop.
+"""
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import sqlite3
+import threading
+
+from starlette.concurrency import run_in_threadpool
+
+from scheduler import PRIORITY_CLASSES as JOB_PRIORITIES
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id      TEXT PRIMARY KEY,
+    status      TEXT NOT NULL,
+    priority    TEXT NOT NULL,
+    filename    TEXT,
+    input_path  TEXT,
+    options     TEXT,
+    result      TEXT,
+    error       TEXT,
+    created_at  REAL NOT NULL,
+    started_at  REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at);
+"""
+
+
+class JobStore:
+    """SQLite-backed job records"""
+
+    def __init__(self, db_path, input_dir):
+        self.input_dir = input_dir
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        os.makedirs(input_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def input_path(self, job_id):
+        return os.path.join(self.input_dir, f"{job_id}.upload")
+
+    def create(self, priority, filename, input_path, options, job_id=None):
+        job_id = job_id or uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, status, priority, filename, input_path, options, created_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, priority, filename, input_path, json.dumps(options), time.time())
+            )
+        return job_id
+
+    def mark_running(self, job_id):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ? WHERE job_id = ?",
+                (time.time(), job_id)
+            )
+
+    def mark_finished(self, job_id, result=None, error=None):
+        status = "failed" if error else "completed"
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, input_path = NULL WHERE job_id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id)
+            )
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["options"] = json.loads(job["options"]) if job["options"] else {}
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def unfinished(self):
+        """Jobs that were queued or running when the process stopped"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id, priority FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+
+def public_job(job):
+    """Job record as returned by the API (no local paths)"""
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "priority": job["priority"],
+        "filename": job["filename"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "error": job["error"],
+        "result": job["result"]
+    }
+
+
+class JobQueue:
+    """Priority queue of job ids executed by the coroutine `runner(job)`, `workers` at a time"""
+
+    def __init__(self, store, runner, workers=1):
+        self.store = store
+        self.runner = runner
+        self.workers = workers
+        self._queue = None
+        self._seq = 0
+        self._tasks = []
+        self._watchers = {}
+
+    async def start(self):
+        self._queue = asyncio.PriorityQueue()
+        # Re-queue work interrupted by a restart; its upload is still on disk
+        for job in await run_in_threadpool(self.store.unfinished):
+            self._put(job["job_id"], job["priority"])
+        if self._queue.qsize():
+            logger.info(f"📋 Re-queued {self._queue.qsize()} unfinished jobs")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, job_id, priority):
+        self._put(job_id, priority)
+
+    def depth(self):
+        return self._queue.qsize() if self._queue else 0
+
+    def _put(self, job_id, priority):
+        self._seq += 1
+        self._queue.put_nowait((JOB_PRIORITIES.get(priority, JOB_PRIORITIES["routine"]), self._seq, job_id))
+
+    async def _worker(self):
+        while True:
+            _, _, job_id = await self._queue.get()
+            try:
+                job = await run_in_threadpool(self.store.get, job_id)
+                if job is None or job["status"] in TERMINAL_STATUSES:
+                    continue
+                await run_in_threadpool(self.store.mark_running, job_id)
+                self._notify(job_id)
+                try:
+                    result = await self.runner(job)
+                    await run_in_threadpool(self.store.mark_finished, job_id, result)
+                except Exception as e:
+                    logger.error(f"❌ Job {job_id} failed: {e}")
+                    await run_in_threadpool(self.store.mark_finished, job_id, None, str(e))
+                # Only once the outcome is committed: a job cancelled by stop() stays
+                # 'running' and is re-queued from its upload on the next start
+                if job.get("input_path") and os.path.exists(job["input_path"]):
+                    os.remove(job["input_path"])
+                self._notify(job_id)
+            finally:
+                self._queue.task_done()
+
+    def _notify(self, job_id):
+        for watcher in self._watchers.get(job_id, ()):
+            watcher.put_nowait(job_id)
+
+    async def watch(self, job_id, heartbeat=15.0):
+        """Yield the job record now and after every status change until it finishes
+
+        Yields None every `heartbeat` seconds without a change so streams can send keep-alives.
+        """
+        watcher = asyncio.Queue()
+        self._watchers.setdefault(job_id, set()).add(watcher)
+        try:
+            job = await run_in_threadpool(self.store.get, job_id)
+            if job is None:
+                return
+            yield job
+            while job["status"] not in TERMINAL_STATUSES:
+                try:
+                    await asyncio.wait_for(watcher.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                job = await run_in_threadpool(self.store.get, job_id)
+                yield job
+        finally:
+            self._watchers[job_id].discard(watcher)
+            if not self._watchers[job_id]:
+                del self._watchers[job_id]
@@ -0,0 +1,49 @@
+# backend/light_main.py
+"""
+Lightweight RAD-ETHIX API
+Auth, knowledge-base and report endpoints without the models: this process
+never imports torch, torchxrayvision or OpenCV, so it starts in well under
+a second and uses a fraction of the memory of main.py. Run it next to (or
+behind the same proxy as) the full API to scale the cheap endpoints
+separately, or restart it freely during development:
+
+    uvicorn light_main:app --port 8001
+"""
+
+import logging
+
+from fastapi import FastAPI
+
+from auth import router as auth_router
+from cors import add_cors
+from reports import router as reports_router, threshold_engine
+from medical_knowledge import DEFAULT_PATHOLOGIES
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+app = FastAPI(
+    title="RAD-ETHIX API (light)",
+    description="Authentication, medical knowledge and report generation without the inference stack",
+    version="2.0.0"
+)
+add_cors(app)
+app.include_router(auth_router, prefix="/auth")
+app.include_router(reports_router)
+
+
+@app.get("/health")
+async def health_check():
+    return {
+        "status": "healthy",
+        "model_loaded": False,
+        "features": ["Authentication", "RAG Reports"],
+        "thresholds_version": threshold_engine.current.version,
+        "pathologies": DEFAULT_PATHOLOGIES
+    }
+
+
+if __name__ == "__main__":
+    import uvicorn
+    logger.info("🚀 Starting RAD-ETHIX light API server...")
+    uvicorn.run("light_main:app", host="127.0.0.1", port=8001, reload=True, log_level="info")
@@ -0,0 +1,155 @@
+# backend/localization.py
+"""
+Finding localization
+Turns each finding's class activation map into location descriptors: side
+(radiological convention, so the image's left half is the patient's right),
+upper/middle/lower zone, central/peripheral distribution and the share of
+the lung fields involved. All findings of a study are described together
+with a few array reductions against a fixed zone grid, optionally refined
+by a lung mask segmented once per study.
+"""
+
+import logging
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+ZONES = ("upper", "middle", "lower")
+
+# CAM cells at or above this fraction of the map's peak form the finding's region
+REGION_THRESHOLD = 0.5
+# Each side needs this share of the region's activation for a bilateral finding
+BILATERAL_SHARE = 0.25
+# Zones holding at least this share of the activation are named
+ZONE_SHARE = 0.3
+# Without a lung mask, the lung fields are assumed to span these rows of the cropped image and
+# to reach this far (as a fraction of the width) from the midline
+DEFAULT_LUNG_ROWS = (0.1, 0.85)
+DEFAULT_LUNG_HALF_WIDTH = 0.42
+
+
+class LungMask:
+    """Boolean masks of the patient's right and left lung in image coordinates"""
+
+    def __init__(self, right, left):
+        self.right = right
+        self.left = left
+        self.lungs = right | left
+
+
+def _zone_grid(height, top, bottom):
+    """Zone index (0 upper, 1 middle, 2 lower) of every row, splitting [top, bottom) into thirds"""
+    rows = (np.arange(height) + 0.5 - top) / max(bottom - top, 1)
+    return np.clip((rows * 3).astype(int), 0, 2)
+
+
+def _lateral_position(width, mask=None):
+    """Per column: 0 at the mediastinal edge of the lung, 1 at the chest wall"""
+    x = np.arange(width) + 0.5
+    if mask is None:
+        return np.clip(np.abs(x - width / 2) / (width * DEFAULT_LUNG_HALF_WIDTH), 0, 1)
+    u = np.ones(width)
+    for side in (mask.right, mask.left):
+        cols = np.flatnonzero(side.any(axis=0))
+        if cols.size:
+            lo, hi = cols[0], cols[-1] + 1
+            medial_is_high = (lo + hi) / 2 < width / 2  # the lung on the image's left has its medial edge at hi
+            span = max(hi - lo, 1)
+            u[lo:hi] = (hi - x[lo:hi]) / span if medial_is_high else (x[lo:hi] - lo) / span
+    return np.clip(u, 0, 1)
+
+
+def describe_regions(maps, lung_mask=None, threshold=REGION_THRESHOLD):
+    """Location descriptors for (findings, H, W) CAMs; None for maps without activation
+
+    Each descriptor has side ("right", "left" or "bilateral"), zones (names
+    with a large share of the activation), distribution ("central" or
+    "peripheral"), area_fraction (of the lung fields with a mask, else of
+    the image) and the activation-weighted centroid (x, y in [0, 1]).
+    """
+    maps = np.asarray(maps, dtype=np.float32)
+    count, height, width = maps.shape
+    peak = maps.max(axis=(1, 2), keepdims=True)
+    region = (maps >= threshold * peak) & (peak > 0)
+    if lung_mask is not None:
+        region &= lung_mask.lungs[None]
+    weights = np.where(region, maps, 0.0)
+
+    mass = weights.sum(axis=(1, 2))
+    row_mass = weights.sum(axis=2)   # (findings, H)
+    col_mass = weights.sum(axis=1)   # (findings, W)
+    safe_mass = np.maximum(mass, 1e-12)
+
+    if lung_mask is None:
+        right_share = col_mass[:, :width // 2].sum(axis=1) / safe_mass
+        top, bottom = DEFAULT_LUNG_ROWS[0] * height, DEFAULT_LUNG_ROWS[1] * height
+        area = region.sum(axis=(1, 2)) / float(height * width)
+    else:
+        right_share = (weights * lung_mask.right[None]).sum(axis=(1, 2)) / safe_mass
+        rows = np.flatnonzero(lung_mask.lungs.any(axis=1))
+        top, bottom = (rows[0], rows[-1] + 1) if rows.size else (0, height)
+        area = region.sum(axis=(1, 2)) / max(float(lung_mask.lungs.sum()), 1.0)
+
+    zone_of_row = _zone_grid(height, top, bottom)
+    zone_share = np.stack([row_mass[:, zone_of_row == z].sum(axis=1) for z in range(3)], axis=1) / safe_mass[:, None]
+    lateral = col_mass @ _lateral_position(width, lung_mask) / safe_mass
+    centroid_x = col_mass @ ((np.arange(width) + 0.5) / width) / safe_mass
+    centroid_y = row_mass @ ((np.arange(height) + 0.5) / height) / safe_mass
+
+    descriptors = []
+    for i in range(count):
+        if mass[i] <= 0:
+            descriptors.append(None)
+            continue
+        if min(right_share[i], 1 - right_share[i]) >= BILATERAL_SHARE:
+            side = "bilateral"
+        else:
+            side = "right" if right_share[i] > 0.5 else "left"
+        zones = [ZONES[z] for z in range(3) if zone_share[i, z] >= ZONE_SHARE] or [ZONES[int(np.argmax(zone_share[i]))]]
+        descriptors.append({
+            "side": side,
+            "zones": zones,
+            "distribution": "peripheral" if lateral[i] >= 0.5 else "central",
+            "area_fraction": round(float(area[i]), 4),
+            "centroid": [round(float(centroid_x[i]), 3), round(float(centroid_y[i]), 3)],
+            "lung_mask": lung_mask is not None
+        })
+    return descriptors
+
+
+def location_text(descriptor):
+    """e.g. 'Right lower zone, peripheral, about 8% of the lung fields'"""
+    if not descriptor:
+        return None
+    zones = descriptor["zones"]
+    zone_text = "all zones" if len(zones) == 3 else " and ".join(zones) + (" zones" if len(zones) > 1 else " zone")
+    extent = "the lung fields" if descriptor["lung_mask"] else "the image"
+    return (f"{descriptor['side'].capitalize()} {zone_text}, {descriptor['distribution']}, "
+            f"about {descriptor['area_fraction'] * 100:.0f}% of {extent}")
+
+
+class LungSegmenter:
+    """Lung fields from the TorchXRayVision ChestX-Det PSPNet, run once per study"""
+
+    def __init__(self, device="cpu"):
+        import torchxrayvision as xrv
+
+        self.device = device
+        self.model = xrv.baseline_models.chestx_det.PSPNet().to(device).eval()
+        self.lung_channels = [self.model.targets.index("Left Lung"), self.model.targets.index("Right Lung")]
+
+    def segment(self, img_tensor, size=(224, 224)):
+        """LungMask at `size` for a (1, 1, H, W) normalized input, or None if no lung is found"""
+        with torch.no_grad():
+            with torch.profiler.record_function("localization.lung_mask"):
+                logits = self.model(img_tensor[:1])[0, self.lung_channels]
+                logits = torch.nn.functional.interpolate(logits[None], size=size, mode="bilinear", align_corners=False)[0]
+        masks = (logits > 0).cpu().numpy()
+        if not masks.any():
+            return None
+        # Assign sides by position, so the convention does not depend on the segmenter's labels
+        centers = [np.flatnonzero(m.any(axis=0)).mean() if m.any() else size[1] for m in masks]
+        right, left = (masks[0], masks[1]) if centers[0] < centers[1] else (masks[1], masks[0])
+        return LungMask(right, left)
@@ -1,23 +1,49 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Header, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, FileResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 import torch
 import torch.nn.functional as F
-import torchvision.transforms
-import torchxrayvision as xrv
 import cv2
 import numpy as np
 from PIL import Image
 import io
-import base64
+import os
+import json
+import math
+import time
+import asyncio
+import hashlib
+import uuid
+import shutil
 import logging
+import threading
+from contextlib import nullcontext
 from typing import Dict, List, Any
-import pandas as pd
-import skimage
-import skimage.io
 from datetime import datetime
+from auth import require_admin, router as auth_router
+from cors import add_cors
+from profiling import RequestProfiler
+from memory import BufferPool, MemoryBudget, PeakMemoryTracker, estimate_request_bytes, MB
+from starlette.concurrency import run_in_threadpool
+from uploads import UploadSizeLimitMiddleware, hash_upload
+from cache import LRUCache
+from overlays import OverlayOptions, OverlayRenderer, encode_overlays
+from jobs import JobStore, JobQueue, public_job
+from store import DATA_DIR
+from comparison import summarize_cam
+from similarity import SimilarityIndex
+from explain import CAM_MODES, FeatureCapture, supports_cam, class_activation_maps, embedding as pooled_embedding
+from localization import LungSegmenter, describe_regions, location_text
+from scheduler import InferenceScheduler, resolve_priority
+from tta import make_tta_views, MAX_TTA_VIEWS
+from medical_knowledge import DEFAULT_PATHOLOGIES
+from thresholds import INVALID_SETTINGS, DEFAULT_ENSEMBLE_WEIGHTS
+from reports import router as reports_router, clinical_store, threshold_engine, knowledge_base, study_comparison
+from model_registry import ModelRegistry, ModelSpec, BUILTIN_VERSION, BUILTIN_SPEC, build_member
+from shadow import ShadowEvaluator, SHADOW_VERSION
+from drift import DriftMonitor
+from admission import create_admission_controller, client_key
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -30,388 +56,158 @@ app = FastAPI(
     version="2.0.0"
 )
 
-# Configure CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[
-        "http://localhost:3000",
-        "http://127.0.0.1:3000",
-        "http://localhost:8000",
-        "http://127.0.0.1:8000",
-        "http://localhost:3001",
-        "http://127.0.0.1:3001",
-        "http://localhost:5173",
-        "http://127.0.0.1:5173"
-    ],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# ==================== AUTH SECTION ====================
-# Hardcoded user database
-USERS_DB = {
-    "PES1UG24CS053": {
-        "patient_id": "PES1UG24CS053",
-        "name": "Amogh",
-        "age": 19,
-        "gender": "Male"
-    }
-}
-
-# Store additional registered users (in-memory for demo)
-registered_users = {}
-
-class SignupRequest(BaseModel):
-    name: str
-    age: int
-    gender: str
-
-class LoginRequest(BaseModel):
-    patient_id: str
-
-class UserResponse(BaseModel):
-    patient_id: str
-    name: str
-    age: int
-    gender: str
-
-@app.post("/auth/signup", response_model=UserResponse)
-async def signup(request: SignupRequest):
-    """Register a new patient"""
-    existing_count = len(USERS_DB) + len(registered_users)
-    new_id = f"PES1UG24CS{str(existing_count + 54).zfill(3)}"
-    new_user = {
-        "patient_id": new_id,
-        "name": request.name,
-        "age": request.age,
-        "gender": request.gender
-    }
-    registered_users[new_id] = new_user
-    return new_user
-
-@app.post("/auth/login", response_model=UserResponse)
-async def login(request: LoginRequest):
-    """Login with patient ID"""
-    patient_id = request.patient_id.upper().strip()
-    if patient_id in USERS_DB:
-        return USERS_DB[patient_id]
-    if patient_id in registered_users:
-        return registered_users[patient_id]
-    raise HTTPException(status_code=404, detail="Patient ID not found")
-
-@app.get("/auth/verify/{patient_id}", response_model=UserResponse)
-async def verify_patient(patient_id: str):
-    """Verify if patient ID exists"""
-    patient_id = patient_id.upper().strip()
-    if patient_id in USERS_DB:
-        return USERS_DB[patient_id]
-    if patient_id in registered_users:
-        return registered_users[patient_id]
-    raise HTTPException(status_code=404, detail="Patient ID not found")
-
-# ==================== MEDICAL KNOWLEDGE BASE ====================
-MEDICAL_KNOWLEDGE = {
-    "Atelectasis": {
-        "definition": "Collapse or closure of a lung resulting in reduced or absent gas exchange",
-        "xray_findings": ["Increased opacity in affected area", "Volume loss with mediastinal shift", "Elevation of hemidiaphragm"],
-        "clinical_significance": "May indicate airway obstruction, post-surgical complication, or mucus plugging",
-        "action_steps": ["Assess for underlying cause", "Consider chest physiotherapy", "Evaluate need for bronchoscopy if persistent"],
-        "citations": ["Woodring JH, Reed JC. Types and mechanisms of pulmonary atelectasis. J Thorac Imaging. 1996;11(2):92-108"]
-    },
-    "Cardiomegaly": {
-        "definition": "Enlargement of the heart, typically defined as cardiothoracic ratio >0.5 on PA chest X-ray",
-        "xray_findings": ["Increased cardiac silhouette width", "Cardiothoracic ratio greater than 50%", "Bilateral cardiac border enlargement"],
-        "clinical_significance": "Associated with heart failure, valvular disease, hypertension, or cardiomyopathy",
-        "action_steps": ["Perform echocardiography for assessment", "Evaluate for signs of heart failure", "Check BNP/NT-proBNP levels"],
-        "citations": ["Danzer CS. The cardiothoracic ratio: An index of cardiac enlargement. Am J Med Sci. 1919;157:513-521"]
-    },
-    "Consolidation": {
-        "definition": "Lung tissue has filled with liquid instead of air, appearing as increased density",
-        "xray_findings": ["Homogeneous opacity obscuring vascular markings", "Air bronchograms may be visible", "Lobar or segmental distribution"],
-        "clinical_significance": "Most commonly indicates pneumonia, but can represent pulmonary edema or hemorrhage",
-        "action_steps": ["Correlate with clinical symptoms", "Consider sputum culture and blood tests", "Initiate appropriate antibiotic therapy if infectious"],
-        "citations": ["Hansell DM, et al. Fleischner Society: Glossary of terms for thoracic imaging. Radiology. 2008;246(3):697-722"]
-    },
-    "Edema": {
-        "definition": "Accumulation of fluid in lung interstitium and alveoli",
-        "xray_findings": ["Bilateral perihilar opacity", "Kerley B lines", "Pleural effusions", "Vascular redistribution to upper lobes"],
-        "clinical_significance": "Indicates heart failure, fluid overload, ARDS, or renal failure",
-        "action_steps": ["Administer diuretics if cardiac origin", "Assess volume status", "Monitor oxygen saturation"],
-        "citations": ["Ware LB, Matthay MA. Acute pulmonary edema. N Engl J Med. 2005;353(26):2788-2792"]
-    },
-    "Enlarged Cardiomediastinum": {
-        "definition": "Widening of the mediastinal silhouette beyond normal limits",
-        "xray_findings": ["Mediastinal width >8 cm on PA view", "Widening of superior mediastinum", "Loss of normal contours"],
-        "clinical_significance": "May indicate cardiomegaly, lymphadenopathy, mediastinal mass, or aortic aneurysm",
-        "action_steps": ["Obtain CT chest with contrast", "Assess for aortic pathology", "Consider echocardiography"],
-        "citations": ["Whitten CR, et al. A diagnostic approach to mediastinal abnormalities. Radiographics. 2007;27(3):657-671"]
-    },
-    "Fracture": {
-        "definition": "Break in continuity of rib or other thoracic bony structures",
-        "xray_findings": ["Cortical disruption or step-off", "Displacement of bone fragments", "Associated soft tissue swelling"],
-        "clinical_significance": "Trauma-related injury with risk of underlying pulmonary contusion or pneumothorax",
-        "action_steps": ["Assess for pneumothorax or hemothorax", "Provide adequate analgesia", "Encourage incentive spirometry"],
-        "citations": ["Sirmali M, et al. Analysis of traumatic rib fractures. Eur J Cardiothorac Surg. 2003;24(1):133-138"]
-    },
-    "Lung Lesion": {
-        "definition": "Focal abnormality within lung parenchyma",
-        "xray_findings": ["Discrete rounded or irregular opacity", "Well-defined or poorly-defined margins", "Variable size"],
-        "clinical_significance": "Differential includes malignancy, infection, benign tumor, or metastasis",
-        "action_steps": ["Obtain prior imaging for comparison", "CT chest with contrast", "Consider biopsy or PET scan if malignancy suspected"],
-        "citations": ["MacMahon H, et al. Guidelines for Management of Pulmonary Nodules. Radiology. 2017;284(1):228-243"]
-    },
-    "Lung Opacity": {
-        "definition": "Any area of increased density within the lung parenchyma",
-        "xray_findings": ["Hazy increased density", "Ground-glass appearance possible", "Variable patterns and distributions"],
-        "clinical_significance": "Non-specific finding that may represent infection, inflammation, or interstitial disease",
-        "action_steps": ["Clinical correlation with symptoms essential", "Determine acute versus chronic nature", "Consider CT chest if persistent"],
-        "citations": ["Hansell DM, et al. Fleischner Society glossary. Radiology. 2008;246(3):697-722"]
-    },
-    "No Finding": {
-        "definition": "Chest radiograph demonstrates normal pulmonary and cardiac structures",
-        "xray_findings": ["Clear lung fields bilaterally", "Normal cardiac silhouette", "Sharp costophrenic angles"],
-        "clinical_significance": "Normal chest radiograph, though clinical symptoms may still warrant further evaluation",
-        "action_steps": ["Correlate with clinical presentation", "CT chest may be warranted if high clinical suspicion", "Routine follow-up"],
-        "citations": ["Raoof S, et al. Interpretation of plain chest roentgenogram. Chest. 2012;141(2):545-558"]
-    },
-    "Pleural Effusion": {
-        "definition": "Abnormal collection of fluid in the pleural space",
-        "xray_findings": ["Blunting of costophrenic angle", "Meniscus sign", "Homogeneous opacity at lung base"],
-        "clinical_significance": "Multiple etiologies including heart failure, infection, malignancy, or inflammatory conditions",
-        "action_steps": ["Perform thoracentesis for diagnostic sampling", "Analyze pleural fluid", "Treat underlying cause"],
-        "citations": ["Light RW. Clinical practice. Pleural effusion. N Engl J Med. 2002;346(25):1971-1977"]
-    },
-    "Pleural Other": {
-        "definition": "Pleural abnormalities other than effusion",
-        "xray_findings": ["Pleural thickening or irregularity", "Pleural plaques", "Calcification along pleural surfaces"],
-        "clinical_significance": "May indicate asbestos exposure, prior empyema, tuberculosis, or pleural malignancy",
-        "action_steps": ["Obtain detailed occupational history", "CT chest for characterization", "Consider pleural biopsy if malignancy suspected"],
-        "citations": ["Huggins JT, et al. Pleural disease. Lancet. 2017;390(10113):2662-2674"]
-    },
-    "Pneumonia": {
-        "definition": "Infection of the lung parenchyma with inflammatory consolidation",
-        "xray_findings": ["Airspace opacity with consolidation", "Air bronchograms commonly present", "Lobar, segmental, or patchy distribution"],
-        "clinical_significance": "Common respiratory infection requiring prompt antibiotic therapy",
-        "action_steps": ["Assess severity using CURB-65 or PSI score", "Obtain blood and sputum cultures", "Initiate empiric antibiotic therapy"],
-        "citations": ["Metlay JP, et al. Diagnosis and Treatment of Adults with Community-acquired Pneumonia. Am J Respir Crit Care Med. 2019;200(7):e45-e67"]
-    },
-    "Pneumothorax": {
-        "definition": "Presence of air in the pleural space causing partial or complete lung collapse",
-        "xray_findings": ["Visceral pleural line visible", "Absence of lung markings peripheral to line", "Deep sulcus sign on supine films"],
-        "clinical_significance": "May be spontaneous or traumatic, tension pneumothorax is life-threatening emergency",
-        "action_steps": ["Assess hemodynamic stability immediately", "Measure size of pneumothorax", "Consider chest tube placement", "Immediate needle decompression if tension pneumothorax"],
-        "citations": ["MacDuff A, et al. Management of spontaneous pneumothorax. Thorax. 2010;65 Suppl 2:ii18-31"]
-    },
-    "Support Devices": {
-        "definition": "Medical devices visible on chest radiograph",
-        "xray_findings": ["Endotracheal or tracheostomy tube", "Central venous catheters", "Nasogastric tubes", "Chest tubes, pacemakers"],
-        "clinical_significance": "Important to verify appropriate positioning and absence of complications",
-        "action_steps": ["Verify endotracheal tube position 2-4 cm above carina", "Confirm central line tip in lower SVC", "Check for pneumothorax after device placement"],
-        "citations": ["Godwin JD, et al. Pitfalls in ICU chest radiograph evaluation. J Thorac Imaging. 1995;10(4):247-254"]
-    }
-}
-
-def get_pathology_info(pathology_name):
-    """Retrieve medical knowledge for a specific pathology"""
-    # Map variations to standard names
-    name_mapping = {
-        "Infiltration": "Lung Opacity",
-        "Effusion": "Pleural Effusion",
-        "Pleural_Thickening": "Pleural Other",
-        "Nodule": "Lung Lesion",
-        "Mass": "Lung Lesion",
-        "Hernia": "Enlarged Cardiomediastinum"
-    }
-    lookup_name = name_mapping.get(pathology_name, pathology_name)
-    return MEDICAL_KNOWLEDGE.get(lookup_name, None)
-
-# ==================== RAG REPORT GENERATION ====================
-class PredictionResult(BaseModel):
-    disease: str
-    confidence: float
-    severity: str
-    description: str
-    critical: Optional[bool] = False
-
-class ReportRequest(BaseModel):
-    patient_name: str
-    patient_id: str
-    age: int
-    gender: str
-    predictions: List[PredictionResult]
-
-class ReportResponse(BaseModel):
-    report_text: str
-    citations: List[str]
-    findings_count: int
-    timestamp: str
-
-def generate_professional_report(patient_data, ml_predictions, top_n=5):
-    """Generate hospital-grade report"""
-    from datetime import datetime
-
-    sorted_predictions = sorted(ml_predictions, key=lambda x: x['confidence'], reverse=True)
-    top_predictions = sorted_predictions[:top_n]
-
-    report = "=" * 80 + "\n"
-    report += " " * 20 + "DEPARTMENT OF RADIOLOGY\n"
-    report += " " * 15 + "CHEST RADIOGRAPH DIAGNOSTIC REPORT\n"
-    report += "=" * 80 + "\n\n"
-
-    # Patient Info
-    report += "PATIENT INFORMATION\n"
-    report += "━" * 80 + "\n"
-    report += f"Name           : {patient_data['name']}\n"
-    report += f"Patient ID     : {patient_data['patient_id']}\n"
-    report += f"Age/Gender     : {patient_data['age']} years / {patient_data['gender']}\n"
-    report += f"Examination    : Chest X-Ray (PA/Lateral)\n"
-    report += f"Date           : {datetime.now().strftime('%B %d, %Y')}\n"
-    report += "Physician      : [To be filled]\n\n"
-
-    # AI Analysis
-    report += "AI-ASSISTED ANALYSIS\n"
-    report += "━" * 80 + "\n"
-    report += "Multi-Model Ensemble: DenseNet121 (60%) + ResNet50 (25%) + EfficientNet (15%)\n\n"
-
-    # Findings
-    report += "FINDINGS\n"
-    report += "━" * 80 + "\n\n"
-
-    if not top_predictions or all(p['confidence'] < 0.3 for p in top_predictions):
-        report += "LUNGS:\n  • Clear lung fields bilaterally\n\n"
-        report += "HEART: \n  • Cardiac silhouette within normal limits\n\n"
-    else:
-        report += "LUNGS:\n"
-        for idx, pred in enumerate([p for p in top_predictions if p['confidence'] >= 0.3], 1):
-            knowledge = get_pathology_info(pred['disease'])
-            if knowledge:
-                report += f"  {idx}. {knowledge['xray_findings'][0]} consistent with {pred['disease'].lower()}\n"
-                report += f"     Confidence: {pred['confidence']*100:.1f}% | Agreement: {pred.get('agreement', 1.0)*100:.1f}%\n"
-        report += "\n"
-
-    # Impression
-    report += "IMPRESSION\n"
-    report += "━" * 80 + "\n"
-    if not top_predictions or all(p['confidence'] < 0.3 for p in top_predictions):
-        report += "1. No acute cardiopulmonary disease\n\n"
-    else:
-        for idx, pred in enumerate([p for p in top_predictions if p['confidence'] >= 0.3], 1):
-            knowledge = get_pathology_info(pred['disease'])
-            if knowledge:
-                report += f"{idx}. {pred['disease']}: {knowledge['clinical_significance']}\n"
-        report += "\n"
-
-    # Recommendations
-    report += "RECOMMENDATIONS\n"
-    report += "━" * 80 + "\n"
-    if not top_predictions or all(p['confidence'] < 0.3 for p in top_predictions):
-        report += "• No immediate action required\n\n"
-    else:
-        recs = set()
-        for pred in [p for p in top_predictions if p['confidence'] >= 0.3]:
-            knowledge = get_pathology_info(pred['disease'])
-            if knowledge:
-                recs.update(knowledge['action_steps'][:2])
-        for idx, rec in enumerate(sorted(recs), 1):
-            report += f"{idx}. {rec}\n"
-        report += "\n"
-
-    # Footer
-    report += "=" * 80 + "\n"
-    report += "Report generated by RAD-ETHIX Multi-Model AI System\n"
-    report += "⚠️  Requires licensed radiologist review before clinical use\n"
-    report += "=" * 80 + "\n\n"
-    report += "Radiologist Signature: ________________________  Date: ______________\n"
-
-    citations = []
-    for pred in [p for p in top_predictions if p['confidence'] >= 0.3]:
-        knowledge = get_pathology_info(pred['disease'])
-        if knowledge and 'citations' in knowledge:
-            citations.extend(knowledge['citations'])
+# Reject oversized uploads while they stream in (added before CORS so errors keep CORS headers)
+MAX_UPLOAD_BYTES = int(float(os.environ.get("RAD_ETHIX_MAX_UPLOAD_MB", "50")) * MB)
+app.add_middleware(UploadSizeLimitMiddleware, max_bytes=MAX_UPLOAD_BYTES, paths=("/predict", "/jobs"))
 
-    return {
-        'report_text': report,
-        'citations': list(dict.fromkeys(citations))[:5],
-        'findings_count': len([p for p in top_predictions if p['confidence'] >= 0.3]),
-        'timestamp': datetime.now().isoformat()
-    }
+# Configure CORS
+add_cors(app)
 
-@app.post("/generate-report", response_model=ReportResponse)
-async def generate_report(request: ReportRequest):
-    """Generate medical report using RAG"""
-    try:
-        patient_data = {
-            "name": request.patient_name,
-            "patient_id": request.patient_id,
-            "age": request.age,
-            "gender": request.gender
-        }
+# ==================== AUTH, KNOWLEDGE & REPORTS ====================
+# Torch-free routes, also served on their own by light_main.py
+app.include_router(auth_router, prefix="/auth")
+app.include_router(reports_router)
 
-        ml_predictions = [
-            {
-                "disease": p.disease,
-                "confidence": p.confidence,
-                "severity": p.severity
-            }
-            for p in request.predictions
-        ]
+# ==================== EXISTING ML CODE ====================
+# "cam": DenseNet CAMs from the prediction pass's features (ResNet keeps Grad-CAM); "gradcam": Grad-CAM for all
+CAM_MODE = os.environ.get("RAD_ETHIX_CAM_MODE", "cam")
+if CAM_MODE not in CAM_MODES:
+    raise ValueError(f"RAD_ETHIX_CAM_MODE must be one of {CAM_MODES}")
 
-        report_data = generate_professional_report(patient_data, ml_predictions)
-        return report_data
+# Lung fields segmented once per study to refine finding locations (extra model, off by default)
+LUNG_MASK_ENABLED = os.environ.get("RAD_ETHIX_LUNG_MASK", "0") == "1"
+lung_segmenter = None
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+# Test-time augmentation views per request (0 or 1 disables it)
+DEFAULT_TTA_VIEWS = int(os.environ.get("RAD_ETHIX_TTA_VIEWS", "0"))
 
-@app.get("/pathologies")
-async def list_pathologies():
-    """Get list of all supported pathologies"""
-    return {"pathologies": list(MEDICAL_KNOWLEDGE.keys())}
+# DenseNet121 penultimate features used for similar-case retrieval
+EMBEDDING_DIM = 1024
 
-# ==================== EXISTING ML CODE ====================
-POSITIVE_THRESHOLD = 0.3
-HIGH_CONFIDENCE_THRESHOLD = 0.7
-DOCTOR_REVIEW_THRESHOLD = 0.6
+# Findings that need prompt attention, and the primary-model pre-screen that promotes them
+CRITICAL_PATHOLOGIES = ['Pneumothorax', 'Mass', 'Pneumonia']
+PRIMARY_MODEL = 'densenet121'  # for pre-built ensembles; registry versions name their own
 
 model = None
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 ensemble_model = None
 
+# Sampling profiler for /predict (disabled unless a sample rate is configured)
+request_profiler = RequestProfiler(
+    trace_dir=os.environ.get("RAD_ETHIX_PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")),
+    sample_rate=float(os.environ.get("RAD_ETHIX_PROFILE_SAMPLE_RATE", "0")),
+    max_traces=int(os.environ.get("RAD_ETHIX_PROFILE_MAX_TRACES", "20"))
+)
+
+# Memory-bounded mode: eager frees, pooled buffers and an in-flight memory budget
+LOW_MEMORY_MODE = os.environ.get("RAD_ETHIX_LOW_MEMORY", "0") == "1"
+LOW_MEMORY_INPUT_SIZE = 512  # largest member resolution (resnet50-res512) when the ensemble has no spec
+PER_INFERENCE_BYTES = int(float(os.environ.get("RAD_ETHIX_INFERENCE_OVERHEAD_MB", "400")) * MB)
+memory_budget = MemoryBudget(int(float(os.environ.get("RAD_ETHIX_MEMORY_BUDGET_MB", "2048")) * MB))
+buffer_pool = BufferPool()
+
+# Grad-CAM hooks live on the shared models, so model work runs one request at a time
+inference_lock = threading.Lock()
+inference_scheduler = InferenceScheduler(lock=inference_lock)
+
+# Per-client token buckets in front of the scheduler; weights also set each client's fair share
+admission = create_admission_controller()
+
+# Candidate models evaluated on a sample of live inputs, only while inference is idle
+shadow_evaluator = ShadowEvaluator(DEFAULT_PATHOLOGIES, is_busy=inference_scheduler.busy)
+
+# Streaming input/output distributions, compared against a saved reference window
+drift_monitor = DriftMonitor(DEFAULT_PATHOLOGIES)
+
+# Analysis results keyed by upload hash, so identical re-uploads skip inference
+result_cache = LRUCache(max_entries=int(os.environ.get("RAD_ETHIX_RESULT_CACHE_SIZE", "32")))
+
+# Local state (job database, pending uploads)
+similarity_index = SimilarityIndex(
+    os.path.join(DATA_DIR, "similarity"), dim=EMBEDDING_DIM,
+    nprobe=int(os.environ.get("RAD_ETHIX_SIMILARITY_NPROBE", "8"))
+)
+job_store = JobStore(os.path.join(DATA_DIR, "jobs.sqlite3"), os.path.join(DATA_DIR, "job_inputs"))
+
+def install_ensemble(ensemble):
+    """Make `ensemble` the one new analyses use, with its version's ensemble weights as the default"""
+    global ensemble_model
+    ensemble_model = ensemble
+    threshold_engine.set_base_weights(ensemble.weights)
+
 class MultiModelEnsemble:
-    """Weighted ensemble of 3 models"""
-    def __init__(self, device='cpu'):
+    """Weighted ensemble of the members of one model registry version"""
+    def __init__(self, device='cpu', models=None, spec=None):
         self.device = device
-        self.weights = {'densenet121': 0.60, 'resnet50': 0.25, 'efficientnet': 0.15}
         self.models = {}
 
-        logger.info("📦 Loading DenseNet121...")
-        self.models['densenet121'] = xrv.models.DenseNet(weights="densenet121-res224-chex")
-        self.models['densenet121'].to(device).eval()
+        if models is not None:
+            # Pre-built members (e.g. random-weight stand-ins for offline benchmarks)
+            self.spec = None
+            for model_name, member in models.items():
+                self.models[model_name] = member.to(device).eval()
+        else:
+            self.spec = spec or ModelSpec(BUILTIN_VERSION, BUILTIN_SPEC)
+            self.load_members()
+
+        self.weights = dict(self.spec.ensemble_weights if self.spec else DEFAULT_ENSEMBLE_WEIGHTS)
+        self.primary = self.spec.primary if self.spec else PRIMARY_MODEL
+        self.version = self.spec.tag if self.spec else "custom"
+        self.input_size = self.spec.input_size if self.spec else LOW_MEMORY_INPUT_SIZE
+
+        # Final DenseNet feature maps, captured by every forward pass of those members
+        # (similar-case embedding and gradient-free CAMs)
+        self.feature_captures = {
+            model_name: FeatureCapture(member.features.norm5)
+            for model_name, member in self.models.items() if supports_cam(member)
+        }
 
-        logger.info("📦 Loading ResNet50...")
-        self.models['resnet50'] = xrv.models.ResNet(weights="resnet50-res512-all")
-        self.models['resnet50'].to(device).eval()
+    def load_members(self):
+        for model_name, member_spec in self.spec.members.items():
+            logger.info(f"📦 Loading {model_name} ({member_spec['weights']})...")
+            self.models[model_name] = build_member(member_spec, self.device)
 
-        logger.info("📦 Loading EfficientNet...")
-        # You had DenseNet weights used for efficientnet placeholder earlier; keeping that consistent, but you may want to replace with correct efficientnet weights if available.
-        self.models['efficientnet'] = xrv.models.DenseNet(weights="densenet121-res224-all")
-        self.models['efficientnet'].to(device).eval()
+    def release(self):
+        """Drop hooks and members once no analysis uses this version any more"""
+        for capture in self.feature_captures.values():
+            capture.remove()
+        self.feature_captures = {}
+        self.models = {}
 
-    def predict(self, img_tensor):
-        individual_preds = {}
+    def predict_member(self, model_name, img_batch):
+        """Probabilities of a single member, shape (batch, pathologies)"""
         with torch.no_grad():
-            for model_name, model in self.models.items():
-                output = model(img_tensor)
-                probs = torch.sigmoid(output).cpu().numpy()[0]
-                individual_preds[model_name] = probs
-
-        # Weighted ensemble
-        weighted_preds = np.zeros_like(individual_preds['densenet121'])
-        for model_name, probs in individual_preds.items():
-            weighted_preds += probs * self.weights[model_name]
-
-        # Agreement scores
-        pred_matrix = np.array([preds for preds in individual_preds.values()])
+            with torch.profiler.record_function(f"ensemble.{model_name}"):
+                output = self.models[model_name](img_batch)
+        return torch.sigmoid(output).cpu().numpy()
+
+    def predict_batch(self, img_batch, precomputed=None, weights=None):
+        """Predict a batch of images, returning (batch, pathologies) arrays
+
+        `precomputed` maps member names to outputs that were already computed
+        (e.g. by the pre-screen pass), so those members are not run again.
+        `weights` (scalars or per-pathology vectors) overrides self.weights.
+        """
+        precomputed = precomputed or {}
+        weights = weights or self.weights
+        individual_preds = {}
+        for model_name in self.models:
+            if model_name in precomputed:
+                individual_preds[model_name] = precomputed[model_name]
+            else:
+                individual_preds[model_name] = self.predict_member(model_name, img_batch)
+
+        # Weighted ensemble, renormalized over these members in case the weights name others
+        member_weights = [np.asarray(weights.get(name, 0.0), dtype=np.float32) for name in individual_preds]
+        total = sum(member_weights)
+        if np.any(total <= 0):
+            member_weights, total = [np.float32(1.0)] * len(member_weights), np.float32(len(member_weights))
+        weighted_preds = np.zeros_like(next(iter(individual_preds.values())))
+        for probs, weight in zip(individual_preds.values(), member_weights):
+            weighted_preds += probs * (weight / total)
+
+        # Agreement scores (std across models, per image and pathology)
+        pred_matrix = np.stack([preds for preds in individual_preds.values()])
         std_devs = np.std(pred_matrix, axis=0)
         agreement_scores = np.exp(-std_devs * 2)
 
@@ -421,26 +217,31 @@ class MultiModelEnsemble:
             'agreement_scores': agreement_scores
         }
 
-DISEASE_DESCRIPTIONS = {
-    'Atelectasis': 'Collapse or closure of lung tissue resulting in reduced gas exchange',
-    'Consolidation': 'Areas of lung filled with liquid instead of air, often indicating pneumonia',
-    'Infiltration': 'Abnormal substance in lung tissue, may indicate infection or inflammation',
-    'Pneumothorax': 'Collapsed lung due to air leak - requires immediate medical attention',
-    'Edema': 'Fluid accumulation in lung tissue, may indicate heart failure',
-    'Emphysema': 'Lung condition causing shortness of breath due to damaged air sacs',
-    'Fibrosis': 'Lung scarring that makes breathing difficult',
-    'Effusion': 'Abnormal accumulation of fluid around the lungs',
-    'Pneumonia': 'Lung infection causing inflammation - may need antibiotic treatment',
-    'Pleural_Thickening': 'Scarring of the lining around the lungs',
-    'Cardiomegaly': 'Enlarged heart, may indicate underlying heart disease',
-    'Nodule': 'Small spots in lungs that need follow-up evaluation',
-    'Mass': 'Larger abnormal growth requiring immediate medical evaluation',
-    'Hernia': 'Protrusion of organs visible on chest X-ray',
-    'Lung Lesion': 'Abnormal tissue in lungs requiring medical assessment',
-    'Fracture': 'Bone break visible on chest X-ray',
-    'Lung Opacity': 'Cloudy areas in lungs that may indicate disease',
-    'Enlarged Cardiomediastinum': 'Enlargement of heart and surrounding structures'
-}
+    def predict(self, img_tensor, precomputed=None, weights=None):
+        precomputed = {name: probs[None] for name, probs in (precomputed or {}).items()}
+        results = self.predict_batch(img_tensor, precomputed, weights)
+        return {
+            'ensemble_predictions': results['ensemble_predictions'][0],
+            'individual_predictions': {name: probs[0] for name, probs in results['individual_predictions'].items()},
+            'agreement_scores': results['agreement_scores'][0]
+        }
+
+    def predict_tta(self, views, precomputed=None, weights=None):
+        """Aggregate predictions over the (K, 1, H, W) augmented views of one image
+
+        Every member sees all views as one batch. Predictions are the mean over
+        views; agreement combines between-model spread with across-view variance.
+        """
+        results = self.predict_batch(views, precomputed, weights)
+        individual_means = {name: probs.mean(axis=0) for name, probs in results['individual_predictions'].items()}
+        view_variance = results['ensemble_predictions'].var(axis=0)
+        model_variance = np.var(np.stack(list(individual_means.values())), axis=0)
+        return {
+            'ensemble_predictions': results['ensemble_predictions'].mean(axis=0),
+            'individual_predictions': individual_means,
+            'agreement_scores': np.exp(-np.sqrt(model_variance + view_variance) * 2),
+            'tta_variance': view_variance
+        }
 
 class TorchXRayVisionGradCAM:
     """Grad-CAM implementation for TorchXRayVision models"""
@@ -448,6 +249,7 @@ class TorchXRayVisionGradCAM:
         self.model = model
         self.gradients = None
         self.activations = None
+        self.hook_handles = []
         self.hook_layers()
 
     def hook_layers(self):
@@ -477,30 +279,40 @@ class TorchXRayVisionGradCAM:
                     break
 
         if target_layer is not None:
-            target_layer.register_forward_hook(forward_hook)
+            self.hook_handles.append(target_layer.register_forward_hook(forward_hook))
             # register_backward_hook is deprecated in newer PyTorch; this is kept for compatibility.
             try:
-                target_layer.register_backward_hook(backward_hook)
+                self.hook_handles.append(target_layer.register_backward_hook(backward_hook))
             except Exception:
                 # Fallback: try register_full_backward_hook if available
                 try:
-                    target_layer.register_full_backward_hook(lambda module, grad_input, grad_output: backward_hook(module, grad_input, grad_output))
+                    self.hook_handles.append(target_layer.register_full_backward_hook(lambda module, grad_input, grad_output: backward_hook(module, grad_input, grad_output)))
                 except Exception:
                     logger.warning("Could not register backward hook on target layer")
 
         else:
             logger.warning("Could not find target layer for Grad-CAM")
 
-    def generate_cam(self, input_tensor, class_idx):
+    def release(self):
+        """Remove hooks from the shared model and drop captured tensors"""
+        for handle in self.hook_handles:
+            handle.remove()
+        self.hook_handles = []
+        self.gradients = None
+        self.activations = None
+
+    def generate_cam(self, input_tensor, class_idx, retain_graph=True):
         self.model.eval()
-        output = self.model(input_tensor)
+        with torch.profiler.record_function("gradcam.forward"):
+            output = self.model(input_tensor)
 
         if output.dim() == 1:
             output = output.unsqueeze(0)
 
         self.model.zero_grad()
         class_score = output[0, class_idx]
-        class_score.backward(retain_graph=True)
+        with torch.profiler.record_function("gradcam.backward"):
+            class_score.backward(retain_graph=retain_graph)
 
         if self.gradients is None or self.activations is None:
             logger.warning("Gradients/activations not captured, returning zero CAM")
@@ -516,40 +328,85 @@ class TorchXRayVisionGradCAM:
 
         return cam
 
-def create_heatmap_overlay(original_image, heatmap, alpha=0.4):
-    """Create heatmap overlay on original image"""
+def create_heatmap_overlay(original_image, heatmap, alpha=0.4, out=None):
+    """Create heatmap overlay on original image (optionally into a preallocated buffer)"""
     h, w = original_image.shape[:2]
     heatmap_resized = cv2.resize(heatmap, (w, h))
     heatmap_colored = cv2.applyColorMap(
         (heatmap_resized * 255).astype(np.uint8),
         cv2.COLORMAP_JET
     )
-    overlay = cv2.addWeighted(original_image, 1-alpha, heatmap_colored, alpha, 0)
+    overlay = cv2.addWeighted(original_image, 1-alpha, heatmap_colored, alpha, 0, dst=out)
     return overlay
 
-def preprocess_xray_image(image_bytes):
-    pil_image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+def preprocess_xray_image(image_source, low_memory=False):
+    """Decode and normalize an X-ray from bytes or a file-like object"""
+    if not hasattr(image_source, 'read'):
+        image_source = io.BytesIO(image_source)
+    pil_image = Image.open(image_source).convert('RGB')
     img = np.array(pil_image)
     if len(img.shape) > 2:
         img = img[:, :, 0]
+    if low_memory:
+        # Overlays only need a small gray base, so drop the decoded RGB copy right away
+        overlay_base = cv2.resize(img, (224, 224))
+        del pil_image
+    # Imported here rather than at module level (with torchvision it is most of the import time);
+    # the models load it at startup, so requests find it in sys.modules
+    import torchxrayvision as xrv
+
     img = xrv.datasets.normalize(img, 255)
     img = img[None, :, :]
-    transform = torchvision.transforms.Compose([
-        xrv.datasets.XRayCenterCrop()
-    ])
-    img = transform(img)
+    img = xrv.datasets.XRayCenterCrop()(img)
+    if low_memory:
+        return img, overlay_base
     return img, np.array(pil_image)
 
+def fill_input_tensor(buffer, processed_img):
+    """Resize a preprocessed (1, H, W) image into a pooled (1, 1, S, S) input tensor"""
+    size = buffer.shape[-1]
+    if buffer.device.type == "cpu":
+        cv2.resize(np.asarray(processed_img[0], dtype=np.float32), (size, size),
+                   dst=buffer.numpy()[0, 0], interpolation=cv2.INTER_AREA)
+    else:
+        source = torch.from_numpy(processed_img).unsqueeze(0).to(buffer.device)
+        buffer.copy_(F.interpolate(source, size=(size, size), mode="bilinear", align_corners=False))
+    return buffer
+
+# Ensemble versions: loaded, warmed up and swapped in without a restart
+model_registry = ModelRegistry(build=lambda spec: MultiModelEnsemble(device=device, spec=spec), install=install_ensemble)
+
 @app.on_event("startup")
 async def startup_event():
-    global ensemble_model
+    global lung_segmenter
     logger.info("🚀 Starting RAD-ETHIX Multi-Model Ensemble...")
     try:
-        ensemble_model = MultiModelEnsemble(device=device)
+        model_registry.load_initial()
         logger.info("✅ Ensemble loaded!")
     except Exception as e:
         logger.error(f"❌ Failed: {e}")
         raise e
+    if LUNG_MASK_ENABLED:
+        try:
+            lung_segmenter = LungSegmenter(device=device)
+            logger.info("✅ Lung segmenter loaded!")
+        except Exception as e:
+            logger.warning(f"⚠️ Lung segmenter unavailable, locating findings without a lung mask: {e}")
+    await inference_scheduler.start()
+    await job_queue.start()
+    if SHADOW_VERSION:
+        try:
+            spec = model_registry.versions()[SHADOW_VERSION]
+            asyncio.create_task(shadow_evaluator.load(spec, model_registry.build))
+        except (KeyError, *INVALID_SETTINGS) as e:
+            logger.warning(f"⚠️ Shadow version {SHADOW_VERSION} unavailable: {e}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await job_queue.stop()
+    await inference_scheduler.stop()
+    await run_in_threadpool(shadow_evaluator.stop)
+    similarity_index.flush()
 
 @app.get("/", response_class=HTMLResponse)
 async def root():
@@ -586,205 +443,914 @@ async def health_check():
     return {
         "status": "healthy" if model else "degraded",
         "model_loaded": model is not None,
+        "model_version": ensemble_model.version if ensemble_model else None,
         "device": str(device),
         "torch_version": torch.__version__,
         "features": ["Authentication", "RAG Reports", "ML Prediction", "Grad-CAM"],
-        "pathologies": xrv.datasets.default_pathologies if model else []
+        "low_memory_mode": LOW_MEMORY_MODE,
+        "memory_budget": memory_budget.status() if LOW_MEMORY_MODE else None,
+        "pathologies": DEFAULT_PATHOLOGIES if model else []
     }
 
-@app.get("/diseases")
-async def get_diseases():
-    diseases = []
-    for disease in xrv.datasets.default_pathologies:
-        diseases.append({
-            "name": disease,
-            "description": DISEASE_DESCRIPTIONS.get(disease, f"Medical condition: {disease}")
-        })
-    return {
-        "diseases": diseases,
-        "total_count": len(diseases),
-        "source": "CheXpert Dataset via TorchXRayVision"
-    }
+@app.get("/metrics/scheduler")
+async def scheduler_metrics():
+    """Queue depth, promotions, preemptions and queue-wait statistics per priority"""
+    return inference_scheduler.stats()
+
+@app.get("/metrics/admission")
+async def admission_metrics():
+    """Admitted vs. throttled requests, overall and for the busiest clients"""
+    return admission.stats()
+
+@app.get("/metrics/drift")
+async def drift_metrics(hours: Optional[float] = None):
+    """Input and output distributions over the last `hours`, with PSI against the reference window"""
+    if hours is not None and hours <= 0:
+        raise HTTPException(status_code=400, detail="hours must be positive")
+    return await run_in_threadpool(drift_monitor.report, hours)
+
+@app.post("/admin/drift/reference", dependencies=[Depends(require_admin)])
+async def save_drift_reference(hours: Optional[float] = None):
+    """Freeze the last `hours` of traffic (default: everything kept) as the drift reference"""
+    if hours is not None and hours <= 0:
+        raise HTTPException(status_code=400, detail="hours must be positive")
+    try:
+        return await run_in_threadpool(drift_monitor.save_reference, hours)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+class ProfilingConfig(BaseModel):
+    sample_rate: Optional[float] = None
+    max_traces: Optional[int] = None
+
+@app.get("/admin/profiling", dependencies=[Depends(require_admin)])
+async def get_profiling_status():
+    return request_profiler.status()
+
+@app.put("/admin/profiling", dependencies=[Depends(require_admin)])
+async def configure_profiling(config: ProfilingConfig):
+    request_profiler.configure(sample_rate=config.sample_rate, max_traces=config.max_traces)
+    return request_profiler.status()
+
+@app.get("/admin/profiling/traces", dependencies=[Depends(require_admin)])
+async def list_profiling_traces():
+    return {"traces": request_profiler.list_traces()}
+
+@app.get("/admin/profiling/traces/{trace_name}", dependencies=[Depends(require_admin)])
+async def download_profiling_trace(trace_name: str):
+    path = request_profiler.trace_path(trace_name)
+    if not path:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return FileResponse(path, media_type="application/json", filename=trace_name)
+
+@app.get("/admin/thresholds", dependencies=[Depends(require_admin)])
+async def get_thresholds():
+    """Thresholds, ensemble weights and calibration methods currently in effect"""
+    return threshold_engine.current.summary()
+
+@app.post("/admin/thresholds/reload", dependencies=[Depends(require_admin)])
+async def reload_thresholds():
+    """Re-read the thresholds and calibration files now instead of at the next change check"""
+    try:
+        snapshot = await run_in_threadpool(threshold_engine.reload)
+    except INVALID_SETTINGS as e:
+        raise HTTPException(status_code=400, detail=f"Invalid threshold settings: {e}")
+    return snapshot.summary()
+
+class ShadowConfig(BaseModel):
+    version: Optional[str] = None
+    sample_rate: Optional[float] = None
+
+@app.get("/admin/shadow", dependencies=[Depends(require_admin)])
+async def get_shadow_status():
+    """Shadow candidate, drop counters and per-pathology disagreement with production"""
+    return shadow_evaluator.status()
+
+@app.put("/admin/shadow", dependencies=[Depends(require_admin)])
+async def configure_shadow(config: ShadowConfig):
+    """Set the sample rate and/or start shadowing a registry version (loaded in the background)"""
+    if config.sample_rate is not None:
+        if not 0 <= config.sample_rate <= 1:
+            raise HTTPException(status_code=400, detail="sample_rate must be between 0 and 1")
+        shadow_evaluator.sample_rate = config.sample_rate
+    if config.version is not None:
+        try:
+            versions = await run_in_threadpool(model_registry.versions)
+        except INVALID_SETTINGS as e:
+            raise HTTPException(status_code=400, detail=f"Invalid model registry: {e}")
+        if config.version not in versions:
+            raise HTTPException(status_code=404, detail=f"Unknown model version {config.version!r}")
+        if shadow_evaluator.loading:
+            raise HTTPException(status_code=409, detail="A shadow candidate is already loading")
+        asyncio.create_task(shadow_evaluator.load(versions[config.version], model_registry.build))
+    return shadow_evaluator.status()
+
+@app.delete("/admin/shadow", dependencies=[Depends(require_admin)])
+async def stop_shadow():
+    shadow_evaluator.set_candidate(None)
+    return shadow_evaluator.status()
+
+@app.get("/admin/models", dependencies=[Depends(require_admin)])
+async def get_model_versions():
+    """Active, loading and draining model versions, plus every version in the registry"""
+    try:
+        versions = await run_in_threadpool(model_registry.versions)
+    except INVALID_SETTINGS as e:
+        raise HTTPException(status_code=400, detail=f"Invalid model registry: {e}")
+    return {**model_registry.status(), "available": {name: spec.summary() for name, spec in versions.items()}}
+
+@app.post("/admin/models/{version}/activate", status_code=202, dependencies=[Depends(require_admin)])
+async def activate_model_version(version: str):
+    """Load a registry version in the background and swap it in once warmed up; poll GET /admin/models"""
+    try:
+        return model_registry.activate(version)
+    except INVALID_SETTINGS as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def build_findings(probabilities, agreement_scores, individual_preds, tta_variance=None, thresholds=None):
+    """Turn ensemble probabilities into sorted findings with severity grading"""
+    thresholds = thresholds or threshold_engine.current
+    findings = []
+    for i, disease in enumerate(DEFAULT_PATHOLOGIES):
+        confidence = float(probabilities[i])
+        if confidence > thresholds.positive[i]:
+            if disease in CRITICAL_PATHOLOGIES:
+                if confidence >= thresholds.critical[i]:
+                    severity = "Critical"
+                elif confidence >= thresholds.critical_high[i]:
+                    severity = "High"
+                else:
+                    severity = "Moderate"
+            else:
+                if confidence >= thresholds.high_confidence[i]:
+                    severity = "High"
+                elif confidence >= thresholds.moderate[i]:
+                    severity = "Moderate"
+                else:
+                    severity = "Low"
+
+            finding = {
+                "disease": disease,
+                "confidence": confidence,
+                "agreement": float(agreement_scores[i]),
+                "severity": severity,
+                "description": knowledge_base.descriptions[i],
+                "critical": (disease == "Pneumonia" and severity == "Critical"),
+                "model_breakdown": {name: float(probs[i]) for name, probs in individual_preds.items()}
+            }
+            if tta_variance is not None:
+                finding["tta_std"] = float(np.sqrt(tta_variance[i]))
+            findings.append(finding)
 
-@app.post("/predict")
-async def predict_chest_xray(file: UploadFile = File(...)):
-    if not ensemble_model:
-        raise HTTPException(status_code=503, detail="Model not loaded")
+    sorted_findings = sorted(findings, key=lambda x: x["confidence"], reverse=True)
+    result_findings = sorted_findings[:5]
 
-    if not file.content_type.startswith('image/'):
-        raise HTTPException(status_code=400, detail="Please upload an image file")
+    pneumonia_critical = next(
+        (f for f in findings if f["disease"] == "Pneumonia" and f["severity"] == "Critical"),
+        None
+    )
+    if pneumonia_critical and all(f["disease"] != "Pneumonia" for f in result_findings):
+        result_findings.append(pneumonia_critical)
 
-    try:
-        logger.info(f"🔬 Analyzing X-ray: {file.filename}")
+    return result_findings
 
-        contents = await file.read()
-        processed_img, original_img = preprocess_xray_image(contents)
-        img_tensor = torch.from_numpy(processed_img).unsqueeze(0).to(device)
-        img_tensor.requires_grad_(True)
+def compute_gradcam(model, img_tensor, class_idx, low_memory=False):
+    """Normalized 224x224 Grad-CAM of one model for one class"""
+    grad_cam = TorchXRayVisionGradCAM(model)
+    try:
+        cam = grad_cam.generate_cam(img_tensor, class_idx, retain_graph=not low_memory)
+    finally:
+        grad_cam.release()
 
-        # Ensemble prediction
-        ensemble_results = ensemble_model.predict(img_tensor)
-        probabilities = ensemble_results['ensemble_predictions']
-        agreement_scores = ensemble_results['agreement_scores']
-        individual_preds = ensemble_results['individual_predictions']
+    if not isinstance(cam, np.ndarray):
+        cam = np.array(cam)
 
-        # Primary model for reference
-        primary_model = ensemble_model.models['densenet121']
-        grad_cam = TorchXRayVisionGradCAM(primary_model)
-
-        # Disease findings
-        findings = []
-        for i, disease in enumerate(xrv.datasets.default_pathologies):
-            confidence = float(probabilities[i])
-            if confidence > POSITIVE_THRESHOLD:
-                if disease in ['Pneumothorax', 'Mass', 'Pneumonia']:
-                    if confidence >= 0.5:
-                        severity = "Critical"
-                    elif confidence >= 0.35:
-                        severity = "High"
-                    else:
-                        severity = "Moderate"
-                else:
-                    if confidence >= HIGH_CONFIDENCE_THRESHOLD:
-                        severity = "High"
-                    elif confidence >= 0.5:
-                        severity = "Moderate"
-                    else:
-                        severity = "Low"
-
-                finding = {
-                    "disease": disease,
-                    "confidence": confidence,
-                    "agreement": float(agreement_scores[i]),
-                    "severity": severity,
-                    "description": DISEASE_DESCRIPTIONS.get(disease, f"Medical condition: {disease}"),
-                    "critical": (disease == "Pneumonia" and severity == "Critical"),
-                    "model_breakdown": {
-                        "densenet121": float(individual_preds['densenet121'][i]),
-                        "resnet50": float(individual_preds['resnet50'][i]),
-                        "efficientnet": float(individual_preds['efficientnet'][i])
-                    }
-                }
-                findings.append(finding)
-
-        sorted_findings = sorted(findings, key=lambda x: x["confidence"], reverse=True)
-        result_findings = sorted_findings[:5]
-
-        pneumonia_critical = next(
-            (f for f in findings if f["disease"] == "Pneumonia" and f["severity"] == "Critical"),
-            None
-        )
-        if pneumonia_critical and all(f["disease"] != "Pneumonia" for f in result_findings):
-            result_findings.append(pneumonia_critical)
-
-        # === Grad-CAM for all models ===
-        gradcam_results = {}
-        common_shape = (224, 224)
-        all_cams = []
-        weights = getattr(ensemble_model, 'weights', {'densenet121': 0.6, 'resnet50': 0.25, 'efficientnet': 0.15})
-        max_idx = int(np.argmax(probabilities))
+    cam_resized = cv2.resize(cam, (224, 224), interpolation=cv2.INTER_LINEAR)
+    if cam_resized.max() > 0:
+        cam_resized = cam_resized / cam_resized.max()
+    return cam_resized
 
-        for model_name, model in ensemble_model.models.items():
-            try:
-                grad_cam_temp = TorchXRayVisionGradCAM(model)
-                cam = grad_cam_temp.generate_cam(img_tensor, max_idx)
+def locate_findings(findings, finding_indices, finding_maps, cams, max_idx, thresholds, lung_mask=None):
+    """Add location descriptors to findings in place from their weighted member CAMs
 
-                if not isinstance(cam, np.ndarray):
-                    cam = np.array(cam)
+    CAM members contribute a map for every finding; Grad-CAM members only have
+    the top class, so they join that finding's map alone. Findings without
+    any map are left without a location.
+    """
+    maps = np.zeros((len(findings), 224, 224), dtype=np.float32)
+    for row, class_idx in enumerate(finding_indices):
+        for name, member_maps in finding_maps.items():
+            maps[row] += thresholds.member_weight(name, class_idx) * member_maps[row]
+        if class_idx == max_idx:
+            for name, cam in cams.items():
+                if name not in finding_maps and cam is not None:
+                    maps[row] += thresholds.member_weight(name, class_idx) * cam
+    for finding, descriptor in zip(findings, describe_regions(maps, lung_mask)):
+        finding["location"] = descriptor
+        finding["location_description"] = location_text(descriptor)
+
+def overlay_renderer(original_img, low_memory=False, overlay_options=None):
+    """Renderer over the study image at the requested overlay resolution"""
+    overlay_options = overlay_options or OverlayOptions()
+    size = None if overlay_options.resolution == "original" and not low_memory else (224, 224)
+    return OverlayRenderer(original_img, size=size)
+
+def render_overlays(cams, original_img, weights, low_memory=False, overlay_options=None, encoded=None):
+    """Overlays for every model CAM plus the CAM weighted by `weights` (member -> scalar), as encoded strings
+
+    `encoded` holds overlays already encoded while streaming; only the rest are rendered.
+    """
+    overlay_options = overlay_options or OverlayOptions()
+    members = list(cams)
+    cams = {name: cam for name, cam in cams.items() if cam is not None}
+
+    # === Combined Ensemble CAM ===
+    if cams:
+        combined_cam = np.sum([cam * float(weights.get(name, 0.0)) for name, cam in cams.items()], axis=0)
+        if combined_cam.max() > 0:
+            combined_cam = combined_cam / combined_cam.max()
+        cams["combined"] = combined_cam
+
+    # === Overlays: one shared gray base, one blend pass, parallel encoding ===
+    encoded = dict(encoded or {})
+    try:
+        names = [name for name in cams if name not in encoded]
+        if names:
+            renderer = overlay_renderer(original_img, low_memory, overlay_options)
+            shape = (len(names), renderer.height, renderer.width, 3)
+            with buffer_pool.array(shape) if low_memory else nullcontext() as overlay_buffer:
+                overlays = renderer.render([cams[name] for name in names], out=overlay_buffer)
+                encoded.update(zip(names, encode_overlays(overlays, overlay_options)))
+    except Exception as e:
+        logger.warning(f"Failed to render Grad-CAM overlays: {e}")
+
+    gradcam_results = {model_name: encoded.get(model_name) for model_name in members}
+    return gradcam_results, encoded.get("combined"), cams.get("combined")
+
+def analysis_stages(image_source, filename, low_memory=None, overlay_options=None, tta_views=None,
+                    stream_overlays=False, ensemble=None):
+    """Analysis of one X-ray as a generator: each next() runs one stage of model work
+
+    Yields a progress event after each stage (pre-screen, findings, one per
+    model heatmap, finding locations) and returns the full response. The
+    scheduler uses the stage boundaries to interleave urgent work;
+    analyze_xray() simply drains it.
+    With tta_views > 1 predictions are averaged over augmented views; Grad-CAM
+    always uses the original image. Thresholds, weights and calibration come
+    from one snapshot taken at the start, so a reload mid-analysis has no effect.
+    With stream_overlays each heatmap event carries that model's encoded
+    overlay, for clients that show results as they arrive. All model work uses
+    `ensemble` (default: the active one), even if another version is swapped in.
+    """
+    thresholds = threshold_engine.current
+    ensemble = ensemble or ensemble_model
+    if low_memory is None:
+        low_memory = LOW_MEMORY_MODE
+    if tta_views is None:
+        tta_views = DEFAULT_TTA_VIEWS
+    use_tta = tta_views > 1
+    tracker = PeakMemoryTracker(device) if low_memory else None
+
+    processed_img, original_img = preprocess_xray_image(image_source, low_memory=low_memory)
+    image_stats = drift_monitor.image_statistics(processed_img)
+
+    if low_memory:
+        # Fixed-size pooled input; Grad-CAM does not need gradients w.r.t. the input
+        input_context = buffer_pool.tensor((1, 1, ensemble.input_size, ensemble.input_size), device=device)
+    else:
+        input_context = nullcontext()
 
-                cam_resized = cv2.resize(cam, common_shape, interpolation=cv2.INTER_LINEAR)
-                if cam_resized.max() > 0:
-                    cam_resized = cam_resized / cam_resized.max()
+    with input_context as input_buffer:
+        if low_memory:
+            img_tensor = fill_input_tensor(input_buffer, processed_img)
+            del processed_img
+            tracker.checkpoint("preprocess")
+        else:
+            img_tensor = torch.from_numpy(processed_img).unsqueeze(0).to(device)
 
-                all_cams.append(cam_resized * float(weights.get(model_name, 0.0)))
+        # Pre-screen on the primary model; likely-critical studies get promoted
+        if use_tta:
+            views = make_tta_views(img_tensor, tta_views)
+            primary_views = ensemble.predict_member(ensemble.primary, views)
+            primary_probs = primary_views.mean(axis=0)
+        else:
+            primary_probs = ensemble.predict_member(ensemble.primary, img_tensor)[0]
+        # Feature maps are taken in the stage that produced them, before another request's
+        # stage can run the member again; they are those of the un-augmented view
+        features = {}
+        embedding = None
+        if ensemble.primary in ensemble.feature_captures:
+            features[ensemble.primary] = ensemble.feature_captures[ensemble.primary].pop()
+            embedding = pooled_embedding(features[ensemble.primary])
+        critical_score = max(
+            float(primary_probs[DEFAULT_PATHOLOGIES.index(disease)]) for disease in CRITICAL_PATHOLOGIES
+        )
+        yield {
+            "stage": "prescreen",
+            "critical_score": critical_score,
+            "promote_to": "critical" if critical_score >= thresholds.prescreen_critical else None
+        }
 
-                # Overlay per model
-                img_resized = cv2.resize(original_img, (common_shape[1], common_shape[0]))
-                if len(img_resized.shape) == 3:
-                    img_gray = cv2.cvtColor(img_resized, cv2.COLOR_RGB2GRAY)
-                    img_overlay = cv2.cvtColor(img_gray, cv2.COLOR_GRAY2RGB)
-                else:
-                    img_overlay = cv2.cvtColor(img_resized, cv2.COLOR_GRAY2RGB)
+        # Ensemble prediction (primary model output reused from the pre-screen)
+        if use_tta:
+            ensemble_results = ensemble.predict_tta(
+                views, precomputed={ensemble.primary: primary_views}, weights=thresholds.ensemble_weights
+            )
+            del views
+        else:
+            ensemble_results = ensemble.predict(
+                img_tensor, precomputed={ensemble.primary: primary_probs}, weights=thresholds.ensemble_weights
+            )
+        # Calibrated ensemble probabilities drive findings; member breakdowns stay raw
+        probabilities = thresholds.calibrate(ensemble_results['ensemble_predictions'])
+        agreement_scores = ensemble_results['agreement_scores']
+        individual_preds = ensemble_results['individual_predictions']
+        tta_variance = ensemble_results.get('tta_variance')
+        if not use_tta and shadow_evaluator.should_sample():
+            shadow_evaluator.offer(img_tensor, ensemble_results['ensemble_predictions'], thresholds.positive)
+        drift_monitor.observe(
+            ensemble_results['ensemble_predictions'], agreement_scores, probabilities > thresholds.positive, image_stats
+        )
+        for model_name, capture in ensemble.feature_captures.items():
+            if model_name != ensemble.primary:
+                features[model_name] = capture.pop()
+        if tracker:
+            tracker.checkpoint("ensemble")
 
-                overlay = create_heatmap_overlay(img_overlay, cam_resized)
-                _, buffer = cv2.imencode('.png', overlay)
-                gradcam_results[model_name] = base64.b64encode(buffer).decode()
+        result_findings = build_findings(probabilities, agreement_scores, individual_preds, tta_variance, thresholds)
+        yield {"stage": "findings", "findings": result_findings}
 
+        # === Heatmaps for all models ===
+        # DenseNet CAMs for every class come from the captured features; others need Grad-CAM
+        max_idx = int(np.argmax(probabilities))
+        finding_indices = [DEFAULT_PATHOLOGIES.index(f["disease"]) for f in result_findings]
+        cams = {}
+        streamed = {}  # overlays already encoded into heatmap events
+        renderer = None
+        finding_maps = {}  # CAM members: (findings, H, W) maps of the reported classes, for localization
+        cam_methods = {}
+        for model_name, model in ensemble.models.items():
+            method = "cam" if CAM_MODE == "cam" and features.get(model_name) is not None else "gradcam"
+            cam_methods[model_name] = method
+            try:
+                if method == "cam":
+                    class_maps = class_activation_maps(features.pop(model_name), model.classifier)
+                    cams[model_name] = class_maps[max_idx]
+                    finding_maps[model_name] = class_maps[finding_indices]
+                    del class_maps
+                else:
+                    cams[model_name] = compute_gradcam(model, img_tensor, max_idx, low_memory=low_memory)
             except Exception as e:
                 logger.warning(f"⚠️ Failed to generate CAM for {model_name}: {e}")
-                gradcam_results[model_name] = None
+                cams[model_name] = None
+            if tracker:
+                tracker.checkpoint(f"{method}.{model_name}")
+            event = {"stage": "gradcam", "model": model_name, "method": method}
+            if stream_overlays and cams[model_name] is not None:
+                try:
+                    renderer = renderer or overlay_renderer(original_img, low_memory, overlay_options)
+                    overlay = renderer.render([cams[model_name]])
+                    streamed[model_name] = event["heatmap"] = encode_overlays(overlay, overlay_options or OverlayOptions())[0]
+                except Exception as e:
+                    logger.warning(f"Failed to render overlay for {model_name}: {e}")
+            yield event
+
+        # === Finding locations ===
+        if result_findings:
+            lung_mask = None
+            if lung_segmenter is not None:
+                try:
+                    lung_mask = lung_segmenter.segment(img_tensor)
+                except Exception as e:
+                    logger.warning(f"⚠️ Lung segmentation failed: {e}")
+            locate_findings(result_findings, finding_indices, finding_maps, cams, max_idx, thresholds, lung_mask)
+            if tracker:
+                tracker.checkpoint("localization")
+            yield {
+                "stage": "localization",
+                "lung_mask": lung_mask is not None,
+                "locations": {f["disease"]: f["location_description"] for f in result_findings}
+            }
+
+        del img_tensor, features, finding_maps, renderer
 
-        # === Combined Ensemble CAM ===
-        combined_heatmap_b64 = None
+    # Combined CAM is for the top class, so it uses that class's member weights
+    cam_weights = {name: thresholds.member_weight(name, max_idx) for name in cams}
+    gradcam_results, combined_heatmap_b64, combined_cam = render_overlays(
+        cams, original_img, cam_weights, low_memory=low_memory, overlay_options=overlay_options, encoded=streamed
+    )
+    del cams, original_img
+
+    # === Confidence metrics ===
+    overall_confidence = float(np.max(probabilities))
+    needs_review = overall_confidence < thresholds.doctor_review or len(result_findings) > 2
+    ai_report = generate_clinical_report(result_findings, overall_confidence)
+    patient_report = generate_patient_report(result_findings)
+
+    # === Final response ===
+    response = {
+        "status": "success",
+        "timestamp": str(datetime.now()),
+        "findings": result_findings,
+        "pathology_probabilities": {
+            disease: float(p) for disease, p in zip(DEFAULT_PATHOLOGIES, probabilities)
+        },
+        "confidence_metrics": {
+            "overall_confidence": overall_confidence,
+            "average_confidence": float(np.mean([f["confidence"] for f in result_findings])) if result_findings else 0.0,
+            "uncertainty": 1.0 - overall_confidence
+        },
+        "gradcams": gradcam_results,  # individual model CAMs
+        "combined_heatmap": combined_heatmap_b64,  # ensemble CAM
+        # Kept for prior comparison, tagged with the class the combined CAM shows
+        "cam_summary": summarize_cam(combined_cam, DEFAULT_PATHOLOGIES[max_idx]) if combined_cam is not None else None,
+        "_embedding": embedding,  # internal: indexed for similar-case retrieval, stripped by public_response()
+        "heatmap_mime_type": (overlay_options or OverlayOptions()).mime_type,
+        "ai_report": ai_report,
+        "patient_report": patient_report,
+        "needs_doctor_review": needs_review,
+        "review_reason": "Low confidence" if overall_confidence < thresholds.doctor_review else "Multiple findings" if len(result_findings) > 2 else "Standard review",
+        "model_info": {
+            "name": "TorchXRayVision Ensemble",
+            "training_dataset": "CheXpert",
+            "paper": "https://arxiv.org/abs/2111.00595",
+            "models_used": list(ensemble.models.keys()),
+            "version": ensemble.version,
+            "pathologies_supported": len(DEFAULT_PATHOLOGIES)
+        },
+        "metadata": {
+            "filename": filename,
+            "model_version": ensemble.version,
+            "device": str(device),
+            "findings_count": len(result_findings),
+            "detection_threshold": thresholds.defaults["positive"],
+            "thresholds_version": thresholds.version,
+            "cam_methods": cam_methods,
+            "calibrated": thresholds.calibration is not None,
+            "tta_views": tta_views if use_tta else 1
+        }
+    }
+    if tracker:
+        tracker.checkpoint("response")
+        response["metadata"]["memory"] = tracker.summary()
+    return response
+
+def drain_stages(stages):
+    """Run a stage generator to completion and return its result"""
+    while True:
         try:
-            if all_cams:
-                combined_cam = np.sum(all_cams, axis=0)
-                if combined_cam.max() > 0:
-                    combined_cam = combined_cam / combined_cam.max()
-
-                img_resized = cv2.resize(original_img, (common_shape[1], common_shape[0]))
-                if len(img_resized.shape) == 3:
-                    img_gray = cv2.cvtColor(img_resized, cv2.COLOR_RGB2GRAY)
-                    img_overlay = cv2.cvtColor(img_gray, cv2.COLOR_GRAY2RGB)
-                else:
-                    img_overlay = cv2.cvtColor(img_resized, cv2.COLOR_GRAY2RGB)
+            next(stages)
+        except StopIteration as stop:
+            return stop.value
+
+def leased_stages(*args, **kwargs):
+    """analysis_stages on the active ensemble, leased so a model swap drains it before release"""
+    with model_registry.lease(ensemble_model) as ensemble:
+        return (yield from analysis_stages(*args, ensemble=ensemble, **kwargs))
+
+def analyze_xray(image_source, filename, low_memory=None, overlay_options=None, tta_views=None):
+    """Run ensemble prediction, Grad-CAM and report generation for one X-ray"""
+    with inference_lock:
+        return drain_stages(leased_stages(image_source, filename, low_memory, overlay_options, tta_views))
+
+def profiled_stages(stages, label):
+    """Profile an analysis while keeping its scheduler events
+
+    The pre-screen stays a step of its own, so its event can still promote
+    the task. The remaining stages then run back to back as one step under
+    the profiler, so the trace covers only this request (everything after
+    the pre-screen). The events they produced are handed to the scheduler
+    afterwards, one per step and in order, so streaming clients still get
+    findings and heatmaps before the result.
+    """
+    try:
+        event = next(stages)
+    except StopIteration as stop:
+        return stop.value
+    yield event
+
+    events = []
+    with request_profiler.profile(label):
+        while True:
+            try:
+                events.append(next(stages))
+            except StopIteration as stop:
+                result = stop.value
+                break
+    for event in events:
+        yield event
+    return result
+
+async def run_scheduled_analysis(image_source, filename, overlay_options=None, priority="routine", on_event=None,
+                                 tta_views=None, stream_overlays=False, tenant=None):
+    """Submit an analysis to the inference scheduler (in `tenant`'s fair share) and wait for its response"""
+    stages = leased_stages(
+        image_source, filename, overlay_options=overlay_options, tta_views=tta_views, stream_overlays=stream_overlays
+    )
+    if request_profiler.should_sample():
+        stages = profiled_stages(stages, filename or "upload")
+    weight = admission.weight(tenant) if tenant else 1.0
+    return await inference_scheduler.submit(stages, priority, on_event=on_event, tenant=tenant, weight=weight)
+
+def get_overlay_options(
+    overlay_format: str = "png",
+    overlay_quality: int = 90,
+    png_compression: Optional[int] = None,
+    overlay_resolution: str = "224"
+):
+    try:
+        return OverlayOptions(overlay_format, overlay_quality, png_compression, overlay_resolution)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def get_tta_views(tta_views: Optional[int] = None):
+    """Number of test-time augmentation views (query parameter, default from RAD_ETHIX_TTA_VIEWS)"""
+    if tta_views is None:
+        return DEFAULT_TTA_VIEWS
+    if not 0 <= tta_views <= MAX_TTA_VIEWS:
+        raise HTTPException(status_code=400, detail=f"tta_views must be between 0 and {MAX_TTA_VIEWS}")
+    return tta_views
+
+async def get_patient_id(x_patient_id: Optional[str] = Header(None)):
+    """Patient the study belongs to (X-Patient-ID header); 404 if the ID is unknown"""
+    if not x_patient_id:
+        return None
+    patient_id = x_patient_id.upper().strip()
+    if not await run_in_threadpool(clinical_store.get_patient, patient_id):
+        raise HTTPException(status_code=404, detail="Patient ID not found")
+    return patient_id
+
+async def admit_client(client_id, patient_id, remote_addr):
+    """Fair-share key of the caller, after taking a token from its bucket; 429 when it is empty"""
+    key = client_key(client_id, patient_id, remote_addr)
+    admitted, retry_after = await run_in_threadpool(admission.admit, key)
+    if not admitted:
+        logger.warning(f"🚦 Throttled {key} (retry in {retry_after:.1f}s)")
+        raise HTTPException(
+            status_code=429, detail="Rate limit exceeded for this client",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+    return key
 
-                combined_overlay = create_heatmap_overlay(img_overlay, combined_cam)
-                _, buffer = cv2.imencode('.png', combined_overlay)
-                combined_heatmap_b64 = base64.b64encode(buffer).decode()
-        except Exception as e:
-            logger.warning(f"Failed to generate combined Grad-CAM: {e}")
+async def get_client_key(
+    request: Request,
+    x_client_id: Optional[str] = Header(None),
+    patient_id: Optional[str] = Depends(get_patient_id)
+):
+    """Rate-limited client of an inference request (X-Client-ID, else patient, else remote address)"""
+    return await admit_client(x_client_id, patient_id, request.client.host if request.client else None)
+
+def public_response(response):
+    """Response without internal (underscore) fields"""
+    return {key: value for key, value in response.items() if not key.startswith("_")}
 
-        # === Confidence metrics ===
-        overall_confidence = float(np.max(probabilities))
-        needs_review = overall_confidence < DOCTOR_REVIEW_THRESHOLD or len(result_findings) > 2
-        ai_report = generate_clinical_report(result_findings, overall_confidence)
-        patient_report = generate_patient_report(result_findings)
+async def record_patient_study(patient_id, response, priority=None):
+    """Compare an analysis with the patient's priors and record it as a new study
 
-        # === Final response ===
+    Returns a copy of the response with `comparison` and `metadata.study_id`;
+    the input (possibly a cached response) is left untouched.
+    """
+    metadata = response["metadata"]
+    probabilities = list(response["pathology_probabilities"].values())
+    now = time.time()
+    comparison = await run_in_threadpool(study_comparison, patient_id, probabilities, response.get("cam_summary"), now)
+    study_id = await run_in_threadpool(
+        clinical_store.record_study,
+        patient_id,
+        metadata.get("filename"),
+        metadata.get("sha256"),
+        probabilities,
+        findings=response["findings"],
+        overall_confidence=response["confidence_metrics"]["overall_confidence"],
+        model_version=metadata.get("model_version"),
+        priority=priority,
+        created_at=now,
+        cam_summary=response.get("cam_summary")
+    )
+    if response.get("_embedding") is not None and len(response["_embedding"]) == EMBEDDING_DIM:
+        await run_in_threadpool(similarity_index.add, study_id, response["_embedding"])
+    return {**response, "comparison": comparison, "metadata": {**metadata, "study_id": study_id}}
+
+def get_priority(x_study_priority: Optional[str] = Header(None)):
+    """Request priority from the X-Study-Priority header (critical/ER, urgent, routine, batch)"""
+    try:
+        return resolve_priority(x_study_priority)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def result_cache_key(sha256, overlay_options, tta_views, thresholds_version, model_version):
+    return (sha256, LOW_MEMORY_MODE, overlay_options.cache_key(), max(tta_views, 1), thresholds_version, model_version)
+
+def replay_cached_events(response, on_event):
+    """Stage events of a cached analysis, for streaming clients"""
+    on_event({"stage": "findings", "findings": response["findings"]})
+    cam_methods = response["metadata"].get("cam_methods", {})
+    for model_name, heatmap in response["gradcams"].items():
+        on_event({"stage": "gradcam", "model": model_name, "method": cam_methods.get(model_name), "heatmap": heatmap})
+
+async def analyze_upload(source, filename, sha256, size_bytes, overlay_options, priority, tta_views, patient_id,
+                         on_event=None, tenant=None):
+    """Cached or scheduled analysis of one upload, recorded as a study when a patient is given
+
+    With `on_event`, stage events (findings, then each model's heatmap) are
+    passed on as they are produced; a cache hit replays them at once.
+    """
+    cache_key = result_cache_key(
+        sha256, overlay_options, tta_views, threshold_engine.current.version, ensemble_model.version
+    )
+    cached = result_cache.get(cache_key)
+    if cached:
+        logger.info(f"♻️ Reusing analysis for identical upload {sha256[:12]}")
         response = {
-            "status": "success",
-            "timestamp": str(pd.Timestamp.now()),
-            "findings": result_findings,
-            "confidence_metrics": {
-                "overall_confidence": overall_confidence,
-                "average_confidence": float(np.mean([f["confidence"] for f in result_findings])) if result_findings else 0.0,
-                "uncertainty": 1.0 - overall_confidence
-            },
-            "gradcams": gradcam_results,  # individual model CAMs
-            "combined_heatmap": combined_heatmap_b64,  # ensemble CAM
-            "ai_report": ai_report,
-            "patient_report": patient_report,
-            "needs_doctor_review": needs_review,
-            "review_reason": "Low confidence" if overall_confidence < DOCTOR_REVIEW_THRESHOLD else "Multiple findings" if len(result_findings) > 2 else "Standard review",
-            "model_info": {
-                "name": "TorchXRayVision Ensemble",
-                "training_dataset": "CheXpert",
-                "paper": "https://arxiv.org/abs/2111.00595",
-                "models_used": list(ensemble_model.models.keys()),
-                "pathologies_supported": len(xrv.datasets.default_pathologies)
-            },
-            "metadata": {
-                "filename": file.filename,
-                "model_version": "TorchXRayVision-v2.0",
-                "device": str(device),
-                "findings_count": len(result_findings),
-                "detection_threshold": POSITIVE_THRESHOLD
-            }
+            **cached,
+            "timestamp": str(datetime.now()),
+            "metadata": {**cached["metadata"], "filename": filename, "cache_hit": True}
         }
+        if on_event:
+            replay_cached_events(response, on_event)
+        if patient_id:
+            response = await record_patient_study(patient_id, response, priority)
+        return public_response(response)
+
+    stream_overlays = on_event is not None
+    if LOW_MEMORY_MODE:
+        # Admit by estimated memory so waiting requests stay cheap
+        width, height = Image.open(source).size
+        source.seek(0)
+        # Augmented views are evaluated as one batch, so activations scale with K
+        per_inference = PER_INFERENCE_BYTES * max(tta_views, 1)
+        async with memory_budget.reserve(estimate_request_bytes(width, height, per_inference)):
+            response = await run_scheduled_analysis(
+                source, filename, overlay_options, priority, on_event, tta_views, stream_overlays, tenant
+            )
+    else:
+        response = await run_scheduled_analysis(
+            source, filename, overlay_options, priority, on_event, tta_views, stream_overlays, tenant
+        )
+    response["metadata"]["priority"] = priority
+
+    response["metadata"].update({"sha256": sha256, "size_bytes": size_bytes, "cache_hit": False})
+    # Keyed by the versions that produced it, which may be newer than at lookup if one was swapped in meanwhile
+    metadata = response["metadata"]
+    result_cache.put(result_cache_key(
+        sha256, overlay_options, tta_views, metadata["thresholds_version"], metadata["model_version"]
+    ), response)
+    if patient_id:
+        # Comparison and study id are per upload, so they go on a copy rather than the cached response
+        response = await record_patient_study(patient_id, response, priority)
+
+    logger.info(f"✅ Analysis complete: {len(response['findings'])} findings detected")
+    return public_response(response)
+
+@app.post("/predict")
+async def predict_chest_xray(
+    file: UploadFile = File(...),
+    overlay_options: OverlayOptions = Depends(get_overlay_options),
+    priority: str = Depends(get_priority),
+    tta_views: int = Depends(get_tta_views),
+    patient_id: Optional[str] = Depends(get_patient_id),
+    client: str = Depends(get_client_key)
+):
+    if not ensemble_model:
+        raise HTTPException(status_code=503, detail="Model not loaded")
 
-        logger.info(f"✅ Analysis complete: {len(result_findings)} findings detected")
-        return response
+    if not file.content_type.startswith('image/'):
+        raise HTTPException(status_code=400, detail="Please upload an image file")
+
+    try:
+        logger.info(f"🔬 Analyzing X-ray: {file.filename}")
 
+        # Hash while streaming from the spooled upload; the decoder reads the same file
+        sha256, size_bytes = await hash_upload(file, MAX_UPLOAD_BYTES)
+        return await analyze_upload(
+            file.file, file.filename, sha256, size_bytes, overlay_options, priority, tta_views, patient_id,
+            tenant=client
+        )
+
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"❌ Prediction failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.websocket("/ws/predict")
+async def predict_stream(
+    websocket: WebSocket,
+    filename: str = "upload",
+    priority: str = "routine",
+    tta_views: Optional[int] = None,
+    patient_id: Optional[str] = None,
+    client_id: Optional[str] = None,
+    overlay_format: str = "png",
+    overlay_quality: int = 90,
+    png_compression: Optional[int] = None,
+    overlay_resolution: str = "224"
+):
+    """Progressive /predict: the client sends the image as one binary message and
+    receives JSON events as the analysis runs
+
+    prescreen, findings (before any heatmap), one gradcam event per model with
+    its overlay, localization, then complete with the remaining response
+    (combined heatmap, reports, metadata; per-model overlays were already sent).
+    Failures arrive as an error event with an HTTP-style status code.
+    Browsers cannot set headers here, so priority, patient_id and client_id are query parameters.
+    """
+    await websocket.accept()
+    analysis = None
+    try:
+        if not ensemble_model:
+            raise HTTPException(status_code=503, detail="Model not loaded")
+        overlay_options = get_overlay_options(overlay_format, overlay_quality, png_compression, overlay_resolution)
+        priority = get_priority(priority)
+        tta_views = get_tta_views(tta_views)
+        patient_id = await get_patient_id(patient_id)
+        client = await admit_client(client_id, patient_id, websocket.client.host if websocket.client else None)
+
+        data = await websocket.receive_bytes()
+        if len(data) > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"Upload exceeds {MAX_UPLOAD_BYTES // MB} MB")
+        logger.info(f"🔬 Streaming analysis of X-ray: {filename}")
+
+        # Events are serialized when they arrive, before later stages add to the same findings
+        messages = asyncio.Queue()
+
+        def on_event(event):
+            messages.put_nowait(json.dumps({"event": event["stage"], **{k: v for k, v in event.items() if k != "stage"}}))
+
+        analysis = asyncio.create_task(analyze_upload(
+            io.BytesIO(data), filename, hashlib.sha256(data).hexdigest(), len(data),
+            overlay_options, priority, tta_views, patient_id, on_event=on_event, tenant=client
+        ))
+        analysis.add_done_callback(lambda _: messages.put_nowait(None))
+        while (message := await messages.get()) is not None:
+            await websocket.send_text(message)
+
+        response = analysis.result()
+        await websocket.send_json({
+            "event": "complete",
+            "result": {key: value for key, value in response.items() if key != "gradcams"}
+        })
+        await websocket.close()
+
+    except WebSocketDisconnect:
+        logger.info(f"🔌 Client left streaming analysis of {filename}")
+    except HTTPException as e:
+        await websocket.send_json({"event": "error", "status_code": e.status_code, "detail": e.detail})
+        await websocket.close(code=1008)
+    except Exception as e:
+        logger.error(f"❌ Streaming prediction failed: {str(e)}")
+        await websocket.send_json({"event": "error", "status_code": 500, "detail": str(e)})
+        await websocket.close(code=1011)
+    finally:
+        # A cancelled analysis is dropped by the scheduler at its next stage
+        if analysis is not None and not analysis.done():
+            analysis.cancel()
+
+# ==================== ASYNC JOBS ====================
+async def run_analysis_job(job):
+    """Job runner: analyze the persisted upload through the scheduler at the job's priority"""
+    options = dict(job["options"])
+    tta_views = options.pop("tta_views", None)
+    patient_id = options.pop("patient_id", None)
+    client = options.pop("client", None)
+    with open(job["input_path"], "rb") as f:
+        response = await run_scheduled_analysis(
+            f, job["filename"], OverlayOptions(**options), job["priority"], tta_views=tta_views, tenant=client
+        )
+    if patient_id:
+        response = await record_patient_study(patient_id, response, job["priority"])
+    return public_response(response)
+
+# A couple of jobs in flight lets the next one pre-screen while the current one renders
+job_queue = JobQueue(job_store, run_analysis_job, workers=int(os.environ.get("RAD_ETHIX_JOB_WORKERS", "2")))
+
+@app.post("/jobs", status_code=202)
+async def create_job(
+    file: UploadFile = File(...),
+    priority: str = "routine",
+    x_study_priority: Optional[str] = Header(None),
+    overlay_options: OverlayOptions = Depends(get_overlay_options),
+    tta_views: int = Depends(get_tta_views),
+    patient_id: Optional[str] = Depends(get_patient_id),
+    client: str = Depends(get_client_key)
+):
+    """Queue an analysis and return immediately with a job id"""
+    if not ensemble_model:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+
+    if not file.content_type.startswith('image/'):
+        raise HTTPException(status_code=400, detail="Please upload an image file")
+
+    try:
+        priority = resolve_priority(x_study_priority or priority)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    sha256, size_bytes = await hash_upload(file, MAX_UPLOAD_BYTES)
+
+    # Persist the upload so the job can be resumed after a restart
+    job_id = uuid.uuid4().hex
+    input_path = job_store.input_path(job_id)
+
+    def save_upload():
+        with open(input_path, "wb") as out:
+            shutil.copyfileobj(file.file, out)
+
+    await run_in_threadpool(save_upload)
+    options = {**vars(overlay_options), "tta_views": tta_views, "patient_id": patient_id, "client": client}
+    await run_in_threadpool(job_store.create, priority, file.filename, input_path, options, job_id)
+    job_queue.submit(job_id, priority)
+
+    logger.info(f"📋 Queued job {job_id} ({priority}) for {file.filename}")
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "priority": priority,
+        "sha256": sha256,
+        "size_bytes": size_bytes,
+        "queue_depth": job_queue.depth(),
+        "status_url": f"/jobs/{job_id}",
+        "events_url": f"/jobs/{job_id}/events"
+    }
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await run_in_threadpool(job_store.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return public_job(job)
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """Server-sent events: one `status` event per change, ending with the result"""
+    if not await run_in_threadpool(job_store.get, job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        async for job in job_queue.watch(job_id):
+            if job is None:
+                yield ": keep-alive\n\n"
+            else:
+                # The final event carries the full result (overlays included)
+                data = await run_in_threadpool(json.dumps, public_job(job))
+                yield f"event: status\ndata: {data}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+# ==================== PATIENT STUDIES ====================
+@app.get("/patients/{patient_id}/studies")
+async def list_patient_studies(patient_id: str, limit: int = 20, before: Optional[float] = None):
+    """Study history of a patient, newest first (page with `before` = last created_at)"""
+    patient_id = patient_id.upper().strip()
+    if not await run_in_threadpool(clinical_store.get_patient, patient_id):
+        raise HTTPException(status_code=404, detail="Patient ID not found")
+    limit = min(max(limit, 1), 100)
+    studies = await run_in_threadpool(clinical_store.study_history, patient_id, limit, before)
+    return {"patient_id": patient_id, "studies": studies, "count": len(studies)}
+
+@app.get("/studies/{study_id}/similar")
+async def similar_studies(study_id: str, k: int = 5):
+    """The k most similar previously analyzed studies, by DenseNet121 embedding"""
+    vector = await run_in_threadpool(similarity_index.vector, study_id)
+    if vector is None:
+        raise HTTPException(status_code=404, detail="Study not found in the similarity index")
+    k = min(max(k, 1), 50)
+
+    def lookup():
+        neighbours = similarity_index.search(vector, k, exclude={study_id})
+        cases = []
+        for neighbour_id, score in neighbours:
+            study = clinical_store.get_study(neighbour_id)
+            if study:
+                cases.append({
+                    "study_id": neighbour_id,
+                    "similarity": score,
+                    "date": datetime.fromtimestamp(study["created_at"]).isoformat(),
+                    "findings": [
+                        {"disease": f["disease"], "confidence": f["confidence"], "severity": f["severity"]}
+                        for f in study["findings"]
+                    ]
+                })
+        return cases
+
+    cases = await run_in_threadpool(lookup)
+    return {"study_id": study_id, "similar": cases, "count": len(cases)}
+
+@app.get("/admin/similarity", dependencies=[Depends(require_admin)])
+async def get_similarity_status():
+    return await run_in_threadpool(similarity_index.status)
+
+@app.post("/admin/similarity/train", dependencies=[Depends(require_admin)])
+async def train_similarity_index(nlist: Optional[int] = None):
+    """Re-cluster the index (e.g. after it has grown well past its last training size)"""
+    await run_in_threadpool(similarity_index.train, nlist)
+    return await run_in_threadpool(similarity_index.status)
+
 def generate_clinical_report(findings, confidence):
     report = "CHEST X-RAY AI ANALYSIS REPORT\n"
     report += "=" * 50 + "\n\n"
     report += f"MODEL: TorchXRayVision DenseNet121 (CheXpert-trained)\n"
-    report += f"ANALYSIS DATE: {pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
+    report += f"ANALYSIS DATE: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
     if not findings:
         report += "FINDINGS: No significant pathological findings detected\n"
         report += "RECOMMENDATION: Normal chest radiograph\n"
@@ -794,6 +1360,8 @@ def generate_clinical_report(findings, confidence):
             report += f"{i}. {finding['disease'].upper()}\n"
             report += f"   • Confidence: {finding['confidence']:.1%}\n"
             report += f"   • Severity: {finding['severity']}\n"
+            if finding.get('location_description'):
+                report += f"   • Location: {finding['location_description']}\n"
             report += f"   • Description: {finding['description']}\n\n"
     report += f"OVERALL CONFIDENCE: {confidence:.1%}\n"
     report += "NOTE: This analysis uses a validated model trained on CheXpert dataset\n"
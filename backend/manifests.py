@@ -0,0 +1,162 @@
+# backend/manifests.py
+"""
+Labeled image manifests for offline calibration, weight tuning and evaluation
+Loads CSV manifests into a (images, pathologies) label matrix and scores
+them with every ensemble member once, caching the per-member probabilities
+on disk so later fitting and evaluation runs never re-run the models
+"""
+
+import os
+import csv
+import json
+import hashlib
+import logging
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+class Manifest:
+    """Image paths plus an (images, pathologies) label matrix; NaN marks unknown labels"""
+
+    def __init__(self, path, image_paths, labels, pathologies, digest):
+        self.path = path
+        self.image_paths = image_paths
+        self.labels = labels
+        self.pathologies = list(pathologies)
+        self.digest = digest
+
+    def __len__(self):
+        return len(self.image_paths)
+
+    def subset(self, mask):
+        mask = np.asarray(mask, dtype=bool)
+        return Manifest(
+            self.path, [p for p, keep in zip(self.image_paths, mask) if keep], self.labels[mask],
+            self.pathologies, f"{self.digest}:{hashlib.sha256(mask.tobytes()).hexdigest()[:16]}"
+        )
+
+
+def parse_label(value, pathologies):
+    """A `label` cell as a pathology index: an integer index or a pathology name"""
+    value = value.strip()
+    if value.lstrip("-").isdigit():
+        index = int(value)
+    elif value in pathologies:
+        index = pathologies.index(value)
+    else:
+        raise ValueError(f"Unknown label {value!r}")
+    if not 0 <= index < len(pathologies):
+        raise ValueError(f"Label index {index} out of range")
+    return index
+
+
+def load_manifest(path, pathologies, image_dir=None):
+    """Read a manifest CSV with a `filename` column and either
+
+    - `label`: one positive pathology per image (index into `pathologies` or its name),
+      all other pathologies negative, as in data/train/valid/valid.csv; or
+    - one column per pathology (CheXpert style): 1 positive, 0 negative, blank/-1 unknown.
+
+    Image paths are resolved against `image_dir` (default: the manifest's directory).
+    """
+    pathologies = list(pathologies)
+    image_dir = image_dir or os.path.dirname(os.path.abspath(path))
+    with open(path, "rb") as f:
+        raw = f.read()
+
+    rows = list(csv.DictReader(raw.decode("utf-8-sig").splitlines()))
+    if not rows or "filename" not in rows[0]:
+        raise ValueError(f"{path}: expected a header with a 'filename' column")
+
+    labels = np.full((len(rows), len(pathologies)), np.nan, dtype=np.float32)
+    columns = [(j, name) for j, name in enumerate(pathologies) if name in rows[0]]
+    if "label" not in rows[0] and not columns:
+        raise ValueError(f"{path}: expected a 'label' column or per-pathology columns")
+
+    for i, row in enumerate(rows):
+        if "label" in row:
+            labels[i] = 0.0
+            labels[i, parse_label(row["label"], pathologies)] = 1.0
+        else:
+            for j, name in columns:
+                cell = (row[name] or "").strip()
+                if cell in ("0", "0.0", "1", "1.0"):
+                    labels[i, j] = float(cell)
+
+    image_paths = [os.path.join(image_dir, row["filename"]) for row in rows]
+    return Manifest(path, image_paths, labels, pathologies, hashlib.sha256(raw).hexdigest())
+
+
+def member_descriptor(name, model):
+    """Identifies a member's weights, for cache keys"""
+    return f"{name}:{type(model).__name__}:{getattr(model, 'weights', None)}:{getattr(model, 'checkpoint', None)}"
+
+
+def scores_cache_key(manifest, ensemble, config=None):
+    payload = {
+        "manifest": manifest.digest,
+        "image_dir": os.path.dirname(manifest.image_paths[0]) if manifest.image_paths else None,
+        "members": sorted(member_descriptor(name, model) for name, model in ensemble.models.items())
+    }
+    if config:
+        payload["config"] = config
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:24]
+
+
+def score_manifest(manifest, ensemble, preprocess, cache_dir=None, predict=None, config=None):
+    """Per-member probabilities for every manifest image: ({member: (images, pathologies)}, loaded mask)
+
+    Images go through `preprocess` and the ensemble one at a time, exactly as
+    in serving. Images that fail to load are marked False in the mask.
+    `predict(batch)` replaces the default member pass (e.g. with resizing or
+    test-time augmentation) and `config` describes what it changes.
+    Results are cached in `cache_dir` keyed by manifest contents, member
+    weights and `config`.
+    """
+    cache_path = None
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        cache_path = os.path.join(cache_dir, f"scores-{scores_cache_key(manifest, ensemble, config)}.npz")
+        if os.path.exists(cache_path):
+            with np.load(cache_path) as cached:
+                logger.info(f"♻️ Using cached member scores {os.path.basename(cache_path)}")
+                return {name: cached[name] for name in ensemble.models}, cached["__loaded__"]
+
+    n, p = len(manifest), len(manifest.pathologies)
+    scores = {name: np.full((n, p), np.nan, dtype=np.float32) for name in ensemble.models}
+    loaded = np.zeros(n, dtype=bool)
+    device = next(iter(ensemble.models.values())).parameters().__next__().device
+
+    for i, image_path in enumerate(manifest.image_paths):
+        try:
+            with open(image_path, "rb") as f:
+                processed, _ = preprocess(f.read())
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping {image_path}: {e}")
+            continue
+        with torch.no_grad():
+            batch = torch.from_numpy(processed).unsqueeze(0).to(device)
+            individual = predict(batch) if predict else ensemble.predict_batch(batch)['individual_predictions']
+        for name, probs in individual.items():
+            scores[name][i] = probs[0]
+        loaded[i] = True
+        if (i + 1) % 100 == 0:
+            logger.info(f"🔬 Scored {i + 1}/{n} images")
+
+    if not loaded.any():
+        raise ValueError(f"No images from {manifest.path} could be loaded")
+    if cache_path:
+        np.savez(cache_path, __loaded__=loaded, **scores)
+    return scores, loaded
+
+
+def combine_members(scores, weights):
+    """Weighted ensemble of member score matrices; weights are scalars or per-pathology vectors"""
+    total = None
+    for name, probs in scores.items():
+        term = probs * np.asarray(weights[name], dtype=np.float32)
+        total = term if total is None else total + term
+    return total
@@ -1,5 +1,14 @@
 # backend/medical_knowledge.py
+"""
+Medical knowledge base
+Per-pathology definitions, X-ray findings, significance, actions and
+citations, compiled once into a registry that the API, reports and the
+prediction loop share
+"""
 
+import sys
+import json
+import hashlib
 
 MEDICAL_KNOWLEDGE = {
     "Atelectasis": {
@@ -297,30 +306,170 @@ MEDICAL_KNOWLEDGE = {
     }
 }
 
+# Output order of the TorchXRayVision models (xrv.datasets.default_pathologies), listed here so
+# processes that never load a model do not have to import torch for it
+DEFAULT_PATHOLOGIES = [
+    'Atelectasis', 'Consolidation', 'Infiltration', 'Pneumothorax', 'Edema', 'Emphysema', 'Fibrosis', 'Effusion',
+    'Pneumonia', 'Pleural_Thickening', 'Cardiomegaly', 'Nodule', 'Mass', 'Hernia', 'Lung Lesion', 'Fracture',
+    'Lung Opacity', 'Enlarged Cardiomediastinum'
+]
+
+# Model pathology names without an entry of their own, mapped to the closest entry
+PATHOLOGY_ALIASES = {
+    "Infiltration": "Lung Opacity",
+    "Effusion": "Pleural Effusion",
+    "Pleural_Thickening": "Pleural Other",
+    "Nodule": "Lung Lesion",
+    "Mass": "Lung Lesion",
+    "Hernia": "Enlarged Cardiomediastinum"
+}
+
+# One-line patient-facing descriptions of the model's pathology names
+DISEASE_DESCRIPTIONS = {
+    'Atelectasis': 'Collapse or closure of lung tissue resulting in reduced gas exchange',
+    'Consolidation': 'Areas of lung filled with liquid instead of air, often indicating pneumonia',
+    'Infiltration': 'Abnormal substance in lung tissue, may indicate infection or inflammation',
+    'Pneumothorax': 'Collapsed lung due to air leak - requires immediate medical attention',
+    'Edema': 'Fluid accumulation in lung tissue, may indicate heart failure',
+    'Emphysema': 'Lung condition causing shortness of breath due to damaged air sacs',
+    'Fibrosis': 'Lung scarring that makes breathing difficult',
+    'Effusion': 'Abnormal accumulation of fluid around the lungs',
+    'Pneumonia': 'Lung infection causing inflammation - may need antibiotic treatment',
+    'Pleural_Thickening': 'Scarring of the lining around the lungs',
+    'Cardiomegaly': 'Enlarged heart, may indicate underlying heart disease',
+    'Nodule': 'Small spots in lungs that need follow-up evaluation',
+    'Mass': 'Larger abnormal growth requiring immediate medical evaluation',
+    'Hernia': 'Protrusion of organs visible on chest X-ray',
+    'Lung Lesion': 'Abnormal tissue in lungs requiring medical assessment',
+    'Fracture': 'Bone break visible on chest X-ray',
+    'Lung Opacity': 'Cloudy areas in lungs that may indicate disease',
+    'Enlarged Cardiomediastinum': 'Enlargement of heart and surrounding structures'
+}
+
+
+class PathologyRecord:
+    """Read-only knowledge entry; supports record['field'] and 'field' in record like the source dicts"""
+
+    __slots__ = ("name", "definition", "xray_findings", "clinical_significance", "action_steps", "citations")
+
+    def __init__(self, name, info):
+        self.name = sys.intern(name)
+        self.definition = info["definition"]
+        self.xray_findings = tuple(info["xray_findings"])
+        self.clinical_significance = info["clinical_significance"]
+        self.action_steps = tuple(info["action_steps"])
+        self.citations = tuple(info.get("citations", ()))
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.__slots__ else default
+
+    def to_dict(self):
+        return {key: list(value) if isinstance(value, tuple) else value
+                for key, value in ((key, getattr(self, key)) for key in self.__slots__ if key != "name")}
+
+
+def _normalize_name(name):
+    return name.replace("_", " ").strip().lower()
+
+
+class KnowledgeRegistry:
+    """Knowledge base compiled once: records, alias resolution, model-index lookups and API payloads
+
+    `pathologies` is the model's output order (xrv.datasets.default_pathologies);
+    `by_index[i]` and `descriptions[i]` give the record and description of output i.
+    """
+
+    def __init__(self, pathologies=(), knowledge=None, aliases=None, descriptions=None):
+        knowledge = MEDICAL_KNOWLEDGE if knowledge is None else knowledge
+        aliases = PATHOLOGY_ALIASES if aliases is None else aliases
+        descriptions = DISEASE_DESCRIPTIONS if descriptions is None else descriptions
+
+        self.records = {name: PathologyRecord(name, info) for name, info in knowledge.items()}
+        self._lookup = {}
+        for name, record in self.records.items():
+            self._lookup[name] = record
+            self._lookup[_normalize_name(name)] = record
+        for alias, target in aliases.items():
+            if target not in self.records:
+                raise ValueError(f"Alias {alias!r} points to unknown pathology {target!r}")
+            self._lookup.setdefault(alias, self.records[target])
+            self._lookup.setdefault(_normalize_name(alias), self.records[target])
+
+        self.pathologies = tuple(sys.intern(name) for name in pathologies)
+        self.by_index = tuple(self.resolve(name) for name in self.pathologies)
+        self.descriptions = tuple(descriptions.get(name, f"Medical condition: {name}") for name in self.pathologies)
+
+        source = json.dumps(
+            {"knowledge": knowledge, "aliases": aliases, "descriptions": descriptions, "pathologies": self.pathologies},
+            sort_keys=True
+        )
+        self.version = hashlib.sha256(source.encode()).hexdigest()[:12]
+
+        self.payloads = {
+            "pathologies": self._payload("pathologies", {
+                "pathologies": list(self.records), "knowledge_version": self.version
+            }),
+            "diseases": self._payload("diseases", {
+                "diseases": [{"name": name, "description": description}
+                             for name, description in zip(self.pathologies, self.descriptions)],
+                "total_count": len(self.pathologies),
+                "source": "CheXpert Dataset via TorchXRayVision",
+                "knowledge_version": self.version
+            })
+        }
+
+    def _payload(self, name, body):
+        """Serialized JSON body and its strong ETag"""
+        return json.dumps(body).encode(), f'"{name}-{self.version}"'
+
+    def resolve(self, name):
+        """Record for a pathology name or alias (any case, '_' or ' '), or None"""
+        record = self._lookup.get(name)
+        if record is None and isinstance(name, str):
+            record = self._lookup.get(_normalize_name(name))
+        return record
+
+    def __getitem__(self, name):
+        record = self.resolve(name)
+        if record is None:
+            raise KeyError(name)
+        return record
+
+    def __contains__(self, name):
+        return self.resolve(name) is not None
+
+    def search(self, query):
+        query_lower = query.lower()
+        return [
+            {'pathology': name, 'info': record}
+            for name, record in self.records.items()
+            if (query_lower in name.lower() or
+                query_lower in record.definition.lower() or
+                any(query_lower in finding.lower() for finding in record.xray_findings))
+        ]
+
+
+_registry = KnowledgeRegistry()
+
 
 def get_pathology_info(pathology_name):
-    """Retrieve medical knowledge for a specific pathology"""
-    return MEDICAL_KNOWLEDGE.get(pathology_name, None)
+    """Retrieve medical knowledge for a specific pathology (aliases resolved)"""
+    return _registry.resolve(pathology_name)
 
 
 def get_all_pathologies():
     """Return list of all pathology names"""
-    return list(MEDICAL_KNOWLEDGE.keys())
+    return list(_registry.records)
 
 
 def search_knowledge(query):
     """Simple search across all pathologies"""
-    query_lower = query.lower()
-    results = []
-    
-    for pathology, info in MEDICAL_KNOWLEDGE.items():
-        # Search in definition and findings
-        if (query_lower in pathology.lower() or 
-            query_lower in info['definition'].lower() or
-            any(query_lower in finding.lower() for finding in info['xray_findings'])):
-            results.append({
-                'pathology': pathology,
-                'info': info
-            })
-    
-    return results
\ No newline at end of file
+    return _registry.search(query)
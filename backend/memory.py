@@ -0,0 +1,142 @@
+# backend/memory.py
+"""
+Memory-bounded inference helpers
+Buffer pooling, an in-flight memory budget and per-request peak tracking
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager, asynccontextmanager
+
+import numpy as np
+import torch
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+class BufferPool:
+    """Preallocated tensors/arrays reused across requests, keyed by shape and dtype"""
+
+    def __init__(self, max_per_key=4):
+        self.max_per_key = max_per_key
+        self._free = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def tensor(self, shape, dtype=torch.float32, device="cpu"):
+        key = ("tensor", tuple(shape), str(dtype), str(device))
+        with self._borrow(key, lambda: torch.empty(shape, dtype=dtype, device=device)) as buf:
+            yield buf
+
+    @contextmanager
+    def array(self, shape, dtype=np.uint8):
+        key = ("array", tuple(shape), np.dtype(dtype).str)
+        with self._borrow(key, lambda: np.empty(shape, dtype=dtype)) as buf:
+            yield buf
+
+    @contextmanager
+    def _borrow(self, key, factory):
+        with self._lock:
+            free = self._free.get(key)
+            buf = free.pop() if free else None
+        if buf is None:
+            buf = factory()
+        try:
+            yield buf
+        finally:
+            with self._lock:
+                free = self._free.setdefault(key, [])
+                if len(free) < self.max_per_key:
+                    free.append(buf)
+
+
+class MemoryBudget:
+    """Caps concurrent inferences by their estimated memory footprint"""
+
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.in_use = 0
+        self.waiting = 0
+        self._condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def reserve(self, nbytes):
+        # A single oversized request may still run, but only on its own
+        nbytes = min(int(nbytes), self.budget_bytes)
+        async with self._condition:
+            self.waiting += 1
+            try:
+                await self._condition.wait_for(lambda: self.in_use + nbytes <= self.budget_bytes)
+            finally:
+                self.waiting -= 1
+            self.in_use += nbytes
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.in_use -= nbytes
+                self._condition.notify_all()
+
+    def status(self):
+        return {
+            "budget_mb": self.budget_bytes / MB,
+            "in_use_mb": self.in_use / MB,
+            "waiting": self.waiting
+        }
+
+
+def estimate_request_bytes(width, height, per_inference_bytes):
+    """Rough upper bound for one analysis: decoded RGB + float32 gray + model working set"""
+    return width * height * 3 + width * height * 4 + per_inference_bytes
+
+
+def current_rss_bytes():
+    """Resident set size of this process, or None if it cannot be read"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class PeakMemoryTracker:
+    """Samples RSS (and CUDA allocations) at stage checkpoints of one request"""
+
+    def __init__(self, device="cpu"):
+        self.cuda = str(device).startswith("cuda") and torch.cuda.is_available()
+        self.start_rss = current_rss_bytes()
+        self.peak_rss = self.start_rss
+        self.stages = {}
+        self._start = time.perf_counter()
+        if self.cuda:
+            torch.cuda.reset_peak_memory_stats()
+
+    def checkpoint(self, stage):
+        rss = current_rss_bytes()
+        if rss is not None:
+            self.peak_rss = max(self.peak_rss or 0, rss)
+            self.stages[stage] = round(rss / MB, 1)
+
+    def summary(self):
+        summary = {
+            "rss_start_mb": round(self.start_rss / MB, 1) if self.start_rss else None,
+            "peak_rss_mb": round(self.peak_rss / MB, 1) if self.peak_rss else None,
+            "peak_delta_mb": round((self.peak_rss - self.start_rss) / MB, 1) if self.start_rss else None,
+            # ru_maxrss is KB on Linux and the process-wide high-water mark
+            "process_max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1) if resource else None,
+            "stage_rss_mb": self.stages,
+            "elapsed_s": round(time.perf_counter() - self._start, 3)
+        }
+        if self.cuda:
+            summary["cuda_peak_allocated_mb"] = round(torch.cuda.max_memory_allocated() / MB, 1)
+        return summary
@@ -0,0 +1,289 @@
+# backend/model_registry.py
+"""
+Model registry
+Ensemble versions (members, weights files, input resolutions, primary model
+and ensemble weights) are described in a JSON registry instead of code. A
+version is loaded and warmed up in the background, then swapped in
+atomically: new analyses use it at once while those already running finish
+on the version they started with, which is released once they drain.
+
+    {
+      "active": "chex-2024",
+      "versions": {
+        "chex-2024": {
+          "primary": "densenet121",
+          "members": {
+            "densenet121": {"architecture": "densenet", "weights": "densenet121-res224-chex", "resolution": 224},
+            "resnet50": {"architecture": "resnet", "weights": "resnet50-res512-all", "resolution": 512},
+            "efficientnet": {"architecture": "densenet", "weights": "densenet121-res224-all",
+                             "checkpoint": "runtime/checkpoints/efficientnet-ft.pt", "resolution": 224}
+          },
+          "ensemble_weights": {"densenet121": 0.6, "resnet50": 0.25, "efficientnet": 0.15}
+        }
+      }
+    }
+"""
+
+import os
+import gc
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+
+import torch
+
+from store import DATA_DIR
+from medical_knowledge import DEFAULT_PATHOLOGIES
+from thresholds import DEFAULT_ENSEMBLE_WEIGHTS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REGISTRY_PATH = os.environ.get("RAD_ETHIX_MODEL_REGISTRY_PATH", os.path.join(DATA_DIR, "models.json"))
+
+# How long analyses may keep the previous version busy after a swap before a warning is logged;
+# its models are only released once the last of them finishes
+DRAIN_TIMEOUT_SECONDS = float(os.environ.get("RAD_ETHIX_MODEL_DRAIN_SECONDS", "120"))
+
+# The ensemble this service shipped with, used when the registry file does not exist
+BUILTIN_VERSION = "builtin"
+BUILTIN_SPEC = {
+    "primary": "densenet121",
+    "members": {
+        "densenet121": {"architecture": "densenet", "weights": "densenet121-res224-chex", "resolution": 224},
+        "resnet50": {"architecture": "resnet", "weights": "resnet50-res512-all", "resolution": 512},
+        # DenseNet weights stand in for EfficientNet until dedicated weights are available
+        "efficientnet": {"architecture": "densenet", "weights": "densenet121-res224-all", "resolution": 224}
+    },
+    "ensemble_weights": DEFAULT_ENSEMBLE_WEIGHTS
+}
+
+ARCHITECTURES = ("densenet", "resnet")
+
+
+class ModelSpec:
+    """One validated ensemble version; `tag` changes whenever its definition does"""
+
+    def __init__(self, name, spec):
+        members = spec.get("members")
+        if not isinstance(members, dict) or not members:
+            raise ValueError(f"{name}: members must be a non-empty mapping")
+        for member, member_spec in members.items():
+            if member_spec.get("architecture") not in ARCHITECTURES:
+                raise ValueError(f"{name}.{member}: architecture must be one of {ARCHITECTURES}")
+            if not member_spec.get("weights"):
+                raise ValueError(f"{name}.{member}: weights are required")
+        primary = spec.get("primary", next(iter(members)))
+        if primary not in members:
+            raise ValueError(f"{name}: primary member {primary!r} is not in members")
+        weights = spec.get("ensemble_weights") or {member: 1.0 / len(members) for member in members}
+        if set(weights) - set(members):
+            raise ValueError(f"{name}: ensemble_weights name unknown members {sorted(set(weights) - set(members))}")
+
+        self.name = name
+        self.members = members
+        self.primary = primary
+        self.ensemble_weights = weights
+        self.input_size = max(int(m.get("resolution", 224)) for m in members.values())
+        digest = hashlib.sha256(json.dumps(
+            {"members": members, "primary": primary, "ensemble_weights": weights}, sort_keys=True
+        ).encode())
+        for member_spec in members.values():
+            if member_spec.get("checkpoint"):
+                digest.update(_file_digest(member_spec["checkpoint"]).encode())
+        self.tag = f"{name}@{digest.hexdigest()[:8]}"
+
+    def summary(self):
+        return {
+            "name": self.name,
+            "tag": self.tag,
+            "primary": self.primary,
+            "members": self.members,
+            "ensemble_weights": self.ensemble_weights,
+            "input_size": self.input_size
+        }
+
+
+def _file_digest(path):
+    """Size and mtime stamp of a checkpoint; a new file under the same name gives a new tag"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        raise ValueError(f"Checkpoint not found: {path}")
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def load_registry(path=DEFAULT_REGISTRY_PATH):
+    """(active version name, {name: ModelSpec}); the built-in version is always available"""
+    versions = {BUILTIN_VERSION: ModelSpec(BUILTIN_VERSION, BUILTIN_SPEC)}
+    if not os.path.exists(path):
+        return BUILTIN_VERSION, versions
+    with open(path) as f:
+        document = json.load(f)
+    for name, spec in document.get("versions", {}).items():
+        versions[name] = ModelSpec(name, spec)
+    active = document.get("active", BUILTIN_VERSION)
+    if active not in versions:
+        raise ValueError(f"Active model version {active!r} is not defined")
+    return active, versions
+
+
+def build_member(spec, device="cpu"):
+    """Instantiate one member from its spec, with an optional fine-tuned checkpoint on top"""
+    import torchxrayvision as xrv
+
+    if list(xrv.datasets.default_pathologies) != DEFAULT_PATHOLOGIES:
+        raise RuntimeError("torchxrayvision outputs differ from medical_knowledge.DEFAULT_PATHOLOGIES")
+    if spec["architecture"] == "densenet":
+        model = xrv.models.DenseNet(weights=spec["weights"])
+    else:
+        model = xrv.models.ResNet(weights=spec["weights"])
+    if spec.get("checkpoint"):
+        state = torch.load(spec["checkpoint"], map_location="cpu")
+        model.load_state_dict(state.get("state_dict", state) if isinstance(state, dict) else state)
+        model.checkpoint = f"{spec['checkpoint']}:{_file_digest(spec['checkpoint'])}"
+    return model.to(device).eval()
+
+
+def warm_up(ensemble):
+    """One forward pass per member at its input size, so the first real request pays no setup cost"""
+    with torch.no_grad():
+        for name, model in ensemble.models.items():
+            resolution = int(ensemble.spec.members[name].get("resolution", 224)) if ensemble.spec else 224
+            model(torch.zeros(1, 1, resolution, resolution, device=ensemble.device))
+        for capture in ensemble.feature_captures.values():
+            capture.pop()
+
+
+class ModelRegistry:
+    """Active ensemble plus the background load / warm-up / swap / drain cycle
+
+    `build(spec)` constructs an ensemble for a ModelSpec and `install(ensemble)`
+    makes it the one new analyses use. Analyses hold a lease on the ensemble
+    they started with, so a swap never changes models under a running study.
+    """
+
+    def __init__(self, build, install, path=DEFAULT_REGISTRY_PATH, drain_timeout=DRAIN_TIMEOUT_SECONDS):
+        self.build = build
+        self.install = install
+        self.path = path
+        self.drain_timeout = drain_timeout
+        self.active = None
+        self.loading = None
+        self.last_error = None
+        self.draining = {}   # tag -> (ensemble, swapped_at)
+        self.history = []
+        self._leases = {}
+        self._lock = threading.Lock()
+        self._task = None
+
+    def versions(self):
+        return load_registry(self.path)[1]
+
+    def active_spec(self):
+        """Spec of the version the registry file marks active"""
+        active, versions = load_registry(self.path)
+        return versions[active]
+
+    def load_initial(self):
+        """Build, warm up and install the registry's active version (blocking; at startup)"""
+        ensemble = self.build(self.active_spec())
+        warm_up(ensemble)
+        self._swap(ensemble)
+        return ensemble
+
+    @contextmanager
+    def lease(self, ensemble=None):
+        """`ensemble` (default: the active one), counted as in use until the block exits"""
+        with self._lock:
+            ensemble = ensemble or self.active
+            self._leases[ensemble.version] = self._leases.get(ensemble.version, 0) + 1
+        try:
+            yield ensemble
+        finally:
+            with self._lock:
+                self._leases[ensemble.version] -= 1
+
+    def in_flight(self, tag):
+        with self._lock:
+            return self._leases.get(tag, 0)
+
+    def activate(self, name):
+        """Start loading `name` in the background; raises ValueError for unknown versions or a load in progress"""
+        versions = self.versions()
+        if name not in versions:
+            raise ValueError(f"Unknown model version {name!r}; available: {sorted(versions)}")
+        if self._task is not None and not self._task.done():
+            raise ValueError(f"Model version {self.loading['tag']} is still loading")
+        spec = versions[name]
+        self.loading = {"tag": spec.tag, "status": "loading", "started_at": time.time()}
+        self._task = asyncio.create_task(self._load_and_swap(spec))
+        return self.loading
+
+    async def _load_and_swap(self, spec):
+        loop = asyncio.get_running_loop()
+        try:
+            logger.info(f"📦 Loading model version {spec.tag} in the background...")
+            ensemble = await loop.run_in_executor(None, self.build, spec)
+            self.loading["status"] = "warming_up"
+            await loop.run_in_executor(None, warm_up, ensemble)
+        except Exception as e:
+            logger.error(f"❌ Model version {spec.tag} failed to load: {e}")
+            self.last_error = {"tag": spec.tag, "error": str(e), "at": time.time()}
+            self.loading = None
+            return
+
+        previous = self._swap(ensemble)
+        self.loading = None
+        if previous is not None and previous.version != ensemble.version:
+            await self._drain(previous)
+
+    def _swap(self, ensemble):
+        with self._lock:
+            previous, self.active = self.active, ensemble
+        self.install(ensemble)
+        self.history.append({"tag": ensemble.version, "activated_at": time.time()})
+        logger.info(f"🔁 Model version {ensemble.version} is active")
+        return previous
+
+    async def _drain(self, ensemble):
+        """Wait for analyses still on `ensemble`, then release its models
+
+        Models are never released under a running analysis; past the drain
+        timeout the wait is logged (once) and continues.
+        """
+        self.draining[ensemble.version] = (ensemble, time.time())
+        deadline = time.monotonic() + self.drain_timeout
+        warned = False
+        while self.in_flight(ensemble.version):
+            if not warned and time.monotonic() >= deadline:
+                logger.warning(
+                    f"⚠️ Model version {ensemble.version} still has {self.in_flight(ensemble.version)} analyses "
+                    f"running after {self.drain_timeout:g}s; keeping it loaded until they finish"
+                )
+                warned = True
+            await asyncio.sleep(0.1)
+        del self.draining[ensemble.version]
+        ensemble.release()
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        logger.info(f"🧹 Model version {ensemble.version} drained and released")
+
+    def status(self):
+        return {
+            "active": self.active.spec.summary() if self.active is not None and self.active.spec else None,
+            "active_tag": self.active.version if self.active is not None else None,
+            "in_flight": self.in_flight(self.active.version) if self.active is not None else 0,
+            "loading": self.loading,
+            "draining": [
+                {"tag": tag, "in_flight": self.in_flight(tag), "since": since,
+                 "overdue": time.time() - since > self.drain_timeout}
+                for tag, (_, since) in self.draining.items()
+            ],
+            "last_error": self.last_error,
+            "history": self.history[-10:]
+        }
@@ -0,0 +1,124 @@
+# backend/overlays.py
+"""
+Heatmap overlay rendering
+Prepares the grayscale base once, blends every heatmap through a
+precomputed (gray, heat) -> color table and encodes overlays in parallel
+"""
+
+import os
+import base64
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+OVERLAY_ALPHA = 0.4
+
+# JET colormap as a 256-entry BGR table, identical to cv2.applyColorMap
+JET_LUT = cv2.applyColorMap(np.arange(256, dtype=np.uint8).reshape(256, 1), cv2.COLORMAP_JET).reshape(256, 3)
+
+OVERLAY_FORMATS = {
+    "png": (".png", "image/png"),
+    "jpeg": (".jpg", "image/jpeg"),
+    "webp": (".webp", "image/webp"),
+}
+
+# Upper bound on pixels blended per NumPy pass, to cap temporaries at full resolution
+MAX_PIXELS_PER_PASS = 16 * 1024 * 1024
+
+# cv2.imencode releases the GIL, so a small thread pool encodes overlays concurrently
+_encoder_pool = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1), thread_name_prefix="overlay-encode")
+
+
+def build_blend_table(alpha=OVERLAY_ALPHA):
+    """(256 * 256, 3) table of round(gray * (1 - alpha) + jet[heat] * alpha), indexed by gray * 256 + heat"""
+    gray = np.arange(256, dtype=np.float32)[:, None, None]
+    blended = gray * (1 - alpha) + JET_LUT[None, :, :].astype(np.float32) * alpha
+    return np.clip(np.rint(blended), 0, 255).astype(np.uint8).reshape(256 * 256, 3)
+
+
+BLEND_TABLE = build_blend_table()
+
+
+class OverlayOptions:
+    """Client-selectable overlay resolution and codec settings"""
+
+    def __init__(self, format="png", quality=90, png_compression=None, resolution="224"):
+        if format not in OVERLAY_FORMATS:
+            raise ValueError(f"overlay_format must be one of {sorted(OVERLAY_FORMATS)}")
+        if not 1 <= quality <= 100:
+            raise ValueError("overlay_quality must be between 1 and 100")
+        if png_compression is not None and not 0 <= png_compression <= 9:
+            raise ValueError("png_compression must be between 0 and 9")
+        if resolution not in ("224", "original"):
+            raise ValueError("overlay_resolution must be '224' or 'original'")
+        self.format = format
+        self.quality = quality
+        self.png_compression = png_compression
+        self.resolution = resolution
+
+    @property
+    def mime_type(self):
+        return OVERLAY_FORMATS[self.format][1]
+
+    def cache_key(self):
+        return (self.format, self.quality, self.png_compression, self.resolution)
+
+    def encode_params(self):
+        if self.format == "png":
+            return [] if self.png_compression is None else [cv2.IMWRITE_PNG_COMPRESSION, self.png_compression]
+        if self.format == "jpeg":
+            return [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+        return [cv2.IMWRITE_WEBP_QUALITY, self.quality]
+
+
+class OverlayRenderer:
+    """Renders many heatmaps over one shared grayscale base image"""
+
+    def __init__(self, original_image, size=(224, 224)):
+        gray = original_image
+        if gray.ndim == 3:
+            gray = cv2.cvtColor(gray, cv2.COLOR_RGB2GRAY)
+        if size is not None and gray.shape[:2] != (size[1], size[0]):
+            gray = cv2.resize(gray, size)
+        self.height, self.width = gray.shape[:2]
+        # Row offsets into BLEND_TABLE, computed once for every heatmap
+        self.base_index = gray.astype(np.int32) * 256
+
+    def render(self, heatmaps, out=None):
+        """Blend heatmaps (2-D arrays in [0, 1], any size) into an (N, H, W, 3) uint8 array"""
+        n = len(heatmaps)
+        if out is None:
+            out = np.empty((n, self.height, self.width, 3), dtype=np.uint8)
+
+        heat = np.empty((n, self.height, self.width), dtype=np.float32)
+        for i, heatmap in enumerate(heatmaps):
+            heatmap = np.asarray(heatmap, dtype=np.float32)
+            if heatmap.shape != (self.height, self.width):
+                heatmap = cv2.resize(heatmap, (self.width, self.height))
+            heat[i] = heatmap
+
+        # Same quantization as (heatmap * 255).astype(np.uint8)
+        heat *= 255
+        heat_index = heat.astype(np.uint8)
+        del heat
+
+        per_pass = max(1, MAX_PIXELS_PER_PASS // (self.height * self.width))
+        for start in range(0, n, per_pass):
+            stop = min(start + per_pass, n)
+            np.take(BLEND_TABLE, self.base_index + heat_index[start:stop], axis=0, out=out[start:stop], mode='clip')
+        return out
+
+
+def encode_overlays(images, options):
+    """Encode overlays concurrently, returning base64 strings (None where encoding failed)"""
+    extension = OVERLAY_FORMATS[options.format][0]
+    params = options.encode_params()
+
+    def encode(image):
+        ok, buffer = cv2.imencode(extension, image, params)
+        return base64.b64encode(buffer).decode() if ok else None
+
+    if len(images) == 1:
+        return [encode(images[0])]
+    return list(_encoder_pool.map(encode, images))
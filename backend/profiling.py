@@ -0,0 +1,111 @@
+# backend/profiling.py
+"""
+Sampling profiler for inference requests
+Runs a fraction of /predict requests under torch.profiler and keeps
+the resulting Chrome traces in a small rotating directory
+"""
+
+import os
+import re
+import time
+import uuid
+import random
+import logging
+import threading
+from contextlib import contextmanager
+
+import torch
+from torch.profiler import profile, ProfilerActivity
+
+logger = logging.getLogger(__name__)
+
+TRACE_NAME_PATTERN = re.compile(r"^[\w.-]+\.json$")
+
+
+class RequestProfiler:
+    """Profiles a sampled fraction of requests and rotates trace files"""
+
+    def __init__(self, trace_dir, sample_rate=0.0, max_traces=20):
+        self.trace_dir = trace_dir
+        self.sample_rate = sample_rate
+        self.max_traces = max_traces
+        # torch.profiler cannot run two sessions at once, so samples are exclusive
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0
+
+    def configure(self, sample_rate=None, max_traces=None):
+        if sample_rate is not None:
+            self.sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+        if max_traces is not None:
+            self.max_traces = max(int(max_traces), 1)
+            self._rotate()
+
+    def status(self):
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "max_traces": self.max_traces,
+            "trace_dir": self.trace_dir,
+            "trace_count": len(self.list_traces())
+        }
+
+    def should_sample(self):
+        return self.enabled and random.random() < self.sample_rate
+
+    @contextmanager
+    def profile(self, label="request"):
+        """Profile the enclosed block and write its trace (None if another profile is running)"""
+        if not self._lock.acquire(blocking=False):
+            # Another request is already being profiled - skip this sample
+            yield None
+            return
+
+        try:
+            activities = [ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(ProfilerActivity.CUDA)
+
+            with profile(activities=activities, record_shapes=True, profile_memory=True) as prof:
+                yield prof
+
+            os.makedirs(self.trace_dir, exist_ok=True)
+            safe_label = re.sub(r"[^\w.-]", "_", label)[:40] or "request"
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{safe_label}-{uuid.uuid4().hex[:8]}.json"
+            prof.export_chrome_trace(os.path.join(self.trace_dir, name))
+            logger.info(f"🧪 Profiler trace written: {name}")
+            self._rotate()
+        finally:
+            self._lock.release()
+
+    def list_traces(self):
+        """Return recent traces, newest first"""
+        if not os.path.isdir(self.trace_dir):
+            return []
+
+        traces = []
+        for entry in os.scandir(self.trace_dir):
+            if entry.is_file() and TRACE_NAME_PATTERN.match(entry.name):
+                stat = entry.stat()
+                traces.append({
+                    "name": entry.name,
+                    "size_bytes": stat.st_size,
+                    "created": stat.st_mtime
+                })
+        return sorted(traces, key=lambda t: t["created"], reverse=True)
+
+    def trace_path(self, name):
+        """Resolve a trace name to a path inside the trace directory, or None"""
+        if not TRACE_NAME_PATTERN.match(name):
+            return None
+        path = os.path.join(self.trace_dir, name)
+        return path if os.path.isfile(path) else None
+
+    def _rotate(self):
+        for trace in self.list_traces()[self.max_traces:]:
+            try:
+                os.remove(os.path.join(self.trace_dir, trace["name"]))
+            except OSError as e:
+                logger.warning(f"Could not remove old trace {trace['name']}: {e}")
@@ -0,0 +1,384 @@
+# backend/reports.py
+"""
+Knowledge base and report endpoints
+Pathology knowledge, prior-study comparison and the professional report
+need no model, so they live here without importing torch: the full API in
+main.py includes this router, and light_main.py serves it (with auth) on
+its own for processes that never analyze images. Rendered reports are
+cached by their normalized inputs, and /generate-report/batch streams many
+reports back as NDJSON with one threshold snapshot and shared lookups.
+"""
+
+import os
+import json
+import logging
+from datetime import datetime
+from functools import lru_cache
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Header
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+
+from cache import LRUCache
+from store import get_store
+from comparison import compare_with_priors
+from medical_knowledge import KnowledgeRegistry, DEFAULT_PATHOLOGIES
+from thresholds import ThresholdEngine
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Patients, studies, predictions and reports persist in the shared SQLite store
+clinical_store = get_store()
+
+# Decision thresholds, ensemble weights and calibration, reloaded when their files change
+threshold_engine = ThresholdEngine(DEFAULT_PATHOLOGIES)
+
+# Most recent prior studies pulled into a comparison
+PRIOR_STUDIES_COMPARED = int(os.environ.get("RAD_ETHIX_PRIOR_STUDIES", "3"))
+
+# Rendered reports, keyed by normalized patient fields, predictions as printed and knowledge / threshold versions
+report_cache = LRUCache(max_entries=int(os.environ.get("RAD_ETHIX_REPORT_CACHE_SIZE", "256")))
+MAX_BATCH_REPORTS = int(os.environ.get("RAD_ETHIX_MAX_BATCH_REPORTS", "500"))
+
+# ==================== MEDICAL KNOWLEDGE BASE ====================
+# Compiled once: alias resolution, per-output records and the serialized /pathologies and /diseases bodies
+knowledge_base = KnowledgeRegistry(DEFAULT_PATHOLOGIES)
+
+def knowledge_response(name, if_none_match):
+    """Precomputed JSON payload, or 304 when the client already has this version"""
+    body, etag = knowledge_base.payloads[name]
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=3600"}
+    if if_none_match and any(tag.strip().removeprefix("W/") in (etag, "*") for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# ==================== RAG REPORT GENERATION ====================
+class PredictionResult(BaseModel):
+    disease: str
+    confidence: float
+    severity: str
+    description: str
+    critical: Optional[bool] = False
+    location_description: Optional[str] = None
+
+class ReportRequest(BaseModel):
+    patient_name: str
+    patient_id: str
+    age: int
+    gender: str
+    predictions: List[PredictionResult]
+    study_id: Optional[str] = None  # adds a comparison with the patient's prior studies
+
+class BatchReportRequest(BaseModel):
+    reports: List[ReportRequest]
+
+class ReportResponse(BaseModel):
+    report_text: str
+    citations: List[str]
+    findings_count: int
+    timestamp: str
+
+def format_comparison(comparison):
+    """COMPARISON section lines for a prior-study comparison (see comparison.compare_with_priors)"""
+    if not comparison:
+        return "No prior studies available for comparison.\n\n"
+
+    prior_date = datetime.fromisoformat(comparison['prior_date']).strftime('%B %d, %Y')
+    text = f"Compared with prior study of {prior_date} ({comparison['interval_days']:g} days earlier):\n"
+    changes = [c for c in comparison['changes'] if c['status'] != 'stable']
+    if not changes:
+        text += "  • No significant interval change\n"
+    for change in changes:
+        if change['status'] == 'new':
+            text += f"  • {change['disease']}: new since prior ({change['current']*100:.1f}%)\n"
+        elif change['status'] == 'resolved':
+            text += f"  • {change['disease']}: resolved ({change['prior']*100:.1f}% → {change['current']*100:.1f}%)\n"
+        else:
+            text += f"  • {change['disease']}: {change['status']} ({change['prior']*100:.1f}% → {change['current']*100:.1f}%)\n"
+    stable = [c['disease'] for c in comparison['changes'] if c['status'] == 'stable']
+    if stable:
+        text += f"  • Stable: {', '.join(stable)}\n"
+
+    change_map = comparison.get('change_map')
+    if change_map:
+        text += (f"  • Heatmap ({change_map['pathology']}): activation increased in {change_map['increased_fraction']*100:.0f}% "
+                 f"and decreased in {change_map['decreased_fraction']*100:.0f}% of the image\n")
+    return text + "\n"
+
+MODEL_DISPLAY_NAMES = {'densenet121': 'DenseNet121', 'resnet50': 'ResNet50', 'efficientnet': 'EfficientNet'}
+
+def normalize_report_inputs(patient_data, ml_predictions):
+    """Patient fields and predictions as a report renders them: collapsed whitespace,
+    upper-case patient ID, only the prediction fields used, highest confidence first"""
+    patient = {
+        "name": " ".join(str(patient_data["name"]).split()),
+        "patient_id": str(patient_data["patient_id"]).upper().strip(),
+        "age": patient_data["age"],
+        "gender": " ".join(str(patient_data["gender"]).split())
+    }
+    predictions = []
+    for pred in ml_predictions:
+        normalized = {
+            "disease": pred["disease"],
+            "confidence": float(pred["confidence"]),
+            "location_description": pred.get("location_description")
+        }
+        if pred.get("agreement") is not None:
+            normalized["agreement"] = float(pred["agreement"])
+        predictions.append(normalized)
+    predictions.sort(key=lambda x: x["confidence"], reverse=True)
+    return patient, predictions
+
+def report_cache_key(patient, predictions, top_n, comparison, thresholds, date):
+    """Hashable key of everything a rendered report depends on
+
+    Predictions enter rounded the way the report prints them, together with
+    their positive decision taken on the unrounded confidence, so inputs
+    that share a key render identical text.
+    """
+    return (
+        tuple(patient.values()),
+        tuple(
+            (p["disease"], f"{p['confidence']*100:.1f}", p["confidence"] >= thresholds.positive_for(p["disease"]),
+             f"{p.get('agreement', 1.0)*100:.1f}", p["location_description"])
+            for p in predictions[:top_n]
+        ),
+        None if comparison is None else json.dumps(comparison, sort_keys=True, default=str),
+        knowledge_base.version,
+        thresholds.version,
+        date
+    )
+
+def generate_professional_report(patient_data, ml_predictions, top_n=5, comparison=None, thresholds=None, resolve=None):
+    """Generate hospital-grade report
+
+    Text, citations and findings count are cached by the normalized inputs
+    (and the knowledge, thresholds and date they depend on); the timestamp
+    is always fresh. `thresholds` and `resolve` let a batch share one
+    threshold snapshot and knowledge lookup.
+    """
+    thresholds = thresholds or threshold_engine.current
+    patient, predictions = normalize_report_inputs(patient_data, ml_predictions)
+    today = datetime.now()
+    key = report_cache_key(patient, predictions, top_n, comparison, thresholds, today.date().isoformat())
+    cached = report_cache.get(key)
+    if cached is None:
+        cached = render_professional_report(
+            patient, predictions, top_n, comparison, thresholds, resolve or knowledge_base.resolve, today
+        )
+        report_cache.put(key, cached)
+    return {**cached, 'citations': list(cached['citations']), 'timestamp': datetime.now().isoformat()}
+
+def render_professional_report(patient_data, sorted_predictions, top_n, comparison, thresholds, resolve, today):
+    """Report text, citations and findings count for normalized inputs (see normalize_report_inputs)"""
+    top_predictions = sorted_predictions[:top_n]
+    positives = [p for p in top_predictions if p['confidence'] >= thresholds.positive_for(p['disease'])]
+    knowledge = {p['disease']: resolve(p['disease']) for p in positives}
+
+    report = "=" * 80 + "\n"
+    report += " " * 20 + "DEPARTMENT OF RADIOLOGY\n"
+    report += " " * 15 + "CHEST RADIOGRAPH DIAGNOSTIC REPORT\n"
+    report += "=" * 80 + "\n\n"
+
+    # Patient Info
+    report += "PATIENT INFORMATION\n"
+    report += "━" * 80 + "\n"
+    report += f"Name           : {patient_data['name']}\n"
+    report += f"Patient ID     : {patient_data['patient_id']}\n"
+    report += f"Age/Gender     : {patient_data['age']} years / {patient_data['gender']}\n"
+    report += f"Examination    : Chest X-Ray (PA/Lateral)\n"
+    report += f"Date           : {today.strftime('%B %d, %Y')}\n"
+    report += "Physician      : [To be filled]\n\n"
+
+    # AI Analysis
+    report += "AI-ASSISTED ANALYSIS\n"
+    report += "━" * 80 + "\n"
+    members = " + ".join(
+        f"{MODEL_DISPLAY_NAMES.get(name, name)} ({thresholds.member_weight(name) * 100:.0f}%)"
+        for name in thresholds.ensemble_weights
+    )
+    report += f"Multi-Model Ensemble: {members}\n\n"
+
+    # Comparison with priors, for reports tied to a stored study ({} when it has no priors)
+    if comparison is not None:
+        report += "COMPARISON\n"
+        report += "━" * 80 + "\n"
+        report += format_comparison(comparison)
+
+    # Findings
+    report += "FINDINGS\n"
+    report += "━" * 80 + "\n\n"
+
+    if not positives:
+        report += "LUNGS:\n  • Clear lung fields bilaterally\n\n"
+        report += "HEART: \n  • Cardiac silhouette within normal limits\n\n"
+    else:
+        report += "LUNGS:\n"
+        for idx, pred in enumerate(positives, 1):
+            info = knowledge[pred['disease']]
+            if info:
+                report += f"  {idx}. {info['xray_findings'][0]} consistent with {pred['disease'].lower()}\n"
+                report += f"     Confidence: {pred['confidence']*100:.1f}% | Agreement: {pred.get('agreement', 1.0)*100:.1f}%\n"
+                if pred.get('location_description'):
+                    report += f"     Location: {pred['location_description']}\n"
+        report += "\n"
+
+    # Impression
+    report += "IMPRESSION\n"
+    report += "━" * 80 + "\n"
+    if not positives:
+        report += "1. No acute cardiopulmonary disease\n\n"
+    else:
+        for idx, pred in enumerate(positives, 1):
+            info = knowledge[pred['disease']]
+            if info:
+                report += f"{idx}. {pred['disease']}: {info['clinical_significance']}\n"
+        report += "\n"
+
+    # Recommendations
+    report += "RECOMMENDATIONS\n"
+    report += "━" * 80 + "\n"
+    if not positives:
+        report += "• No immediate action required\n\n"
+    else:
+        recs = set()
+        for pred in positives:
+            info = knowledge[pred['disease']]
+            if info:
+                recs.update(info['action_steps'][:2])
+        for idx, rec in enumerate(sorted(recs), 1):
+            report += f"{idx}. {rec}\n"
+        report += "\n"
+
+    # Footer
+    report += "=" * 80 + "\n"
+    report += "Report generated by RAD-ETHIX Multi-Model AI System\n"
+    report += "⚠️  Requires licensed radiologist review before clinical use\n"
+    report += "=" * 80 + "\n\n"
+    report += "Radiologist Signature: ________________________  Date: ______________\n"
+
+    citations = []
+    for pred in positives:
+        info = knowledge[pred['disease']]
+        if info and 'citations' in info:
+            citations.extend(info['citations'])
+
+    return {
+        'report_text': report,
+        'citations': list(dict.fromkeys(citations))[:5],
+        'findings_count': len(positives)
+    }
+
+def report_for_request(request, thresholds=None, resolve=None, known_patients=None):
+    """Report for one ReportRequest: checks its study, compares with priors, renders and records it
+
+    Blocking (store access); `known_patients` memoizes patient lookups across a batch.
+    """
+    patient_data = {
+        "name": request.patient_name,
+        "patient_id": request.patient_id,
+        "age": request.age,
+        "gender": request.gender
+    }
+
+    ml_predictions = [
+        {
+            "disease": p.disease,
+            "confidence": p.confidence,
+            "severity": p.severity,
+            "location_description": p.location_description
+        }
+        for p in request.predictions
+    ]
+
+    patient_id = request.patient_id.upper().strip()
+    comparison = None
+    if request.study_id:
+        study = clinical_store.get_study(request.study_id)
+        if not study or study["patient_id"] != patient_id:
+            raise HTTPException(status_code=404, detail="Study not found for this patient")
+        comparison = study_comparison(
+            patient_id, study["probabilities"], study["cam_summary"], study["created_at"]
+        ) or {}
+
+    report_data = generate_professional_report(
+        patient_data, ml_predictions, comparison=comparison, thresholds=thresholds, resolve=resolve
+    )
+    known = known_patients.get(patient_id) if known_patients is not None else None
+    if known is None:
+        known = clinical_store.get_patient(patient_id) is not None
+        if known_patients is not None:
+            known_patients[patient_id] = known
+    if known:
+        clinical_store.record_report(patient_id, report_data['report_text'], study_id=request.study_id)
+    return report_data
+
+@router.post("/generate-report", response_model=ReportResponse)
+async def generate_report(request: ReportRequest):
+    """Generate medical report using RAG"""
+    try:
+        return await run_in_threadpool(report_for_request, request)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/generate-report/batch")
+async def generate_report_batch(request: BatchReportRequest):
+    """Generate many reports, streamed back as NDJSON in request order
+
+    Every line carries the request's `index`, `patient_id` and `study_id`,
+    plus the report fields or, for a report that failed, `error` and
+    `status_code` (one bad study does not abort the batch).
+    """
+    if not request.reports:
+        raise HTTPException(status_code=400, detail="No reports requested")
+    if len(request.reports) > MAX_BATCH_REPORTS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_REPORTS} reports per batch")
+
+    # One threshold snapshot and knowledge lookup table for the whole batch
+    thresholds = threshold_engine.current
+    resolve = lru_cache(maxsize=None)(knowledge_base.resolve)
+    known_patients = {}
+
+    async def report_lines():
+        for index, item in enumerate(request.reports):
+            line = {"index": index, "patient_id": item.patient_id.upper().strip(), "study_id": item.study_id}
+            try:
+                line.update(await run_in_threadpool(report_for_request, item, thresholds, resolve, known_patients))
+            except HTTPException as e:
+                line.update(error=e.detail, status_code=e.status_code)
+            except Exception as e:
+                logger.error(f"❌ Batch report {index} failed: {e}")
+                line.update(error=str(e), status_code=500)
+            yield json.dumps(line) + "\n"
+
+    return StreamingResponse(report_lines(), media_type="application/x-ndjson")
+
+@router.get("/metrics/reports")
+async def report_metrics():
+    """Report cache entries, hits and misses"""
+    return report_cache.stats()
+
+@router.get("/pathologies")
+async def list_pathologies(if_none_match: Optional[str] = Header(None)):
+    """Get list of all supported pathologies"""
+    return knowledge_response("pathologies", if_none_match)
+
+
+@router.get("/diseases")
+async def get_diseases(if_none_match: Optional[str] = Header(None)):
+    return knowledge_response("diseases", if_none_match)
+
+# ==================== PRIOR STUDIES ====================
+def study_comparison(patient_id, probabilities, cam_summary, before):
+    """Compare a study with the patient's most recent priors (stored vectors only, no model work)"""
+    priors = clinical_store.prior_studies(patient_id, before, limit=PRIOR_STUDIES_COMPARED)
+    return compare_with_priors(
+        DEFAULT_PATHOLOGIES, probabilities, priors, cam_summary,
+        positive_threshold=threshold_engine.current.positive, current_time=before
+    )
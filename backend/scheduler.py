@@ -0,0 +1,261 @@
+# backend/scheduler.py
+"""
+Priority scheduler for inference work
+
+Each analysis is a generator that performs one stage of model work per
+next() call. The dispatcher always runs the next stage of the most urgent
+task, so low-priority work is preempted at stage boundaries, and a task
+can be promoted (e.g. after a critical pre-screen) while it is in flight.
+Within a priority class, tasks are ordered by weighted fair queueing: each
+tenant's tasks get virtual finish times spaced 1/weight apart, so a client
+with a deep backlog interleaves with others instead of running ahead of them.
+"""
+
+import time
+import heapq
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Lower value runs first
+PRIORITY_CLASSES = {"critical": 0, "urgent": 1, "routine": 2, "batch": 3}
+PRIORITY_ALIASES = {"er": "critical", "stat": "critical", "emergency": "critical"}
+
+# How far a new task's first (pre-screen) stage moves up within its own class: ahead of work of that
+# class already in flight, never ahead of a more urgent class. Batch work gets no boost, so a flood of
+# batch submissions cannot delay anything else.
+PRESCREEN_BOOST = {"critical": 0.0, "urgent": 0.5, "routine": 0.5, "batch": 0.0}
+
+# Tenant of work submitted without one
+DEFAULT_TENANT = "anonymous"
+# Finish-time entries kept for idle tenants before the caught-up ones are dropped
+MAX_TENANTS = 1024
+
+
+def resolve_priority(value, default="routine"):
+    """Normalize a client-supplied priority name; raises ValueError if unknown"""
+    if not value:
+        return default
+    name = value.strip().lower()
+    name = PRIORITY_ALIASES.get(name, name)
+    if name not in PRIORITY_CLASSES:
+        raise ValueError(f"priority must be one of {list(PRIORITY_CLASSES) + list(PRIORITY_ALIASES)}")
+    return name
+
+
+class ScheduledTask:
+    __slots__ = ("stages", "priority", "submitted_class", "key", "seq", "tenant", "finish", "future", "on_event",
+                 "submitted_at", "enqueued_at", "started_at", "waited", "steps")
+
+    def __init__(self, stages, priority, seq, future, on_event, prescreen, tenant=DEFAULT_TENANT, finish=0.0):
+        self.stages = stages
+        self.priority = priority
+        self.submitted_class = priority
+        base = PRIORITY_CLASSES[priority]
+        self.key = base - PRESCREEN_BOOST[priority] if prescreen else base
+        self.seq = seq
+        self.tenant = tenant
+        self.finish = finish
+        self.future = future
+        self.on_event = on_event
+        self.submitted_at = self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.waited = 0.0
+        self.steps = 0
+
+    def __lt__(self, other):
+        return (self.key, self.finish, self.seq) < (other.key, other.finish, other.seq)
+
+
+class WaitStats:
+    """Rolling queue-wait samples for one priority class"""
+
+    def __init__(self, window):
+        self.first_stage = deque(maxlen=window)
+        self.total = deque(maxlen=window)
+        self.completed = 0
+
+    def summary(self):
+        def describe(samples):
+            if not samples:
+                return {"count": 0, "mean": None, "p50": None, "p95": None, "max": None}
+            ordered = sorted(samples)
+            return {
+                "count": len(ordered),
+                "mean": sum(ordered) / len(ordered),
+                "p50": ordered[len(ordered) // 2],
+                "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                "max": ordered[-1]
+            }
+        return {
+            "completed": self.completed,
+            "wait_before_start_s": describe(self.first_stage),
+            "total_queue_wait_s": describe(self.total)
+        }
+
+
+class InferenceScheduler:
+    """Runs task stages one at a time on a dedicated model thread, most urgent first"""
+
+    def __init__(self, lock=None, window=1000):
+        self.lock = lock or threading.Lock()
+        self._heap = []
+        self._seq = 0
+        self._ready = None
+        self._dispatcher = None
+        self._executor = None
+        self._current = None
+        self.promotions = 0
+        self.preemptions = 0
+        self.virtual_time = 0.0
+        self._last_finish = {}   # tenant -> virtual finish time of its latest task
+        self.dispatched = {}     # tenant -> tasks started
+        self.wait_stats = {name: WaitStats(window) for name in PRIORITY_CLASSES}
+
+    async def start(self):
+        self._ready = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def stop(self):
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+        if self._executor:
+            self._executor.shutdown(wait=False)
+
+    def submit(self, stages, priority="routine", on_event=None, prescreen=True, tenant=None, weight=1.0):
+        """Queue a stage generator; returns a future resolving to its return value
+
+        `tenant` tasks with `weight` w are spaced 1/w apart in virtual time, so
+        tenants with queued work share the model thread in proportion to weight.
+        """
+        if self._dispatcher is None:
+            raise RuntimeError("Inference scheduler is not running")
+        tenant = tenant or DEFAULT_TENANT
+        self._seq += 1
+        finish = max(self.virtual_time, self._last_finish.get(tenant, 0.0)) + 1.0 / weight
+        self._last_finish[tenant] = finish
+        if len(self._last_finish) > MAX_TENANTS:
+            # Tenants at or behind virtual time would start from it anyway
+            self._last_finish = {t: f for t, f in self._last_finish.items() if f > self.virtual_time}
+        future = asyncio.get_running_loop().create_future()
+        task = ScheduledTask(stages, priority, self._seq, future, on_event, prescreen, tenant, finish)
+        self._push(task)
+        return future
+
+    def depth(self):
+        depths = {name: 0 for name in PRIORITY_CLASSES}
+        for task in self._heap:
+            depths[task.priority] += 1
+        return depths
+
+    def tenant_depth(self):
+        depths = {}
+        for task in self._heap:
+            depths[task.tenant] = depths.get(task.tenant, 0) + 1
+        return depths
+
+    def busy(self):
+        """True while any task is queued or running"""
+        return bool(self._heap) or self._current is not None
+
+    def stats(self):
+        return {
+            "queue_depth": self.depth(),
+            "running": self._current.priority if self._current else None,
+            "promotions": self.promotions,
+            "preemptions": self.preemptions,
+            "fair_share": {
+                "virtual_time": self.virtual_time,
+                "queue_depth": self.tenant_depth(),
+                "started": dict(sorted(self.dispatched.items(), key=lambda kv: -kv[1])[:20])
+            },
+            "by_priority": {name: stats.summary() for name, stats in self.wait_stats.items()}
+        }
+
+    def _push(self, task):
+        task.enqueued_at = time.monotonic()
+        heapq.heappush(self._heap, task)
+        self._ready.set()
+
+    def _promote(self, task, priority):
+        if PRIORITY_CLASSES[priority] < PRIORITY_CLASSES[task.priority]:
+            logger.info(f"⏫ Promoting task {task.seq} from {task.priority} to {priority}")
+            task.priority = priority
+            self.promotions += 1
+
+    def _step(self, task):
+        """Run one stage on the model thread: (done, event-or-result)"""
+        with self.lock:
+            try:
+                return False, next(task.stages)
+            except StopIteration as stop:
+                return True, stop.value
+
+    def _close(self, task):
+        with self.lock:
+            task.stages.close()
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        previous = None
+        while True:
+            if not self._heap:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+
+            task = heapq.heappop(self._heap)
+            if task.future.done():
+                # Caller went away (e.g. client disconnected): release the task's resources
+                await loop.run_in_executor(self._executor, self._close, task)
+                continue
+
+            now = time.monotonic()
+            task.waited += now - task.enqueued_at
+            if task.started_at is None:
+                task.started_at = now
+                # Virtual time advances to the finish tag of each task as it starts
+                self.virtual_time = max(self.virtual_time, task.finish)
+                self.dispatched[task.tenant] = self.dispatched.get(task.tenant, 0) + 1
+                if len(self.dispatched) > MAX_TENANTS:
+                    self.dispatched = dict(sorted(self.dispatched.items(), key=lambda kv: -kv[1])[:MAX_TENANTS // 2])
+                self.wait_stats[task.submitted_class].first_stage.append(now - task.submitted_at)
+            if previous is not None and previous is not task and not previous.future.done() and previous.key > task.key:
+                self.preemptions += 1
+
+            self._current = task
+            try:
+                done, value = await loop.run_in_executor(self._executor, self._step, task)
+            except Exception as e:
+                if not task.future.done():
+                    task.future.set_exception(e)
+                continue
+            finally:
+                self._current = None
+            task.steps += 1
+            previous = task
+
+            if done:
+                stats = self.wait_stats[task.submitted_class]
+                stats.total.append(task.waited)
+                stats.completed += 1
+                if not task.future.done():
+                    task.future.set_result(value)
+                continue
+
+            if isinstance(value, dict) and value.get("promote_to"):
+                self._promote(task, value["promote_to"])
+            if task.on_event:
+                try:
+                    task.on_event(value)
+                except Exception as e:
+                    logger.warning(f"Task event handler failed: {e}")
+
+            task.key = PRIORITY_CLASSES[task.priority]
+            self._push(task)
@@ -0,0 +1,247 @@
+# backend/shadow.py
+"""
+Shadow evaluation
+A sampled share of live analyses is mirrored (the already-preprocessed
+input tensor plus the production ensemble's probabilities) to a candidate
+model version. The candidate runs on its own low-priority thread and only
+while the inference scheduler is idle: mirrored inputs that do not fit the
+bounded queue, that wait too long for an idle moment, or that are overtaken
+by production work between members are dropped, never delayed. Per-pathology
+disagreement with production is kept in a fixed-size rolling window.
+"""
+
+import os
+import time
+import queue
+import asyncio
+import random
+import logging
+import threading
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+logger = logging.getLogger(__name__)
+
+# Registry version to shadow from startup (empty: none until set via the admin API)
+SHADOW_VERSION = os.environ.get("RAD_ETHIX_SHADOW_VERSION", "")
+SHADOW_SAMPLE_RATE = float(os.environ.get("RAD_ETHIX_SHADOW_SAMPLE_RATE", "0.1"))
+SHADOW_QUEUE_SIZE = int(os.environ.get("RAD_ETHIX_SHADOW_QUEUE_SIZE", "4"))
+SHADOW_WINDOW = int(os.environ.get("RAD_ETHIX_SHADOW_WINDOW", "2000"))
+# Mirrored inputs waiting longer than this for the scheduler to go idle are dropped
+SHADOW_MAX_WAIT_SECONDS = float(os.environ.get("RAD_ETHIX_SHADOW_MAX_WAIT_SECONDS", "30"))
+IDLE_POLL_SECONDS = 0.02
+
+
+class DisagreementStore:
+    """Rolling window of candidate-vs-production differences, one row per shadowed study
+
+    Rows are float16 probabilities in preallocated ring buffers, so the store
+    stays a few hundred kilobytes however long shadowing runs. Both sides are
+    raw (uncalibrated) ensemble probabilities; decision flips use the
+    production positive-finding thresholds.
+    """
+
+    def __init__(self, pathologies, window=SHADOW_WINDOW):
+        self.pathologies = list(pathologies)
+        self.window = window
+        self.candidate = np.zeros((window, len(self.pathologies)), dtype=np.float16)
+        self.production = np.zeros((window, len(self.pathologies)), dtype=np.float16)
+        self.positive = np.zeros((window, len(self.pathologies)), dtype=np.float16)
+        self.latency = np.zeros(window, dtype=np.float32)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def add(self, candidate, production, positive, latency):
+        with self._lock:
+            row = self.count % self.window
+            self.candidate[row] = candidate
+            self.production[row] = production
+            self.positive[row] = positive
+            self.latency[row] = latency
+            self.count += 1
+
+    def summary(self):
+        with self._lock:
+            n = min(self.count, self.window)
+            candidate = self.candidate[:n].astype(np.float32)
+            production = self.production[:n].astype(np.float32)
+            positive = self.positive[:n].astype(np.float32)
+            latency = self.latency[:n].copy()
+        if n == 0:
+            return {"samples": 0, "total_samples": self.count, "pathologies": {}}
+
+        diff = np.abs(candidate - production)
+        candidate_positive = candidate > positive
+        production_positive = production > positive
+        flips = candidate_positive != production_positive
+        per_pathology = {
+            name: {
+                "mean_abs_diff": round(float(diff[:, j].mean()), 4),
+                "p95_abs_diff": round(float(np.percentile(diff[:, j], 95)), 4),
+                "mean_diff": round(float((candidate[:, j] - production[:, j]).mean()), 4),
+                "decision_flip_rate": round(float(flips[:, j].mean()), 4),
+                "candidate_positive_rate": round(float(candidate_positive[:, j].mean()), 4),
+                "production_positive_rate": round(float(production_positive[:, j].mean()), 4)
+            }
+            for j, name in enumerate(self.pathologies)
+        }
+        return {
+            "samples": n,
+            "total_samples": self.count,
+            "mean_abs_diff": round(float(diff.mean()), 4),
+            "studies_with_flip": round(float(flips.any(axis=1).mean()), 4),
+            "top_disagreement": [
+                name for name, _ in sorted(per_pathology.items(), key=lambda kv: -kv[1]["decision_flip_rate"])[:5]
+            ],
+            "candidate_latency_ms": {
+                "mean": round(float(latency.mean() * 1000), 2),
+                "p95": round(float(np.percentile(latency, 95) * 1000), 2)
+            },
+            "pathologies": per_pathology
+        }
+
+
+class ShadowEvaluator:
+    """Mirrors sampled analyses to a candidate ensemble on a background thread
+
+    `is_busy()` reports whether production inference is queued or running;
+    shadow work only starts, and only continues past each member, while it
+    returns False.
+    """
+
+    def __init__(self, pathologies, is_busy, sample_rate=SHADOW_SAMPLE_RATE, queue_size=SHADOW_QUEUE_SIZE,
+                 window=SHADOW_WINDOW, max_wait=SHADOW_MAX_WAIT_SECONDS):
+        self.pathologies = list(pathologies)
+        self.is_busy = is_busy
+        self.sample_rate = sample_rate
+        self.max_wait = max_wait
+        self.window = window
+        self.candidate = None
+        self.loading = None
+        self.last_error = None
+        self.store = DisagreementStore(self.pathologies, window)
+        self.dropped = {"queue_full": 0, "busy": 0, "preempted": 0, "error": 0}
+        self.offered = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+
+    def set_candidate(self, ensemble):
+        """Shadow `ensemble` from now on (None stops shadowing); starts a fresh window"""
+        self.candidate = ensemble
+        self.store = DisagreementStore(self.pathologies, self.window)
+        self.dropped = {key: 0 for key in self.dropped}
+        self.offered = 0
+        if ensemble is not None and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="shadow", daemon=True)
+            self._thread.start()
+
+    async def load(self, spec, build):
+        """Build and warm up a registry version in the background, then start shadowing it"""
+        from model_registry import warm_up
+
+        loop = asyncio.get_running_loop()
+        self.loading = {"tag": spec.tag, "started_at": time.time()}
+        try:
+            logger.info(f"📦 Loading shadow candidate {spec.tag}...")
+            ensemble = await loop.run_in_executor(None, build, spec)
+            await loop.run_in_executor(None, warm_up, ensemble)
+        except Exception as e:
+            logger.error(f"❌ Shadow candidate {spec.tag} failed to load: {e}")
+            self.last_error = {"tag": spec.tag, "error": str(e), "at": time.time()}
+            return
+        finally:
+            self.loading = None
+        self.set_candidate(ensemble)
+        logger.info(f"👥 Shadowing {spec.tag} on {self.sample_rate:.0%} of analyses")
+
+    def should_sample(self):
+        return self.candidate is not None and self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def offer(self, img_tensor, production_probs, positive_thresholds):
+        """Queue a copy of one analysis input for the candidate; False if it was dropped"""
+        candidate = self.candidate
+        if candidate is None:
+            return False
+        self.offered += 1
+        if self._queue.full():
+            self.dropped["queue_full"] += 1
+            return False
+        # A small CPU copy at the candidate's input size, so a queued item never pins a pooled buffer
+        with torch.no_grad():
+            size = candidate.input_size
+            tensor = img_tensor[:1].detach()
+            if tensor.shape[-1] != size or tensor.shape[-2] != size:
+                tensor = F.interpolate(tensor, size=(size, size), mode="bilinear", align_corners=False)
+            tensor = tensor.to("cpu", copy=True)
+        item = (candidate, tensor, np.asarray(production_probs, dtype=np.float32), np.asarray(positive_thresholds))
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped["queue_full"] += 1
+            return False
+        return True
+
+    def stop(self):
+        """Stop the worker thread after the item it is on, discarding queued ones"""
+        if self._thread is None:
+            return
+        self.candidate = None
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        self._queue.put(None)
+        self._thread.join(timeout=10)
+        self._thread = None
+
+    def _wait_for_idle(self, deadline):
+        while self.is_busy():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(IDLE_POLL_SECONDS)
+        return True
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            candidate, tensor, production, positive = item
+            if candidate is not self.candidate:
+                continue  # candidate replaced while queued
+            if not self._wait_for_idle(time.monotonic() + self.max_wait):
+                self.dropped["busy"] += 1
+                continue
+            try:
+                start = time.perf_counter()
+                member_probs = {}
+                for name in candidate.models:
+                    if self.is_busy():
+                        break
+                    member_probs[name] = candidate.predict_member(name, tensor.to(candidate.device))
+                if len(member_probs) < len(candidate.models):
+                    self.dropped["preempted"] += 1
+                    continue
+                probs = candidate.predict_batch(tensor, precomputed=member_probs)["ensemble_predictions"][0]
+                for capture in candidate.feature_captures.values():
+                    capture.pop()
+                if candidate is self.candidate:
+                    self.store.add(probs, production, positive, time.perf_counter() - start)
+            except Exception as e:
+                self.dropped["error"] += 1
+                logger.warning(f"⚠️ Shadow evaluation failed: {e}")
+
+    def status(self):
+        return {
+            "candidate": self.candidate.version if self.candidate is not None else None,
+            "loading": self.loading,
+            "last_error": self.last_error,
+            "sample_rate": self.sample_rate,
+            "queue": {"depth": self._queue.qsize(), "capacity": self._queue.maxsize},
+            "offered": self.offered,
+            "dropped": dict(self.dropped),
+            "comparison": self.store.summary()
+        }
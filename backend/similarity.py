@@ -0,0 +1,325 @@
+# backend/similarity.py
+"""
+Similar-case retrieval
+Keeps the DenseNet121 penultimate embedding of past studies (pooled from
+the features explain.FeatureCapture takes during the normal forward pass)
+in an IVF-style nearest-neighbour index over memory-mapped files, so new
+studies are appended without a rebuild and queries only scan the few
+inverted lists closest to the query. Rows are allocated through a SQLite
+table next to the files, so several worker processes can share one index.
+"""
+
+import os
+import json
+import array
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ID_BYTES = 32  # study ids are uuid4 hex strings
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rows (
+    row      INTEGER PRIMARY KEY,
+    study_id TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value REAL NOT NULL
+);
+"""
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def spherical_kmeans(vectors, nlist, iterations=10, seed=0):
+    """Unit-norm centroids of `vectors` (rows assumed L2-normalized)"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        empty = ~sums.any(axis=1)
+        # Re-seed empty lists from random vectors so every list stays usable
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = normalize(sums)
+    return centroids
+
+
+class SimilarityIndex:
+    """Cosine-similarity IVF index over float16 vectors stored in memory-mapped files
+
+    Files in `directory`: vectors.f16 (rows x dim), ids.bin (study id per row),
+    lists.i32 (inverted list per row), centroids.npy, and index.sqlite3, which
+    allocates rows to study ids and holds the row count, file capacity and
+    training generation. Every write happens inside a SQLite write
+    transaction, so all uvicorn workers on the host can append to one index;
+    before each read or write a process picks up the rows and retraining
+    committed by the others (one small query when nothing changed).
+    """
+
+    def __init__(self, directory, dim, nprobe=8, min_train=4096, initial_capacity=1024):
+        self.directory = directory
+        self.dim = dim
+        self.nprobe = nprobe
+        self.min_train = min_train
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+
+        self.count = 0
+        self.capacity = 0
+        self.generation = None
+        self.trained_count = 0
+        self.centroids = None
+        self._postings = None
+        self._vectors = self._ids = self._lists = None
+
+        self._conn = sqlite3.connect(self._path("index.sqlite3"), timeout=60.0, check_same_thread=False,
+                                     isolation_level=None)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+        with self._write():
+            meta = self._read_meta()
+            if not meta:
+                meta = self._initialize(initial_capacity)
+            if int(meta["dim"]) != dim:
+                raise ValueError(f"Index at {directory} has dim {int(meta['dim'])}, expected {dim}")
+            self._sync()
+
+    # ==================== STORAGE ====================
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    @contextmanager
+    def _write(self):
+        """Write transaction holding the index's write lock across processes"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _read_meta(self):
+        return {key: value for key, value in self._conn.execute("SELECT key, value FROM meta")}
+
+    def _set_meta(self, **values):
+        self._conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", values.items())
+
+    def _initialize(self, initial_capacity):
+        """Meta for a new index, adopting rows of one written before rows were allocated in SQLite"""
+        legacy = {}
+        if os.path.exists(self._path("meta.json")):
+            with open(self._path("meta.json")) as f:
+                legacy = json.load(f)
+        meta = {
+            "dim": legacy.get("dim", self.dim),
+            "count": legacy.get("count", 0),
+            "capacity": legacy.get("capacity", initial_capacity),
+            "generation": 1 if os.path.exists(self._path("centroids.npy")) else 0,
+            "trained_count": legacy.get("trained_count", 0)
+        }
+        if meta["count"] and meta["dim"] == self.dim:
+            self._open(int(meta["capacity"]))
+            ids = [self._ids[row].decode() for row in range(int(meta["count"]))]
+            self._conn.executemany("INSERT OR IGNORE INTO rows (row, study_id) VALUES (?, ?)", enumerate(ids))
+            logger.info(f"🧭 Similarity index: adopted {len(ids)} rows from {self._path('meta.json')}")
+        self._set_meta(**meta)
+        return meta
+
+    def _open(self, capacity):
+        """(Re)map the row files, extending them to `capacity` rows"""
+        layout = (("vectors.f16", np.float16, (capacity, self.dim)),
+                  ("ids.bin", f"S{ID_BYTES}", (capacity,)),
+                  ("lists.i32", np.int32, (capacity,)))
+        maps = []
+        for name, dtype, shape in layout:
+            path = self._path(name)
+            size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            with open(path, "ab") as f:
+                if f.tell() < size:
+                    f.truncate(size)
+            maps.append(np.memmap(path, dtype=dtype, mode="r+", shape=shape))
+        self._vectors, self._ids, self._lists = maps
+        self.capacity = capacity
+
+    def _sync(self):
+        """Catch up with rows, file growth and retraining committed by any process (lock held)"""
+        meta = self._read_meta()
+        count, capacity, generation = int(meta["count"]), int(meta["capacity"]), int(meta["generation"])
+        if capacity > self.capacity:
+            self._open(capacity)
+        if generation != self.generation:
+            centroids_path = self._path("centroids.npy")
+            self.centroids = np.load(centroids_path) if generation and os.path.exists(centroids_path) else None
+            self.generation = generation
+            self.trained_count = int(meta["trained_count"])
+            self.count = count
+            self._build_postings()
+        elif count > self.count:
+            if self._postings is not None:
+                for row, cluster in zip(range(self.count, count), np.asarray(self._lists[self.count:count])):
+                    self._postings[cluster].append(row)
+            self.count = count
+
+    def _build_postings(self):
+        """Inverted lists (row numbers per centroid) from the per-row list assignments"""
+        self._postings = None
+        if self.centroids is None:
+            return
+        assignments = np.asarray(self._lists[:self.count])
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.searchsorted(assignments[order], np.arange(len(self.centroids) + 1))
+        self._postings = [array.array("i", order[bounds[c]:bounds[c + 1]].astype(np.int32).tobytes())
+                          for c in range(len(self.centroids))]
+
+    def flush(self):
+        with self._lock:
+            for m in (self._vectors, self._ids, self._lists):
+                m.flush()
+
+    # ==================== WRITES ====================
+    def _indexed(self, study_ids):
+        """The subset of `study_ids` that already have rows"""
+        found = set()
+        study_ids = list(study_ids)
+        for start in range(0, len(study_ids), 500):
+            chunk = study_ids[start:start + 500]
+            found.update(row[0] for row in self._conn.execute(
+                f"SELECT study_id FROM rows WHERE study_id IN ({','.join('?' * len(chunk))})", chunk
+            ))
+        return found
+
+    def _append(self, study_ids, vectors):
+        """Write rows for new studies after the last committed row (inside _write, after _sync)"""
+        start, stop = self.count, self.count + len(study_ids)
+        # Rows first: a duplicate id fails here, before any file or in-memory state changes
+        self._conn.executemany("INSERT INTO rows (row, study_id) VALUES (?, ?)", zip(range(start, stop), study_ids))
+        if stop > self.capacity:
+            capacity = self.capacity
+            while capacity < stop:
+                capacity *= 2
+            self.flush()
+            self._open(capacity)
+
+        self._vectors[start:stop] = vectors
+        self._ids[start:stop] = np.array([study_id.encode() for study_id in study_ids], dtype=f"S{ID_BYTES}")
+        if self.centroids is not None:
+            clusters = np.argmax(vectors @ self.centroids.T, axis=1)
+            self._lists[start:stop] = clusters
+            for row, cluster in zip(range(start, stop), clusters):
+                self._postings[cluster].append(row)
+        self._set_meta(count=stop, capacity=self.capacity)
+        self.count = stop
+
+    def add(self, study_id, vector):
+        """Append (or ignore an already indexed) study embedding"""
+        self.add_batch([study_id], vector)
+
+    def add_batch(self, study_ids, vectors):
+        """Append many embeddings at once (bulk loading); already indexed ids are skipped"""
+        vectors = normalize(vectors).reshape(-1, self.dim)
+        with self._write():
+            self._sync()
+            existing = self._indexed(study_ids)
+            keep = {}
+            for i, study_id in enumerate(study_ids):
+                if study_id not in existing:
+                    keep.setdefault(study_id, i)
+            if not keep:
+                return
+            self._append(list(keep), vectors[list(keep.values())])
+
+        if self.centroids is None and self.count >= self.min_train:
+            self.train(untrained_only=True)
+
+    def train(self, nlist=None, sample=65536, seed=0, untrained_only=False):
+        """(Re)cluster the stored vectors and reassign every row to its nearest list"""
+        with self._write():
+            self._sync()
+            if self.count < 2 or (untrained_only and self.centroids is not None):
+                return
+            rng = np.random.default_rng(seed)
+            rows = np.sort(rng.choice(self.count, min(sample, self.count), replace=False))
+            training = np.asarray(self._vectors[rows], dtype=np.float32)
+            nlist = nlist or int(np.clip(4 * np.sqrt(self.count), 16, 4096))
+            nlist = min(nlist, len(training))
+            centroids = spherical_kmeans(training, nlist, seed=seed)
+
+            chunk = 65536
+            for start in range(0, self.count, chunk):
+                block = np.asarray(self._vectors[start:start + chunk], dtype=np.float32)
+                self._lists[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+
+            tmp = self._path("centroids.tmp.npy")
+            np.save(tmp, centroids)
+            os.replace(tmp, self._path("centroids.npy"))
+            self.flush()
+            self.centroids = centroids
+            self.generation += 1
+            self.trained_count = self.count
+            self._set_meta(generation=self.generation, trained_count=self.count)
+            self._build_postings()
+            logger.info(f"🧭 Similarity index trained: {self.count} vectors in {nlist} lists")
+
+    # ==================== QUERIES ====================
+    def vector(self, study_id):
+        with self._lock:
+            self._sync()
+            row = self._conn.execute("SELECT row FROM rows WHERE study_id = ?", (study_id,)).fetchone()
+            return None if row is None else np.asarray(self._vectors[row[0]], dtype=np.float32)
+
+    def search(self, vector, k=5, exclude=(), nprobe=None):
+        """The k most similar studies as [(study_id, cosine similarity)], best first"""
+        query = normalize(vector).reshape(self.dim)
+        with self._lock:
+            self._sync()
+            if self.count == 0:
+                return []
+            if self.centroids is None:
+                rows = np.arange(self.count)
+            else:
+                probe = min(nprobe or self.nprobe, len(self.centroids))
+                nearest = np.argpartition(-(self.centroids @ query), probe - 1)[:probe]
+                rows = np.sort(np.concatenate([np.frombuffer(self._postings[c], dtype=np.int32) for c in nearest]))
+            if rows.size == 0:
+                return []
+
+            scores = np.asarray(self._vectors[rows], dtype=np.float32) @ query
+            wanted = min(k + len(exclude), rows.size)
+            top = np.argpartition(-scores, wanted - 1)[:wanted]
+            top = top[np.argsort(-scores[top])]
+            results = []
+            for i in top:
+                study_id = self._ids[rows[i]].decode()
+                if study_id not in exclude:
+                    results.append((study_id, float(scores[i])))
+            return results[:k]
+
+    def status(self):
+        with self._lock:
+            self._sync()
+        return {
+            "count": self.count,
+            "capacity": self.capacity,
+            "dim": self.dim,
+            "trained": self.centroids is not None,
+            "lists": 0 if self.centroids is None else len(self.centroids),
+            "nprobe": self.nprobe,
+            "trained_count": self.trained_count,
+            "generation": self.generation
+        }
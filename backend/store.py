@@ -0,0 +1,257 @@
+# backend/store.py
+"""
+Persistent clinical store
+Patients, studies, predictions and reports in SQLite (WAL mode) behind a
+small connection pool. Shared by every uvicorn worker on the host, with
+patient IDs allocated atomically from a sequence row.
+"""
+
+import os
+import json
+import time
+import uuid
+import queue
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.environ.get("RAD_ETHIX_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "runtime"))
+DEFAULT_DB_PATH = os.path.join(DATA_DIR, "clinical.sqlite3")
+
+PATIENT_ID_PREFIX = "PES1UG24CS"
+# The demo patient is PES1UG24CS053; registrations continue from 055 as before
+PATIENT_SEQUENCE_START = 54
+
+SEED_PATIENTS = [
+    {"patient_id": "PES1UG24CS053", "name": "Amogh", "age": 19, "gender": "Male"},
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sequences (
+    name  TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS patients (
+    patient_id TEXT PRIMARY KEY,
+    name       TEXT NOT NULL,
+    age        INTEGER NOT NULL,
+    gender     TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS studies (
+    study_id   TEXT PRIMARY KEY,
+    patient_id TEXT NOT NULL REFERENCES patients (patient_id),
+    filename   TEXT,
+    sha256     TEXT,
+    priority   TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_studies_patient_created ON studies (patient_id, created_at);
+CREATE TABLE IF NOT EXISTS predictions (
+    study_id           TEXT PRIMARY KEY REFERENCES studies (study_id),
+    model_version      TEXT,
+    probabilities      TEXT NOT NULL,
+    findings           TEXT,
+    overall_confidence REAL
+);
+CREATE TABLE IF NOT EXISTS study_cams (
+    study_id TEXT PRIMARY KEY REFERENCES studies (study_id),
+    summary  TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS reports (
+    report_id  INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_id TEXT NOT NULL,
+    study_id   TEXT,
+    kind       TEXT NOT NULL,
+    content    TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_reports_patient_created ON reports (patient_id, created_at);
+"""
+
+# Statements are module constants so each pooled connection's statement cache
+# keeps them prepared after first use
+SQL_GET_PATIENT = "SELECT patient_id, name, age, gender FROM patients WHERE patient_id = ?"
+SQL_NEXT_ID = "UPDATE sequences SET value = value + 1 WHERE name = ? RETURNING value"
+SQL_INSERT_PATIENT = "INSERT INTO patients (patient_id, name, age, gender, created_at) VALUES (?, ?, ?, ?, ?)"
+SQL_INSERT_STUDY = (
+    "INSERT INTO studies (study_id, patient_id, filename, sha256, priority, created_at) VALUES (?, ?, ?, ?, ?, ?)"
+)
+SQL_INSERT_PREDICTION = (
+    "INSERT OR REPLACE INTO predictions (study_id, model_version, probabilities, findings, overall_confidence) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+SQL_INSERT_CAM = "INSERT OR REPLACE INTO study_cams (study_id, summary) VALUES (?, ?)"
+SQL_INSERT_REPORT = "INSERT INTO reports (patient_id, study_id, kind, content, created_at) VALUES (?, ?, ?, ?, ?)"
+SQL_STUDY_HISTORY = (
+    "SELECT s.study_id, s.filename, s.sha256, s.priority, s.created_at, "
+    "p.model_version, p.probabilities, p.findings, p.overall_confidence "
+    "FROM studies s LEFT JOIN predictions p ON p.study_id = s.study_id "
+    "WHERE s.patient_id = ? AND s.created_at < ? ORDER BY s.created_at DESC LIMIT ?"
+)
+# Served by idx_studies_patient_created: a single index seek, then `limit` rows
+SQL_PRIOR_STUDIES = (
+    "SELECT s.study_id, s.created_at, p.probabilities, c.summary AS cam_summary "
+    "FROM studies s JOIN predictions p ON p.study_id = s.study_id "
+    "LEFT JOIN study_cams c ON c.study_id = s.study_id "
+    "WHERE s.patient_id = ? AND s.created_at < ? ORDER BY s.created_at DESC LIMIT ?"
+)
+SQL_GET_STUDY = (
+    "SELECT s.study_id, s.patient_id, s.filename, s.created_at, p.probabilities, p.findings, c.summary AS cam_summary "
+    "FROM studies s LEFT JOIN predictions p ON p.study_id = s.study_id "
+    "LEFT JOIN study_cams c ON c.study_id = s.study_id WHERE s.study_id = ?"
+)
+
+
+class ClinicalStore:
+    """SQLite-backed patients, studies, predictions and reports"""
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, pool_size=8):
+        self.db_path = db_path
+        self.pool_size = pool_size
+        self._pool = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+            conn.execute("INSERT OR IGNORE INTO sequences (name, value) VALUES ('patient', ?)", (PATIENT_SEQUENCE_START,))
+            conn.executemany(
+                "INSERT OR IGNORE INTO patients (patient_id, name, age, gender, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(p["patient_id"], p["name"], p["age"], p["gender"], time.time()) for p in SEED_PATIENTS]
+            )
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_path, timeout=30.0, check_same_thread=False, isolation_level=None, cached_statements=64
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        """Borrow a pooled connection, opening a new one while the pool is below pool_size"""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.pool_size
+                if create:
+                    self._created += 1
+            conn = self._connect() if create else self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction that takes the database write lock up front"""
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+        self._created = 0
+
+    # ==================== PATIENTS ====================
+    def get_patient(self, patient_id):
+        with self._connection() as conn:
+            row = conn.execute(SQL_GET_PATIENT, (patient_id,)).fetchone()
+        return dict(row) if row else None
+
+    def create_patient(self, name, age, gender):
+        """Register a patient under the next ID from the shared sequence"""
+        with self._transaction() as conn:
+            value = conn.execute(SQL_NEXT_ID, ("patient",)).fetchone()[0]
+            patient_id = f"{PATIENT_ID_PREFIX}{str(value).zfill(3)}"
+            conn.execute(SQL_INSERT_PATIENT, (patient_id, name, age, gender, time.time()))
+        return {"patient_id": patient_id, "name": name, "age": age, "gender": gender}
+
+    # ==================== STUDIES ====================
+    def record_study(self, patient_id, filename, sha256, probabilities, findings=None, overall_confidence=None,
+                     model_version=None, priority=None, study_id=None, created_at=None, cam_summary=None):
+        """Store a study, its prediction vector and CAM summary in one transaction; returns the study id"""
+        study_id = study_id or uuid.uuid4().hex
+        with self._transaction() as conn:
+            conn.execute(SQL_INSERT_STUDY, (
+                study_id, patient_id, filename, sha256, priority, created_at or time.time()
+            ))
+            conn.execute(SQL_INSERT_PREDICTION, (
+                study_id, model_version, json.dumps([float(p) for p in probabilities]),
+                json.dumps(findings) if findings is not None else None, overall_confidence
+            ))
+            if cam_summary is not None:
+                conn.execute(SQL_INSERT_CAM, (study_id, json.dumps(cam_summary)))
+        return study_id
+
+    def get_study(self, study_id):
+        """A study with its probability vector and CAM summary, or None"""
+        with self._connection() as conn:
+            row = conn.execute(SQL_GET_STUDY, (study_id,)).fetchone()
+        return _decode_study(row) if row else None
+
+    def prior_studies(self, patient_id, before, limit=3):
+        """The `limit` most recent studies before a timestamp (newest first), for comparison"""
+        with self._connection() as conn:
+            rows = conn.execute(SQL_PRIOR_STUDIES, (patient_id, before, limit)).fetchall()
+        return [_decode_study(row) for row in rows]
+
+    def study_history(self, patient_id, limit=20, before=None):
+        """Most recent studies of a patient (newest first), with their predictions"""
+        with self._connection() as conn:
+            rows = conn.execute(SQL_STUDY_HISTORY, (patient_id, before or float("inf"), limit)).fetchall()
+        history = []
+        for row in rows:
+            study = dict(row)
+            study["probabilities"] = json.loads(study["probabilities"]) if study["probabilities"] else None
+            study["findings"] = json.loads(study["findings"]) if study["findings"] else []
+            history.append(study)
+        return history
+
+    # ==================== REPORTS ====================
+    def record_report(self, patient_id, content, kind="professional", study_id=None):
+        with self._transaction() as conn:
+            cursor = conn.execute(SQL_INSERT_REPORT, (patient_id, study_id, kind, content, time.time()))
+        return cursor.lastrowid
+
+
+def _decode_study(row):
+    study = dict(row)
+    study["probabilities"] = json.loads(study["probabilities"]) if study["probabilities"] else None
+    study["cam_summary"] = json.loads(study["cam_summary"]) if study["cam_summary"] else None
+    if "findings" in study:
+        study["findings"] = json.loads(study["findings"]) if study["findings"] else []
+    return study
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def get_store():
+    """Process-wide store at RAD_ETHIX_DATA_DIR/clinical.sqlite3, opened on first use"""
+    global _default_store
+    if _default_store is None:
+        with _default_lock:
+            if _default_store is None:
+                _default_store = ClinicalStore()
+                logger.info(f"🗄️ Clinical store ready at {_default_store.db_path}")
+    return _default_store
@@ -0,0 +1,241 @@
+# backend/thresholds.py
+"""
+Decision thresholds, ensemble weights and calibration
+All cut-offs that turn ensemble probabilities into findings, severities and
+review flags, plus the member weights and the calibration table, come from
+one immutable snapshot. The snapshot is rebuilt from JSON files whenever
+they change, so tuning never needs a restart or a model reload.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+import numpy as np
+
+from calibration import load_calibration
+from store import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLDS_PATH = os.environ.get("RAD_ETHIX_THRESHOLDS_PATH", os.path.join(DATA_DIR, "thresholds.json"))
+DEFAULT_CALIBRATION_PATH = os.environ.get("RAD_ETHIX_CALIBRATION_PATH", os.path.join(DATA_DIR, "calibration.json"))
+# Written by `python -m ensemble_weights`; `ensemble_weights` in the thresholds file takes precedence
+DEFAULT_WEIGHTS_PATH = os.environ.get("RAD_ETHIX_ENSEMBLE_WEIGHTS_PATH", os.path.join(DATA_DIR, "ensemble_weights.json"))
+
+# How often the engine checks the files for changes
+RELOAD_INTERVAL_SECONDS = float(os.environ.get("RAD_ETHIX_THRESHOLDS_RELOAD_SECONDS", "5"))
+
+# Per-pathology cut-offs: a number, or {"default": number, "<pathology>": number, ...}
+PER_PATHOLOGY_DEFAULTS = {
+    "positive": 0.3,          # reported as a finding above this
+    "high_confidence": 0.7,   # non-critical findings graded High
+    "moderate": 0.5,          # non-critical findings graded Moderate
+    "critical": 0.5,          # critical pathologies graded Critical
+    "critical_high": 0.35     # critical pathologies graded High
+}
+SCALAR_DEFAULTS = {
+    "doctor_review": 0.6,      # overall confidence below this needs review
+    "prescreen_critical": 0.5  # primary-model score that promotes a study to critical
+}
+DEFAULT_ENSEMBLE_WEIGHTS = {'densenet121': 0.60, 'resnet50': 0.25, 'efficientnet': 0.15}
+
+# What a malformed settings file can raise while being parsed
+INVALID_SETTINGS = (OSError, ValueError, KeyError, TypeError)
+
+
+class ThresholdSet:
+    """Immutable snapshot of thresholds, ensemble weights and calibration
+
+    Per-pathology cut-offs are (pathologies,) arrays aligned with `pathologies`.
+    Ensemble weights map members to scalars or per-pathology arrays and sum to
+    one for every pathology.
+    """
+
+    def __init__(self, pathologies, config=None, calibration=None, version="default", ensemble_weights=None):
+        config = config or {}
+        unknown = set(config) - set(PER_PATHOLOGY_DEFAULTS) - set(SCALAR_DEFAULTS) - {"ensemble_weights"}
+        if unknown:
+            raise ValueError(f"Unknown threshold settings: {sorted(unknown)}")
+
+        self.pathologies = list(pathologies)
+        self._index = {name: i for i, name in enumerate(self.pathologies)}
+        self.defaults = {}
+        for key, default in PER_PATHOLOGY_DEFAULTS.items():
+            setattr(self, key, self._per_pathology(key, config.get(key, default), default))
+        for key, default in SCALAR_DEFAULTS.items():
+            setattr(self, key, float(config.get(key, default)))
+        self.ensemble_weights = self._weights(
+            config.get("ensemble_weights", ensemble_weights or DEFAULT_ENSEMBLE_WEIGHTS)
+        )
+        self.calibration = calibration
+        self.version = version
+
+    def _per_pathology(self, key, value, default):
+        if not isinstance(value, dict):
+            self.defaults[key] = float(value)
+            return np.full(len(self.pathologies), float(value), dtype=np.float32)
+        unknown = set(value) - set(self.pathologies) - {"default"}
+        if unknown:
+            raise ValueError(f"{key}: unknown pathologies {sorted(unknown)}")
+        self.defaults[key] = float(value.get("default", default))
+        vector = np.full(len(self.pathologies), self.defaults[key], dtype=np.float32)
+        for name, v in value.items():
+            if name != "default":
+                vector[self._index[name]] = float(v)
+        return vector
+
+    def _weights(self, weights):
+        members = {}
+        for name, value in weights.items():
+            if isinstance(value, dict):
+                members[name] = self._per_pathology(f"ensemble_weights.{name}", value, 0.0)
+            elif isinstance(value, list):
+                if len(value) != len(self.pathologies):
+                    raise ValueError(f"ensemble_weights.{name}: expected {len(self.pathologies)} values")
+                members[name] = np.asarray(value, dtype=np.float32)
+            else:
+                members[name] = float(value)
+        total = sum(np.asarray(w, dtype=np.float32) for w in members.values())
+        if np.any(total <= 0):
+            raise ValueError("ensemble_weights must be positive for every pathology")
+        if np.ndim(total) == 0:
+            return {name: float(w) / float(total) for name, w in members.items()}
+        return {name: np.asarray(w / total, dtype=np.float32) for name, w in members.items()}
+
+    def calibrate(self, probs):
+        """Calibrated copy of a (..., pathologies) probability array (unchanged without calibration)"""
+        if self.calibration is None:
+            return np.asarray(probs, dtype=np.float32)
+        return self.calibration.apply(probs)
+
+    def positive_for(self, disease):
+        """Positive-finding cut-off of one pathology"""
+        i = self._index.get(disease)
+        return float(self.positive[i]) if i is not None else self.defaults["positive"]
+
+    def member_weight(self, name, index=None):
+        """Weight of one member, for one pathology (or averaged over pathologies)"""
+        weight = self.ensemble_weights.get(name, 0.0)
+        if np.ndim(weight) == 0:
+            return float(weight)
+        return float(weight[index]) if index is not None else float(np.mean(weight))
+
+    def summary(self):
+        """JSON-serializable view for the admin endpoint"""
+        def per_pathology(vector):
+            return {name: round(float(v), 4) for name, v in zip(self.pathologies, vector)}
+        return {
+            "version": self.version,
+            **{key: per_pathology(getattr(self, key)) for key in PER_PATHOLOGY_DEFAULTS},
+            **{key: getattr(self, key) for key in SCALAR_DEFAULTS},
+            "ensemble_weights": {
+                name: w if np.ndim(w) == 0 else per_pathology(w) for name, w in self.ensemble_weights.items()
+            },
+            "calibration": self.calibration.methods if self.calibration is not None else None
+        }
+
+
+class ThresholdEngine:
+    """Current ThresholdSet, rebuilt when the thresholds, calibration or weights file changes
+
+    Readers take `engine.current` once per request and use that snapshot
+    throughout, so a reload never mixes old and new settings in one result.
+    A file that fails to parse is logged and the previous snapshot kept.
+    Ensemble weights come from the thresholds file, else the weights file,
+    else `base_weights` (those of the active model version).
+    """
+
+    def __init__(self, pathologies, thresholds_path=DEFAULT_THRESHOLDS_PATH,
+                 calibration_path=DEFAULT_CALIBRATION_PATH, weights_path=DEFAULT_WEIGHTS_PATH,
+                 reload_interval=RELOAD_INTERVAL_SECONDS, base_weights=None):
+        self.pathologies = list(pathologies)
+        self.base_weights = base_weights
+        self.thresholds_path = thresholds_path
+        self.calibration_path = calibration_path
+        self.weights_path = weights_path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._checked_at = 0.0
+        self._current = ThresholdSet(self.pathologies)
+        try:
+            self.reload()
+        except INVALID_SETTINGS as e:
+            logger.error(f"❌ Invalid threshold settings, using defaults: {e}")
+
+    def _file_stamp(self):
+        stamp = []
+        for path in (self.thresholds_path, self.calibration_path, self.weights_path):
+            try:
+                st = os.stat(path)
+                stamp.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    @property
+    def current(self):
+        self.maybe_reload()
+        return self._current
+
+    def maybe_reload(self):
+        """Reload if the files changed, checking at most every reload_interval seconds"""
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        stamp = self._file_stamp()
+        if stamp != self._stamp:
+            try:
+                self.reload()
+            except INVALID_SETTINGS as e:
+                self._stamp = stamp  # not retried until the files change again
+                logger.error(f"❌ Keeping previous thresholds; reload failed: {e}")
+
+    def set_base_weights(self, weights):
+        """Switch the fallback ensemble weights (on a model swap) and rebuild the snapshot"""
+        self.base_weights = dict(weights)
+        try:
+            self.reload()
+        except INVALID_SETTINGS as e:
+            logger.error(f"❌ Keeping previous thresholds; reload failed: {e}")
+
+    def reload(self):
+        """Build a new snapshot from the files and swap it in; raises on invalid files"""
+        with self._lock:
+            stamp = self._file_stamp()
+            digest = hashlib.sha256()
+            config = None
+            calibration = None
+            ensemble_weights = None
+            if stamp[0] is not None:
+                with open(self.thresholds_path, "rb") as f:
+                    raw = f.read()
+                digest.update(raw)
+                config = json.loads(raw)
+            if stamp[1] is not None:
+                with open(self.calibration_path, "rb") as f:
+                    digest.update(f.read())
+                calibration = load_calibration(self.calibration_path, self.pathologies)
+            if stamp[2] is not None:
+                with open(self.weights_path, "rb") as f:
+                    raw = f.read()
+                digest.update(raw)
+                ensemble_weights = json.loads(raw)["ensemble_weights"]
+            if self.base_weights is not None:
+                digest.update(json.dumps(self.base_weights, sort_keys=True).encode())
+            version = digest.hexdigest()[:12] if any(stamp) or self.base_weights is not None else "default"
+
+            snapshot = ThresholdSet(
+                self.pathologies, config, calibration, version, ensemble_weights or self.base_weights
+            )
+            if snapshot.version != self._current.version:
+                logger.info(f"🎚️ Thresholds {snapshot.version} loaded (calibration: {'on' if calibration else 'off'})")
+            self._current = snapshot
+            self._stamp = stamp
+            self._checked_at = time.monotonic()
+            return snapshot
@@ -0,0 +1,63 @@
+# backend/tta.py
+"""
+Test-time augmentation
+Builds K augmented views of a preprocessed X-ray tensor in one vectorized
+pass (horizontal flip, small shift/scale via a batched affine grid, contrast
+jitter) so each backbone evaluates all views as a single batch
+"""
+
+from functools import lru_cache
+
+import torch
+import torch.nn.functional as F
+
+MAX_TTA_VIEWS = 32
+
+# Fixed seed: the same K always yields the same views, so results stay cacheable
+TTA_SEED = 0
+
+MAX_SHIFT = 0.05            # fraction of the image size
+SCALE_RANGE = (0.95, 1.08)
+CONTRAST_RANGE = (0.9, 1.1)
+
+# torchxrayvision input range
+XRV_MIN, XRV_MAX = -1024.0, 1024.0
+
+
+@lru_cache(maxsize=MAX_TTA_VIEWS)
+def tta_parameters(k, seed=TTA_SEED):
+    """(K, 2, 3) affine matrices and (K,) contrast factors; view 0 is the identity"""
+    if not 1 <= k <= MAX_TTA_VIEWS:
+        raise ValueError(f"tta_views must be between 1 and {MAX_TTA_VIEWS}")
+
+    generator = torch.Generator().manual_seed(seed)
+    flip = torch.ones(k)
+    flip[1::2] = -1.0  # every other view is mirrored
+    shift = (torch.rand(k, 2, generator=generator) * 2 - 1) * MAX_SHIFT * 2  # grid coordinates span [-1, 1]
+    scale = torch.empty(k).uniform_(*SCALE_RANGE, generator=generator)
+    contrast = torch.empty(k).uniform_(*CONTRAST_RANGE, generator=generator)
+
+    flip[0], shift[0], scale[0], contrast[0] = 1.0, 0.0, 1.0, 1.0
+
+    theta = torch.zeros(k, 2, 3)
+    theta[:, 0, 0] = flip / scale
+    theta[:, 1, 1] = 1.0 / scale
+    theta[:, :, 2] = shift
+    return theta, contrast
+
+
+def make_tta_views(img_tensor, k):
+    """Expand a (1, 1, H, W) input into (K, 1, H, W) augmented views without gradients"""
+    theta, contrast = tta_parameters(k)
+    device = img_tensor.device
+    with torch.no_grad():
+        source = img_tensor.detach().expand(k, -1, -1, -1)
+        theta = theta.to(device=device, dtype=source.dtype)
+        grid = F.affine_grid(theta, list(source.shape), align_corners=False)
+        views = F.grid_sample(source, grid, mode="bilinear", padding_mode="border", align_corners=False)
+
+        # Contrast jitter around each view's mean intensity
+        mean = views.mean(dim=(1, 2, 3), keepdim=True)
+        views = (views - mean) * contrast.to(device=device, dtype=views.dtype).view(k, 1, 1, 1) + mean
+        views.clamp_(XRV_MIN, XRV_MAX)
+    return views
@@ -0,0 +1,106 @@
+# backend/uploads.py
+"""
+Streaming upload handling
+Enforces a size cap while the body arrives, hashes uploads incrementally
+and hands the spooled file to the decoder without an in-memory copy
+"""
+
+import hashlib
+import logging
+
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+# Allowance for multipart boundaries and part headers on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadSizeLimitMiddleware:
+    """Rejects oversized request bodies on upload routes before they are fully received"""
+
+    def __init__(self, app, max_bytes, paths=("/predict",)):
+        self.app = app
+        self.max_body_bytes = max_bytes + MULTIPART_OVERHEAD
+        self.max_bytes = max_bytes
+        self.paths = tuple(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_body_bytes:
+            await self._reject(scope, receive, send)
+            return
+
+        # Bodies without Content-Length (chunked) are counted as they arrive. Past the limit the
+        # 413 is sent from here and the app sees a disconnect: an exception raised inside
+        # receive() would be turned into a 400 by the form parser.
+        received = 0
+        response_started = False
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_bytes:
+                    rejected = True
+                    if not response_started:
+                        await self._reject(scope, receive, send)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if rejected:
+                return  # the 413 already went out; drop whatever the app answers to the disconnect
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except Exception:
+            if not rejected:
+                raise
+
+    async def _reject(self, scope, receive, send):
+        limit_mb = self.max_bytes / (1024 * 1024)
+        response = JSONResponse(
+            status_code=413,
+            content={"detail": f"Upload exceeds the {limit_mb:.0f} MB limit"}
+        )
+        await response(scope, receive, send)
+
+
+async def hash_upload(upload, max_bytes, chunk_size=CHUNK_SIZE):
+    """Stream an UploadFile in chunks, enforcing max_bytes; returns (sha256 hex, size)
+
+    The file is rewound afterwards so it can be decoded straight from
+    Starlette's spooled temporary file.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    await upload.seek(0)
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            raise HTTPException(status_code=413, detail=f"Upload exceeds the {max_bytes // (1024 * 1024)} MB limit")
+        digest.update(chunk)
+    await upload.seek(0)
+
+    if size == 0:
+        raise HTTPException(status_code=400, detail="Uploaded file is empty")
+    return digest.hexdigest(), size
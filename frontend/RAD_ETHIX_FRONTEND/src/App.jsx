@@ -294,6 +294,7 @@ function FindingsGrid({ findings }) {
             Severity: {f.severity}
             {f.critical ? " (Critical)" : ""}
           </div>
+          {f.location_description && <div>Location: {f.location_description}</div>}
         </div>
       ))}
     </div>
@@ -332,7 +333,7 @@ function ResultsSection({ results, previewURL, heatmapURL, onContactDoctors }) {
   );
 }
 
-function MedicalReport({ user, findings, onClose }) {
+function MedicalReport({ user, findings, studyId, onClose }) {
   const [report, setReport] = useState(null);
   const [editedReport, setEditedReport] = useState('');
   const [isEditing, setIsEditing] = useState(false);
@@ -358,8 +359,10 @@ function MedicalReport({ user, findings, onClose }) {
             confidence: f.confidence,
             severity: f.severity,
             description: f.description,
-            critical: f.critical || false
-          }))
+            critical: f.critical || false,
+            location_description: f.location_description || null
+          })),
+          study_id: studyId || null
         })
       });
 
@@ -567,6 +570,40 @@ function Toast({ message, show }) {
 }
 
 // ==================== MAIN APP ====================
+// Progressive analysis over WebSocket: findings arrive before the heatmaps and reports.
+// Rejects with `fallback` set when the socket never opened, so callers can retry over POST.
+function analyzeStreaming(file, patientId, onEvent) {
+  return new Promise((resolve, reject) => {
+    const params = new URLSearchParams({ filename: file.name });
+    if (patientId) params.set('patient_id', patientId);
+    const ws = new WebSocket(`ws://localhost:8000/ws/predict?${params}`);
+    let opened = false;
+    let settled = false;
+    ws.onopen = () => { opened = true; ws.send(file); };
+    ws.onmessage = msg => {
+      const event = JSON.parse(msg.data);
+      if (event.event === 'complete') {
+        settled = true;
+        resolve(event.result);
+      } else if (event.event === 'error') {
+        settled = true;
+        reject(new Error(event.detail));
+      } else {
+        onEvent(event);
+      }
+    };
+    ws.onerror = () => {
+      if (!opened) {
+        settled = true;
+        reject(Object.assign(new Error("WebSocket unavailable"), { fallback: true }));
+      }
+    };
+    ws.onclose = () => {
+      if (!settled) reject(new Error("Connection closed before the analysis finished."));
+    };
+  });
+}
+
 export default function App() {
   const [currentUser, setCurrentUser] = useState(null);
   const [isLoadingSession, setIsLoadingSession] = useState(true);
@@ -639,27 +676,49 @@ export default function App() {
     if (!selectedFile) return showToast("Please select an image first.");
     setShowProgress(true);
     setProgress(20);
-    const formData = new FormData();
-    formData.append('file', selectedFile);
-    
+    setHeatmapURL(null);
+
+    const showResult = result => {
+      setShowProgress(false);
+      setProgress(100);
+      setHeatmapURL(result.combined_heatmap ? 'data:image/png;base64,' + result.combined_heatmap : null);
+      setResults({
+        confidenceValue: Math.round(result.confidence_metrics.overall_confidence * 100) + '%',
+        findings: result.findings || [],
+        studyId: result.metadata?.study_id
+      });
+      showToast("Analysis complete.");
+    };
+
     try {
+      try {
+        // Findings show as soon as the ensemble has run; heatmaps fill in as they are rendered
+        const result = await analyzeStreaming(selectedFile, currentUser?.patient_id, event => {
+          if (event.event === 'findings') {
+            setProgress(50);
+            setResults({ confidenceValue: '…', findings: event.findings || [], studyId: null });
+          } else if (event.event === 'gradcam' && event.heatmap) {
+            setProgress(p => Math.min(p + 10, 90));
+            setHeatmapURL(prev => prev || 'data:image/png;base64,' + event.heatmap);
+          }
+        });
+        showResult(result);
+        return;
+      } catch (e) {
+        if (!e.fallback) throw e;
+      }
+
+      const formData = new FormData();
+      formData.append('file', selectedFile);
       const apiURL = 'http://localhost:8000/predict';
       const resp = await fetch(apiURL, {
         method: 'POST',
+        headers: currentUser ? { 'X-Patient-ID': currentUser.patient_id } : {},
         body: formData,
       });
       setProgress(70);
       if (!resp.ok) throw new Error("Analysis failed.");
-      const result = await resp.json();
-      setShowProgress(false);
-      setProgress(100);
-      setHeatmapURL(result.combined_heatmap ? 'data:image/png;base64,' + result.combined_heatmap : null);
-
-      setResults({
-        confidenceValue: Math.round(result.confidence_metrics.overall_confidence * 100) + '%',
-        findings: result.findings || []
-      });
-      showToast("Analysis complete.");
+      showResult(await resp.json());
     } catch (e) {
       setShowProgress(false);
       showToast("AI backend request failed.");
@@ -728,6 +787,7 @@ export default function App() {
         <MedicalReport 
           user={currentUser}
           findings={results.findings}
+          studyId={results.studyId}
           onClose={() => setShowReport(false)}
         />
       )}